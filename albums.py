@@ -0,0 +1,74 @@
+"""
+Grouping of Telegram album parts into one unit of work
+"""
+import asyncio
+from typing import AsyncIterable, AsyncIterator, Dict, Hashable, List, Optional, Tuple
+
+def caption_part(parts: List):
+    """The part carrying the album's caption (Telegram puts it on one part), else the first"""
+    return next((message for message in parts if message.text), parts[0])
+
+class AlbumCollector:
+    """
+    Buffer the parts of live albums until the album is complete
+
+    Telegram delivers an album as separate messages sharing a grouped_id,
+    usually within a fraction of a second. The first part's caller waits
+    until no further part has arrived for `window` seconds and then gets
+    every part; the callers of the later parts get None, as their message
+    is handled with the album.
+    """
+
+    def __init__(self, window: float):
+        """
+        Args:
+            window: Seconds without a new part after which an album is complete
+        """
+        self.window = window
+        self.pending: Dict[Tuple[Hashable, int], List] = {}
+
+    async def collect(self, message) -> Optional[List]:
+        """
+        Add a new message
+
+        Returns:
+            The messages to process as one unit (the message itself if it is
+            not part of an album), or None if it joined an album being collected
+        """
+        grouped_id = getattr(message, 'grouped_id', None)
+        if grouped_id is None:
+            return [message]
+
+        key = (message.chat_id, grouped_id)
+        if key in self.pending:
+            self.pending[key].append(message)
+            return None
+
+        parts = self.pending[key] = [message]
+        count = 0
+        while count != len(parts):
+            count = len(parts)
+            await asyncio.sleep(self.window)
+        del self.pending[key]
+        return sorted(parts, key=lambda part: part.id)
+
+async def group_albums(messages: AsyncIterable) -> AsyncIterator[List]:
+    """
+    Group an oldest-first message stream into units
+
+    History returns an album's parts next to each other, so consecutive
+    messages with the same grouped_id form one unit; every other message
+    is a unit of its own.
+    """
+    parts: List = []
+    async for message in messages:
+        grouped_id = getattr(message, 'grouped_id', None)
+        if parts and (grouped_id is None or grouped_id != parts[0].grouped_id):
+            yield parts
+            parts = []
+        parts.append(message)
+        if grouped_id is None:
+            yield parts
+            parts = []
+    if parts:
+        yield parts
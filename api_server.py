@@ -7,7 +7,7 @@ from pydantic import BaseModel
 from typing import List, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from supabase_database import init_supabase_db, get_supabase_db, Channel, Signal, supabase_client
+from supabase_database import init_supabase_db, get_supabase_db, mark_channel_changed, Channel, Signal, supabase_client
 from datetime import datetime
 import asyncio
 import logging
@@ -214,8 +214,9 @@ async def start_channel(channel_id: int, db: Session = Depends(get_supabase_db))
         if channel.is_active:
             raise HTTPException(status_code=400, detail="Channel is already running")
         
-        # Update channel status
+        # Update channel status; the channel worker starts its monitor
         channel.is_active = True
+        mark_channel_changed(db, channel)
         db.commit()
         
         logger.info(f"✅ Started monitoring: {channel.name}")
@@ -236,8 +237,9 @@ async def stop_channel(channel_id: int, db: Session = Depends(get_supabase_db)):
         if not channel:
             raise HTTPException(status_code=404, detail="Channel not found")
         
-        # Update channel status
+        # Update channel status; the channel worker stops its monitor
         channel.is_active = False
+        mark_channel_changed(db, channel)
         db.commit()
         
         logger.info(f"⏹️ Stopped monitoring: {channel.name}")
@@ -260,7 +262,8 @@ async def delete_channel(channel_id: int, db: Session = Depends(get_supabase_db)
         
         channel_name = channel.name
         
-        # Delete from database
+        # Delete from database (stopping its monitor if it was running)
+        mark_channel_changed(db, channel)
         db.delete(channel)
         db.commit()
         
@@ -0,0 +1,167 @@
+"""
+Streaming backfill of channel history with concurrent analysis and ordered commit
+"""
+import asyncio
+import inspect
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+async def _batches(messages: AsyncIterable, size: int) -> AsyncIterator[List]:
+    """Group an async stream of messages into lists of up to size"""
+    batch = []
+    async for message in messages:
+        batch.append(message)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _unit_id(unit) -> int:
+    """Id of a message, or of the newest part of an album given as a list"""
+    return unit[-1].id if isinstance(unit, list) else unit.id
+
+async def iterate(messages) -> AsyncIterator:
+    """Turn an already fetched list into the async stream run() expects"""
+    for message in messages:
+        yield message
+
+class StreamingBackfill:
+    """
+    Process a stream of historical messages, oldest first
+
+    Messages are pulled from the stream (e.g. client.iter_messages with
+    reverse=True) batch by batch. Up to `concurrency` messages are analyzed
+    at once (downloads, OCR, vision), but results are committed strictly in
+    message order, so checkpoints and stored signals advance in sequence.
+    A stream item may also be the list of an album's parts (see
+    albums.group_albums), which is then analyzed and committed as one.
+    Only one batch and a window of 2 x concurrency messages are held at a
+    time, so memory does not grow with the length of the history.
+    """
+
+    def __init__(self, concurrency: int = 8, batch_size: int = 100, progress_every: int = 100, on_progress: Optional[Callable[[Dict], None]] = None, failed_result: Any = None):
+        """
+        Args:
+            concurrency: Messages analyzed at the same time
+            batch_size: Messages pulled from the stream (and bulk-parsed) at once
+            progress_every: Call on_progress after this many commits
+            on_progress: Called with progress() while running and once at the end
+            failed_result: Committed in place of the result when analysis raised,
+                so commit can tell a failure from "no signal"
+        """
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.progress_every = progress_every
+        self.on_progress = on_progress
+        self.failed_result = failed_result
+
+        self.processed = 0
+        self.signals = 0
+        self.failed = 0
+        self.first_id = 0
+        self.last_id = 0
+        self.current_id = 0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    async def run(
+        self,
+        messages: AsyncIterable,
+        analyze: Callable[[Any, Any], Awaitable[Optional[Dict]]],
+        commit: Callable[[Any, Optional[Dict]], Any],
+        parse_batch: Optional[Callable[[List], List]] = None,
+        first_id: int = 0,
+        last_id: int = 0,
+    ):
+        """
+        Backfill a message stream
+
+        Args:
+            messages: Async iterable of messages, oldest first
+            analyze: Coroutine function (message, prepared) -> signal or None
+            commit: Function (message, signal) called in message order; may be a coroutine function
+            parse_batch: Optional bulk step run on each batch, returning one
+                prepared value per message (e.g. TradingSignalParser.parse_many)
+            first_id: Message id the backfill starts after, for progress
+            last_id: Newest message id expected, for progress and ETA
+        """
+        self.first_id = first_id
+        self.last_id = last_id
+        self.current_id = first_id
+        self.started = time.monotonic()
+        self.finished = None
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        window: Deque[Tuple[Any, asyncio.Task]] = deque()
+
+        async def limited(message, prepared):
+            async with semaphore:
+                return await analyze(message, prepared)
+
+        try:
+            async for batch in _batches(messages, self.batch_size):
+                prepared_batch = parse_batch(batch) if parse_batch else [None] * len(batch)
+                for message, prepared in zip(batch, prepared_batch):
+                    while len(window) >= 2 * self.concurrency:
+                        await self._commit_next(window, commit)
+                    window.append((message, asyncio.create_task(limited(message, prepared))))
+            while window:
+                await self._commit_next(window, commit)
+        finally:
+            for _, task in window:
+                task.cancel()
+            self.finished = time.monotonic()
+
+        if self.on_progress:
+            self.on_progress(self.progress())
+
+    async def _commit_next(self, window: Deque[Tuple[Any, asyncio.Task]], commit):
+        """Wait for the oldest message's analysis and commit it"""
+        message, task = window.popleft()
+        try:
+            signal = await task
+        except Exception as e:
+            logger.error(f"Backfill analysis failed for message {_unit_id(message)}: {str(e)}")
+            self.failed += 1
+            result = commit(message, self.failed_result)
+        else:
+            result = commit(message, signal)
+            self.signals += int(bool(signal))
+        if inspect.isawaitable(result):
+            await result
+
+        self.processed += 1
+        self.current_id = _unit_id(message)
+        if self.on_progress and self.processed % self.progress_every == 0:
+            self.on_progress(self.progress())
+
+    def progress(self) -> Dict:
+        """
+        Get how far the backfill is
+
+        Percent and ETA are estimated from message ids, which grow roughly
+        one per message, so they are available before the stream is counted.
+        """
+        now = self.finished or time.monotonic()
+        elapsed = now - self.started if self.started else 0.0
+        span = self.last_id - self.first_id
+        fraction = min(1.0, (self.current_id - self.first_id) / span) if span > 0 else None
+        eta = None
+        if fraction and not self.finished:
+            eta = elapsed * (1 - fraction) / fraction
+        return {
+            'processed': self.processed,
+            'signals': self.signals,
+            'failed': self.failed,
+            'current_id': self.current_id,
+            'percent': round(fraction * 100, 1) if fraction is not None else None,
+            'rate': self.processed / elapsed if elapsed else 0.0,
+            'elapsed_seconds': elapsed,
+            'eta_seconds': eta,
+            'done': self.finished is not None,
+        }
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for TradingSignalParser.parse_message and parse_many
+
+Runs the previous multi-search implementation and the current parser over
+the same corpus of channel-style messages, checks that both return the same
+results and prints messages per second for each. Also compares the old
+instrument regex against the symbol index, and per-message parsing
+against parse_many on a chatter-heavy backfill.
+"""
+
+import re
+import timeit
+from text_parser import TradingSignalParser
+
+# A mix of what our channels actually post: mostly chatter, some signals
+CORPUS = [
+    "Good morning traders! Markets open in 30 minutes, stay tuned 🚀",
+    "XAUUSD BUY NOW @ 2315.50\nSL: 2305\nTP1: 2325\nTP2: 2335\nTP3: 2350",
+    "EURUSD SELL\nEntry: 1.0845\nSL: 1.0880\nTP: 1.0800\nTP: 1.0760",
+    "Another 120 pips banked today, congratulations to everyone who followed 💰💰",
+    "GBPJPY LONG\nENTER 191.20\nSTOP LOSS 190.40\nTAKE PROFIT 192.80",
+    "Reminder: VIP membership renewals close on Friday. DM @admin for details.",
+    "BTCUSDT SHORT\nSell at 67250\nStoploss 68400\nTarget 65000\nTarget 63800",
+    "Wait for the pullback before entering, patience pays.",
+    "TP1 hit on GOLD ✅ move SL to breakeven",
+    "Weekly outlook: dollar strength expected after NFP, be careful with majors.",
+    "US30 BUY LIMIT 38950 SL 38700 TP 39300 TP 39600",
+    "Closed EURJPY +45 pips. Next setup coming soon.",
+    "NASDAQ looking heavy into resistance, no trades for now",
+    "GBPUSD BUY\nPrice: 1.2710\nSL: 1.2670\nTP: 1.2760",
+    "Market is very volatile today because of CPI news. Trade small size.",
+    "Who is ready for London session? 🔥🔥🔥",
+    "ETHUSDT LONG entry 3120 sl 3040 tp 3250 tp 3380 tp 3500",
+    "USDJPY SELL NOW 151.80\nSL 152.40\nTP 151.00",
+    "Join our free channel for daily analysis and educational content.",
+    "Results this week:\nEURUSD +80\nXAUUSD +210\nGBPJPY -40\nTotal +250 pips",
+    "BUY GOLD NOW 2318\nSL 2310\nTP 2330",
+    "🚨 SELL LIMIT EUR/USD @ 1.0890 SL 1.0920 TP 1.0850",
+    "New signal: SELL #BTCUSDT entry 66800 SL 67900 TP 64000",
+]
+
+ITERATIONS = 5000
+BACKFILL_REPEAT = 2000
+# Rates are the best of this many runs, so a busy host skews them less
+REPEAT = 5
+
+
+class LegacyTradingSignalParser:
+    """The parse_message implementation before the single-pass extractor"""
+
+    def __init__(self):
+        self.patterns = {
+            'action': r'\b(BUY|SELL|LONG|SHORT)\b',
+            'instrument': r'\b([A-Z]{3,6}(?:USD|USDT|BTC|ETH)?)\b',
+            'entry': r'(?:ENTRY|ENTER|BUY AT|SELL AT)[:\s]+([0-9]+\.?[0-9]*)',
+            'stop_loss': r'(?:SL|STOP LOSS|STOPLOSS)[:\s]+([0-9]+\.?[0-9]*)',
+            'take_profit': r'(?:TP|TAKE PROFIT|TARGET)[:\s]*([0-9]+\.?[0-9]*)',
+            'price': r'(?:PRICE|@)[:\s]+([0-9]+\.?[0-9]*)',
+        }
+
+    def parse_message(self, text):
+        if not text:
+            return None
+        text_upper = text.upper()
+        action_match = re.search(self.patterns['action'], text_upper)
+        if not action_match:
+            return None
+        action = action_match.group(1)
+        if action == 'LONG':
+            action = 'BUY'
+        elif action == 'SHORT':
+            action = 'SELL'
+        instrument_match = re.search(self.patterns['instrument'], text_upper)
+        instrument = instrument_match.group(1) if instrument_match else None
+        entry_match = re.search(self.patterns['entry'], text_upper)
+        if not entry_match:
+            entry_match = re.search(self.patterns['price'], text_upper)
+        entry_price = float(entry_match.group(1)) if entry_match else None
+        sl_match = re.search(self.patterns['stop_loss'], text_upper)
+        stop_loss = float(sl_match.group(1)) if sl_match else None
+        tp_matches = re.findall(self.patterns['take_profit'], text_upper)
+        take_profits = [float(tp) for tp in tp_matches] if tp_matches else []
+        return {
+            'action': action,
+            'instrument': instrument,
+            'entry_price': entry_price,
+            'stop_loss': stop_loss,
+            'take_profits': take_profits,
+            'raw_text': text,
+            'signal_type': 'text'
+        }
+
+
+def measure(parse, corpus, iterations, repeat=REPEAT):
+    """Return messages per second for parse over the corpus, best of `repeat` runs"""
+    def run():
+        for text in corpus:
+            parse(text)
+    elapsed = min(timeit.repeat(run, number=iterations, repeat=repeat))
+    return (iterations * len(corpus)) / elapsed
+
+
+def main():
+    legacy = LegacyTradingSignalParser()
+    parser = TradingSignalParser()
+
+    # Both implementations must agree before their speed means anything.
+    # Instruments are resolved from the symbol index now rather than taken
+    # from the first uppercase word, so they are compared separately below.
+    for text in CORPUS:
+        expected = legacy.parse_message(text)
+        actual = parser.parse_message(text)
+        if expected and actual:
+            expected = dict(expected, instrument=None)
+            actual = dict(actual, instrument=None)
+        if expected != actual:
+            raise SystemExit(f"Parser mismatch for {text!r}:\n  {expected}\n  {actual}")
+
+    print("\n" + "="*60)
+    print("TRADING SIGNAL PARSER BENCHMARK")
+    print("="*60)
+    print(f"Corpus: {len(CORPUS)} messages x {ITERATIONS} iterations\n")
+
+    before = measure(legacy.parse_message, CORPUS, ITERATIONS)
+    after = measure(parser.parse_message, CORPUS, ITERATIONS)
+
+    print(f"Before: {before:>12,.0f} msg/s")
+    print(f"After:  {after:>12,.0f} msg/s")
+    print(f"Speedup: {after / before:.2f}x")
+
+    # Instrument lookup on signal messages: first-word regex vs symbol index
+    signals = [text.upper() for text in CORPUS if parser.parse_message(text)]
+    instrument_re = re.compile(legacy.patterns['instrument'])
+    regex_rate = measure(instrument_re.search, signals, ITERATIONS)
+    index_rate = measure(parser.symbol_index.resolve, signals, ITERATIONS)
+
+    print(f"\nInstrument lookup: {len(signals)} signal messages")
+    print(f"Regex:        {regex_rate:>12,.0f} msg/s")
+    print(f"Symbol index: {index_rate:>12,.0f} msg/s ({index_rate / regex_rate:.2f}x)")
+    print("  The index is slower: it looks each word up until a known instrument,")
+    print("  where the regex takes the first word of 3-6 letters (BUY, NEW, ...)")
+    for text_upper in signals:
+        legacy_match = instrument_re.search(text_upper)
+        legacy_instrument = legacy_match.group(1) if legacy_match else None
+        print(f"  {str(legacy_instrument):>10} -> {parser.symbol_index.resolve(text_upper)}")
+
+    # Backfills are dominated by chatter; compare per-message and batch parsing
+    backfill = [text for text in CORPUS if parser.parse_message(text) is None] * 9
+    backfill += [text for text in CORPUS if parser.parse_message(text)][:2]
+    backfill *= BACKFILL_REPEAT
+    if parser.parse_many(backfill) != [parser.parse_message(text) for text in backfill]:
+        raise SystemExit("parse_many does not match parse_message")
+
+    single = measure(parser.parse_message, backfill, 1)
+    batch = len(backfill) / min(timeit.repeat(lambda: parser.parse_many(backfill), number=1, repeat=REPEAT))
+
+    print(f"\nBackfill: {len(backfill)} messages")
+    print(f"parse_message: {single:>12,.0f} msg/s")
+    print(f"parse_many:    {batch:>12,.0f} msg/s")
+    print("="*60 + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Detection and catch-up of messages missed while updates were not arriving
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterable, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from telethon import functions, utils
+from telethon.tl.types import InputDialogPeer, InputPeerChannel
+from config import Config
+from rate_limiter import TokenBucket
+from albums import group_albums
+
+logger = logging.getLogger(__name__)
+
+# Messages fetched by catch-ups, across all channels of the process
+_bucket: Optional[TokenBucket] = None
+
+async def _pace():
+    """Wait for the shared catch-up rate to allow one more message"""
+    global _bucket
+    if _bucket is None:
+        _bucket = TokenBucket(Config.CATCHUP_PER_MINUTE)
+    while True:
+        _bucket.refill(time.monotonic(), 1.0)
+        wait = _bucket.wait_time(1, 1.0)
+        if wait <= 0:
+            _bucket.tokens -= 1
+            return
+        await asyncio.sleep(wait)
+
+def sequential_ids(peer) -> bool:
+    """True for channels and supergroups, whose message ids count up per chat"""
+    return isinstance(peer, InputPeerChannel)
+
+async def latest_ids(client, peers: List) -> Dict[int, int]:
+    """
+    Get the newest message id of several chats
+
+    One GetPeerDialogs request covers up to 100 chats, so checking every
+    monitored channel costs a request or two rather than one per channel.
+
+    Returns:
+        Marked peer id -> newest message id
+    """
+    latest = {}
+    for start in range(0, len(peers), 100):
+        result = await client(functions.messages.GetPeerDialogsRequest(
+            peers=[InputDialogPeer(peer) for peer in peers[start:start + 100]]
+        ))
+        for dialog in result.dialogs:
+            latest[utils.get_peer_id(dialog.peer)] = dialog.top_message
+    return latest
+
+class CatchUp:
+    """
+    Track the newest message id seen in a channel and fetch the gaps
+
+    A gap is noticed when a live message's id jumps past the last one seen
+    (channel ids are sequential), or when a GapWatcher probe finds the
+    channel ahead of us, e.g. after a reconnect. Only the missing id range
+    is fetched, oldest first, and each message (or album) goes to `submit`,
+    the channel's normal processing path, at the shared CATCHUP_PER_MINUTE
+    rate. The checkpoint is held below the gap until it is filled.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[int, int], AsyncIterable],
+        submit: Callable[[List], Awaitable[None]],
+        checkpoint=None,
+        detect_jumps: bool = True,
+        remember: int = 10000,
+    ):
+        """
+        Args:
+            fetch: Function (min_id, max_id) -> async iterator of the messages
+                strictly between them, oldest first
+            submit: Coroutine function processing one message or album (list of parts)
+            checkpoint: CheckpointTracker to hold while a gap is fetched
+            detect_jumps: Treat id jumps as gaps (off for basic groups, whose
+                ids are shared with the account's other chats)
+            remember: Recent message ids kept to drop duplicates between live
+                updates and catch-up fetches
+        """
+        self.fetch = fetch
+        self.submit = submit
+        self.checkpoint = checkpoint
+        self.detect_jumps = detect_jumps
+        self.remember = remember
+        self.last_seen = 0
+        self.gaps = 0
+        self.recovered = 0
+        self._recent: "OrderedDict[int, None]" = OrderedDict()
+        self._lock = asyncio.Lock()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _accept(self, message_id: int) -> bool:
+        """Remember an id; False if it was handled already"""
+        if message_id in self._recent:
+            return False
+        self._recent[message_id] = None
+        if len(self._recent) > self.remember:
+            self._recent.popitem(last=False)
+        return True
+
+    def observe(self, message_id: int) -> bool:
+        """
+        Record a live message, starting a catch-up if ids jumped
+
+        Returns:
+            False if the message was already fetched by a catch-up
+        """
+        if not self._accept(message_id):
+            return False
+        if self.detect_jumps and self.last_seen and message_id > self.last_seen + 1:
+            self._start(self.last_seen, message_id)
+        self.last_seen = max(self.last_seen, message_id)
+        return True
+
+    def behind(self, latest_id: int):
+        """Start a catch-up if the channel's newest message is past the last one seen"""
+        if self.last_seen and latest_id > self.last_seen:
+            after = self.last_seen
+            self.last_seen = latest_id
+            self._start(after, latest_id + 1)
+
+    def _start(self, after: int, before: int):
+        """Fetch the ids strictly between after and before in the background"""
+        self.gaps += 1
+        if self.checkpoint is not None:
+            self.checkpoint.hold(after)
+        task = asyncio.create_task(self._fill(after, before))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fill(self, after: int, before: int):
+        """Submit the missed messages of one gap, one catch-up per channel at a time"""
+        try:
+            async with self._lock:
+                count = 0
+                async for parts in group_albums(self.fetch(after, before)):
+                    parts = [message for message in parts if self._accept(message.id)]
+                    if not parts:
+                        continue
+                    await _pace()
+                    await self.submit(parts)
+                    count += len(parts)
+                self.recovered += count
+                if count:
+                    logger.info(f"Caught up {count} missed messages between #{after} and #{before}")
+        except Exception as e:
+            logger.error(f"Catch-up of #{after}-#{before} failed: {str(e)}")
+        finally:
+            if self.checkpoint is not None:
+                self.checkpoint.release(after)
+
+    async def stop(self):
+        """Cancel catch-ups still running"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict:
+        """Get gap counters"""
+        return {
+            'last_seen': self.last_seen,
+            'gaps': self.gaps,
+            'recovered': self.recovered,
+            'running': len(self._tasks),
+        }
+
+class GapWatcher:
+    """
+    Probe watched channels for messages that never arrived as updates
+
+    Telethon reconnects on its own after a network blip, and updates from
+    the outage may be lost. It keeps is_connected() true while doing so and
+    offers no public reconnect hook, so the watcher does not try to detect
+    reconnects: every `interval` seconds the newest message id of every
+    watched channel is fetched (one request per 100 channels) and channels
+    that are ahead get a catch-up.
+    """
+
+    def __init__(self, interval: float = 60.0):
+        """
+        Args:
+            interval: Seconds between probes
+        """
+        self.interval = interval
+        # Marked peer id -> (client, peer, CatchUp)
+        self.channels: Dict[int, Tuple[Any, Any, CatchUp]] = {}
+        self.probes = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def watch(self, client, peer, catch_up: CatchUp):
+        """Start watching a channel (must be called from the running event loop)"""
+        self.channels[utils.get_peer_id(peer)] = (client, peer, catch_up)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def unwatch(self, peer):
+        """Stop watching a channel"""
+        self.channels.pop(utils.get_peer_id(peer), None)
+
+    async def probe(self):
+        """Compare every watched channel's newest id with the last one seen"""
+        by_client: Dict[int, Tuple[Any, List]] = {}
+        for client, peer, _ in self.channels.values():
+            by_client.setdefault(id(client), (client, []))[1].append(peer)
+        for client, peers in by_client.values():
+            if not client.is_connected():
+                continue
+            for peer_id, latest_id in (await latest_ids(client, peers)).items():
+                entry = self.channels.get(peer_id)
+                if entry is not None:
+                    entry[2].behind(latest_id)
+        self.probes += 1
+
+    async def _run(self):
+        """Probe on a timer"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.probe()
+            except Exception as e:
+                logger.warning(f"Gap probe failed: {str(e)}")
+
+    async def stop(self):
+        """Stop probing"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
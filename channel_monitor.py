@@ -2,14 +2,23 @@
 Background worker for monitoring Telegram channels
 """
 import asyncio
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
-from telethon import TelegramClient, events
+from telethon import TelegramClient, events, errors, utils
 from config import Config
 from text_parser import TradingSignalParser
-from image_analyzer import ImageAnalyzer
-from supabase_client import SupabaseClient
-from database import SessionLocal, TelegramChannel, TradingSignal
+from image_analyzer import ImageAnalyzer, shutdown_executors
+from supabase_writer import get_supabase_writer
+from signal_cache import signal_cache
+from media_policy import download_image
+from telegram_hub import TelegramHub
+from entity_cache import entity_cache, normalize_username
+from message_pipeline import MessagePipeline
+from checkpoints import AnalysisRetries, CheckpointTracker, SeenMessages, channel_id_for, load_checkpoint
+from backfill import StreamingBackfill, iterate
+from albums import AlbumCollector, caption_part, group_albums
+from catch_up import CatchUp, GapWatcher, sequential_ids
+from database import SessionLocal, TelegramChannel
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -18,13 +27,42 @@ logger = logging.getLogger(__name__)
 class ChannelMonitor:
     """Monitors a single Telegram channel for trading signals"""
     
-    def __init__(self, channel_id: int, channel_username: str, channel_name: str):
+    def __init__(self, channel_id: int, channel_username: str, channel_name: str, hub: Optional[TelegramHub] = None, pipeline: Optional[MessagePipeline] = None, gap_watcher: Optional[GapWatcher] = None):
+        """
+        Args:
+            channel_id: Channel row id (as used by the API)
+            channel_username: Channel username or t.me link
+            channel_name: Display name
+            hub: Shared connection to subscribe through; None opens a client of our own
+            pipeline: Work queue new messages are handed to; None processes them inline
+            gap_watcher: Probes the channel for messages missed during outages
+        """
         self.channel_id = channel_id
         self.channel_username = channel_username
         self.channel_name = channel_name
+        # telegram_channels row holding status and counters; the checkpoint
+        # is kept in the shared channels row (channel_id)
+        self.local_id: Optional[int] = None
         self.is_running = False
         self.client = None
         self.group_entity = None
+        self.group_title = channel_name
+        # Telegram's marked id of the channel, the key signals are stored under
+        self.peer_id: Optional[int] = None
+        self.hub = hub
+        self.pipeline = pipeline
+        self.checkpoint: Optional[CheckpointTracker] = None
+        self.retries: Optional[AnalysisRetries] = None
+        # Newest message id covered by the startup catch-up; live events up
+        # to it are already being processed there
+        self._backfill_until = 0
+        self.backfill: Optional[StreamingBackfill] = None
+        self.catch_up: Optional[CatchUp] = None
+        self.gap_watcher = gap_watcher
+        # Messages processed already, so re-reads skip analysis
+        self.seen = SeenMessages()
+        self._stopped = asyncio.Event()
+        self.albums = AlbumCollector(Config.ALBUM_WINDOW_MS / 1000)
         
         # Initialize parsers
         self.text_parser = TradingSignalParser()
@@ -34,55 +72,82 @@ class ChannelMonitor:
             azure_deployment=Config.AZURE_OPENAI_DEPLOYMENT
         )
         
-        # Initialize Supabase
-        self.supabase_client = SupabaseClient(
-            url=Config.SUPABASE_URL,
-            key=Config.SUPABASE_KEY,
-            table_name=Config.SUPABASE_TABLE
-        )
+        # Local signal outbox synced to Supabase, shared by all channel monitors
+        self.supabase_writer = get_supabase_writer()
     
     async def start(self):
         """Start monitoring the channel"""
         try:
             self.is_running = True
-            
-            # Create Telegram client with unique session name
-            session_name = f"session_{self.channel_id}_{self.channel_username.replace('@', '')}"
-            self.client = TelegramClient(
-                session_name,
-                Config.TELEGRAM_API_ID,
-                Config.TELEGRAM_API_HASH
+            self.local_id = channel_id_for(self.channel_username, self.channel_name)
+            self.checkpoint = CheckpointTracker(self.channel_id, shared=True, save_interval=Config.CHECKPOINT_SAVE_SECONDS)
+            if self.local_id is not None:
+                # Checkpoints used to be kept in the local telegram_channels row
+                self.checkpoint.seed(load_checkpoint(self.local_id))
+            self.retries = AnalysisRetries(
+                self.checkpoint,
+                self.process_message,
+                attempts=Config.ANALYSIS_RETRY_ATTEMPTS,
+                delay=Config.ANALYSIS_RETRY_SECONDS
+            )
+            self.catch_up = CatchUp(
+                fetch=lambda after, before: self.client.iter_messages(self.group_entity, min_id=after, max_id=before, reverse=True),
+                submit=self._submit_catch_up,
+                checkpoint=self.checkpoint
             )
             
-            await self.client.start(phone=Config.TELEGRAM_PHONE)
-            logger.info(f"✓ Connected to Telegram for channel: {self.channel_name}")
+            username = normalize_username(self.channel_username)
             
-            # Get the group entity
-            username = self.channel_username
-            if username.startswith('@'):
-                username = username[1:]
-            elif 'https://t.me/' in username:
-                username = username.split('/')[-1]
+            if self.hub is not None:
+                # Route this channel's messages from the shared connection
+                resolved = await self.hub.subscribe(username, self.enqueue_message)
+                self.client = self.hub.client
+            else:
+                # Create Telegram client with unique session name
+                session_name = f"session_{self.channel_id}_{self.channel_username.replace('@', '')}"
+                self.client = TelegramClient(
+                    session_name,
+                    Config.TELEGRAM_API_ID,
+                    Config.TELEGRAM_API_HASH
+                )
+                
+                await self.client.start(phone=Config.TELEGRAM_PHONE)
+                logger.info(f"✓ Connected to Telegram for channel: {self.channel_name}")
+                
+                # Get the group peer, from the entity cache when possible
+                resolved = await entity_cache.resolve(self.client, username)
+                
+                # Register event handler
+                @self.client.on(events.NewMessage(chats=resolved.peer))
+                async def handler(event):
+                    await self.enqueue_message(event)
             
-            self.group_entity = await self.client.get_entity(username)
-            logger.info(f"✓ Connected to group: {self.group_entity.title}")
+            self.group_entity, self.group_title = resolved
+            self.peer_id = utils.get_peer_id(self.group_entity)
+            self.seen.load(self.peer_id)
+            self.catch_up.detect_jumps = sequential_ids(self.group_entity)
+            logger.info(f"✓ Connected to group: {self.group_title}")
             
             # Update database status
             self._update_channel_status("running", None)
             
-            # Register event handler
-            @self.client.on(events.NewMessage(chats=self.group_entity))
-            async def handler(event):
-                await self.process_message(event)
-            
-            # Process recent messages (optional)
+            # Process what was posted while we were not running
             await self.process_recent_messages(limit=10)
             
+            if self.gap_watcher is not None:
+                self.gap_watcher.watch(self.client, self.group_entity, self.catch_up)
+            
             # Keep running
             logger.info(f"✓ Now monitoring {self.channel_name} for new signals...")
-            await self.client.run_until_disconnected()
+            if self.hub is not None:
+                await self._stopped.wait()
+            else:
+                await self.client.run_until_disconnected()
             
         except Exception as e:
+            if isinstance(e, (errors.ChannelInvalidError, errors.ChannelPrivateError, errors.PeerIdInvalidError)):
+                # The cached peer may be outdated; resolve it again next start
+                entity_cache.invalidate(self.channel_username)
             logger.error(f"✗ Error in channel monitor for {self.channel_name}: {str(e)}")
             self._update_channel_status("error", str(e))
             self.is_running = False
@@ -90,98 +155,236 @@ class ChannelMonitor:
     async def stop(self):
         """Stop monitoring the channel"""
         self.is_running = False
-        if self.client:
+        if self.gap_watcher is not None and self.group_entity is not None:
+            self.gap_watcher.unwatch(self.group_entity)
+        if self.catch_up is not None:
+            await self.catch_up.stop()
+        if self.retries is not None:
+            await self.retries.stop()
+        if self.hub is not None:
+            # Leave the shared connection up for the other channels
+            if self.group_entity is not None:
+                self.hub.unsubscribe(self.group_entity)
+            self._stopped.set()
+        elif self.client:
             await self.client.disconnect()
+        if self.checkpoint is not None:
+            # Leave the next owner of the channel the latest checkpoint
+            self.checkpoint.flush(force=True)
         self._update_channel_status("stopped", None)
         logger.info(f"✓ Stopped monitoring {self.channel_name}")
     
-    async def process_message(self, event):
-        """Process a new message"""
+    async def enqueue_message(self, event):
+        """Hand a new message (or a complete album) to the pipeline, or process it inline without one"""
+        if event.message.id <= self._backfill_until:
+            return
+        if not self.catch_up.observe(event.message.id):
+            # Already fetched by a catch-up
+            return
+        self.checkpoint.begin(event.message.id)
+        parts = await self.albums.collect(event.message)
+        if parts is None:
+            # Part of an album whose first part's handler submits it
+            return
+        if self.pipeline is not None:
+            await self.pipeline.submit(self.channel_id, self._process_and_checkpoint, parts)
+        else:
+            await self._process_and_checkpoint(parts)
+    
+    async def _submit_catch_up(self, parts):
+        """
+        Hand a message missed during an outage to the normal processing path
+        
+        Catch-up work is queued under its own key, so the pipeline's
+        round-robin keeps serving live messages in between.
+        """
+        for message in parts:
+            self.checkpoint.begin(message.id)
+        if self.pipeline is not None:
+            await self.pipeline.submit((self.channel_id, 'catch-up'), self._process_and_checkpoint, parts)
+        else:
+            await self._process_and_checkpoint(parts)
+    
+    async def _process_and_checkpoint(self, parts):
+        """Process a message or album, then let the checkpoint advance past it"""
         try:
-            message = event.message
-            signal = None
-            
-            # Check for media (images)
-            if message.media:
-                logger.info(f"[{self.channel_name}] Analyzing image message...")
-                media_bytes = await self.client.download_media(message.media, file=bytes)
-                if media_bytes:
-                    signal = self.image_analyzer.analyze_image(media_bytes)
-            
-            # Check for text
-            if not signal and message.text:
-                signal = self.text_parser.parse_message(message.text)
-            
-            # Save valid signals
-            if signal and self.text_parser.validate_signal(signal):
-                signal['message_id'] = message.id
-                signal['message_date'] = message.date.isoformat()
-                signal['channel_id'] = self.channel_id
-                signal['channel_name'] = self.channel_name
-                
-                self._save_signal(signal)
-                logger.info(f"✓ [{self.channel_name}] Found signal: {signal['action']} {signal['instrument']}")
+            await self.process_message(parts)
+        finally:
+            for message in parts:
+                self.checkpoint.done(message.id)
+    
+    async def process_message(self, parts):
+        """Process a new message, or all parts of an album as one"""
+        if self.seen.known(parts):
+            return
+        try:
+            signal, complete = await self.extract_signal(parts)
+            self.store_signal(caption_part(parts), signal)
+            if complete:
+                self.seen.add(parts)
+            else:
+                self.retry_later(parts)
         
         except Exception as e:
             logger.error(f"✗ Error processing message from {self.channel_name}: {str(e)}")
     
+    async def extract_signal(self, parts) -> Tuple[Optional[dict], bool]:
+        """
+        Extract a signal from the media and text of a message or album
+        
+        Returns:
+            (signal or None, complete) where complete is False if no signal
+            was found because an image stage failed
+        """
+        signal = None
+        complete = True
+        message = caption_part(parts)
+        media = [part.media for part in parts if part.media]
+        
+        # Check for media (images): caption, then OCR, then vision
+        if len(media) > 1:
+            logger.info(f"[{self.channel_name}] Analyzing album of {len(media)} parts...")
+            signal, complete = await self.image_analyzer.analyze_album_async(
+                caption=message.text,
+                fetch_images=lambda: asyncio.gather(*(download_image(self.client, item) for item in media)),
+                album_key=signal_cache.album_key(media)
+            )
+        elif media:
+            logger.info(f"[{self.channel_name}] Analyzing media message...")
+            signal, complete = await self.image_analyzer.analyze_media_async(
+                caption=message.text,
+                fetch_image=lambda: download_image(self.client, media[0]),
+                media_key=signal_cache.media_key(media[0])
+            )
+        
+        # Check for text
+        if not signal and message.text:
+            text_key = signal_cache.text_key(message.text)
+            hit, signal = signal_cache.get(text_key)
+            if not hit:
+                signal = self.text_parser.parse_message(message.text)
+                signal_cache.put(text_key, signal)
+            elif signal:
+                signal['raw_text'] = message.text
+        
+        return signal, complete or signal is not None
+    
+    def retry_later(self, parts):
+        """
+        Analyze a message whose analysis failed again after a backoff
+        
+        The message is not marked as seen and the checkpoint is held below
+        it until the retry, so a restart in the meantime (on this or
+        another worker) fetches and analyzes it again.
+        """
+        if self.retries.schedule(parts):
+            logger.warning(f"[{self.channel_name}] Analysis of message #{parts[0].id} failed, retrying it later")
+        else:
+            logger.error(f"[{self.channel_name}] Analysis of message #{parts[0].id} failed "
+                         f"{self.retries.attempts + 1} times, giving up on it")
+    
+    def store_signal(self, message, signal: Optional[dict]):
+        """Save a signal extracted from message if it is valid"""
+        if signal and self.text_parser.validate_signal(signal):
+            signal['message_id'] = message.id
+            signal['message_date'] = message.date.isoformat()
+            signal['channel_id'] = self.peer_id
+            signal['channel_name'] = self.channel_name
+            
+            self._save_signal(signal)
+            logger.info(f"✓ [{self.channel_name}] Found signal: {signal['action']} {signal['instrument']}")
+    
     async def process_recent_messages(self, limit=10):
-        """Process recent messages on startup"""
+        """
+        Process the messages posted since the channel's checkpoint on startup
+        
+        Only the gap after the last processed message is fetched (min_id),
+        streamed oldest first; messages (albums as one) are analyzed
+        BACKFILL_CONCURRENCY at a time and stored in message order. A
+        channel without a checkpoint starts from its last `limit` messages.
+        """
+        # Hold the checkpoint until the whole gap is processed, so live
+        # messages finishing first cannot move it past unprocessed ones
+        self.checkpoint.paused = True
         try:
-            messages = await self.client.get_messages(self.group_entity, limit=limit)
-            logger.info(f"Processing {len(messages)} recent messages from {self.channel_name}")
+            latest = await self.client.get_messages(self.group_entity, limit=1)
+            self._backfill_until = latest[0].id if latest else 0
+            # Gaps after this point are caught up as they are noticed
+            self.catch_up.last_seen = max(self.catch_up.last_seen, self._backfill_until)
             
-            for message in reversed(messages):
-                event_like = type('obj', (object,), {'message': message})()
-                await self.process_message(event_like)
+            if not latest:
+                messages = iterate([])
+                first_id = 0
+            elif self.checkpoint.saved is None:
+                recent = await self.client.get_messages(self.group_entity, limit=limit)
+                messages = iterate(reversed(recent))
+                first_id = recent[-1].id - 1 if recent else 0
+            else:
+                messages = self.client.iter_messages(
+                    self.group_entity, min_id=self.checkpoint.saved, max_id=self._backfill_until + 1, reverse=True
+                )
+                first_id = self.checkpoint.saved
+            
+            async def analyze(parts, _):
+                for message in parts:
+                    self.checkpoint.begin(message.id)
+                if self.seen.known(parts):
+                    return None
+                return await self.extract_signal(parts)
+            
+            def commit(parts, result):
+                signal, complete = result or (None, True)
+                self.store_signal(caption_part(parts), signal)
+                if complete:
+                    self.seen.add(parts)
+                else:
+                    self.retry_later(parts)
+                for message in parts:
+                    self.checkpoint.done(message.id)
+            
+            def report(progress):
+                logger.info(f"[{self.channel_name}] Backfill: {progress['processed']} messages, "
+                            f"{progress['percent']}%, ETA {progress['eta_seconds'] or 0:.0f}s")
+            
+            self.backfill = StreamingBackfill(
+                concurrency=Config.BACKFILL_CONCURRENCY,
+                batch_size=Config.BACKFILL_BATCH_SIZE,
+                on_progress=report,
+                failed_result=(None, False)
+            )
+            await self.backfill.run(group_albums(messages), analyze, commit, first_id=first_id, last_id=self._backfill_until)
+            logger.info(f"Processed {self.backfill.processed} messages missed by {self.channel_name}")
         
         except Exception as e:
+            # The checkpoint stays held, so the rest of the gap is fetched
+            # again on the next start instead of being skipped
             logger.error(f"Error processing recent messages: {str(e)}")
+            return
+        
+        self.checkpoint.paused = False
+        self.checkpoint.flush()
     
     def _save_signal(self, signal: dict):
-        """Save signal to local database and Supabase"""
+        """Save signal to the local outbox, from which it is synced to Supabase"""
+        if not self.supabase_writer.save(signal, channel_id=self.peer_id, channel_name=self.channel_name):
+            return
         try:
-            # Save to local database
-            db = SessionLocal()
-            db_signal = TradingSignal(
-                channel_id=self.channel_id,
-                channel_name=self.channel_name,
-                action=signal['action'],
-                instrument=signal['instrument'],
-                entry_price=str(signal.get('entry_price', '')),
-                stop_loss=str(signal.get('stop_loss', '')),
-                take_profits=signal.get('take_profits', []),
-                signal_type=signal.get('signal_type', 'unknown'),
-                raw_text=signal.get('raw_text', ''),
-                message_id=signal.get('message_id'),
-                message_date=datetime.fromisoformat(signal.get('message_date')) if signal.get('message_date') else None
-            )
-            db.add(db_signal)
-            db.commit()
-            
             # Update channel signal count
-            channel = db.query(TelegramChannel).filter(TelegramChannel.id == self.channel_id).first()
+            db = SessionLocal()
+            channel = db.query(TelegramChannel).filter(TelegramChannel.id == self.local_id).first()
             if channel:
                 channel.total_signals += 1
                 channel.last_checked = datetime.utcnow()
                 db.commit()
-            
             db.close()
-            
-            # Save to Supabase
-            try:
-                self.supabase_client.insert_signal(signal)
-            except Exception as e:
-                logger.warning(f"Failed to sync to Supabase: {str(e)}")
-        
         except Exception as e:
-            logger.error(f"Error saving signal: {str(e)}")
+            logger.error(f"Error updating signal count: {str(e)}")
     
     def _update_channel_status(self, status: str, error_message: Optional[str]):
         """Update channel status in database"""
         try:
             db = SessionLocal()
-            channel = db.query(TelegramChannel).filter(TelegramChannel.id == self.channel_id).first()
+            channel = db.query(TelegramChannel).filter(TelegramChannel.id == self.local_id).first()
             if channel:
                 channel.status = status
                 channel.is_active = (status == "running")
@@ -196,9 +399,25 @@ class ChannelMonitor:
 class ChannelManager:
     """Manages multiple channel monitors"""
     
-    def __init__(self):
+    def __init__(self, shared_client: bool = Config.TELEGRAM_SHARED_CLIENT, session_name: str = 'channel_manager_session', interactive: bool = True):
+        """
+        Args:
+            shared_client: Serve every channel from one Telegram connection
+                instead of one client and login per channel
+            session_name: Telethon session of the shared connection; each
+                worker process needs its own
+            interactive: Whether the shared connection may prompt for a login
+        """
         self.monitors: Dict[int, ChannelMonitor] = {}
         self.tasks: Dict[int, asyncio.Task] = {}
+        self.hub = TelegramHub(session_name, interactive) if shared_client else None
+        # Processing of new messages from every channel, shared fairly
+        self.pipeline = MessagePipeline(
+            workers=Config.PIPELINE_WORKERS,
+            max_per_channel=Config.PIPELINE_QUEUE_SIZE
+        )
+        # One probe for missed messages covers all channels on a connection
+        self.gap_watcher = GapWatcher(interval=Config.CATCHUP_PROBE_SECONDS)
     
     async def start_channel(self, channel_id: int, channel_username: str, channel_name: str):
         """Start monitoring a channel"""
@@ -206,7 +425,11 @@ class ChannelManager:
             logger.warning(f"Channel {channel_name} is already being monitored")
             return
         
-        monitor = ChannelMonitor(channel_id, channel_username, channel_name)
+        self.pipeline.start()
+        monitor = ChannelMonitor(
+            channel_id, channel_username, channel_name,
+            hub=self.hub, pipeline=self.pipeline, gap_watcher=self.gap_watcher
+        )
         self.monitors[channel_id] = monitor
         
         # Create and store the task
@@ -215,6 +438,29 @@ class ChannelManager:
         
         logger.info(f"Started monitoring channel: {channel_name}")
     
+    async def start_channels(self, channels: List[Tuple[int, str, str]]):
+        """
+        Start monitoring several channels
+        
+        With the shared connection, usernames missing from the entity cache
+        are resolved concurrently up front, so the monitors start without
+        waiting on sequential lookups.
+        
+        Args:
+            channels: (channel_id, channel_username, channel_name) of each channel
+        """
+        if self.hub is not None:
+            missing = [username for _, username, _ in channels if entity_cache.get(username) is None]
+            if missing:
+                client = await self.hub.connect()
+                results = await entity_cache.resolve_many(client, missing)
+                for username, result in results.items():
+                    if isinstance(result, Exception):
+                        logger.warning(f"Could not resolve {username}: {str(result)}")
+        
+        for channel_id, channel_username, channel_name in channels:
+            await self.start_channel(channel_id, channel_username, channel_name)
+    
     async def stop_channel(self, channel_id: int):
         """Stop monitoring a channel"""
         if channel_id not in self.monitors:
@@ -236,6 +482,11 @@ class ChannelManager:
         """Stop all channel monitors"""
         for channel_id in list(self.monitors.keys()):
             await self.stop_channel(channel_id)
+        await self.gap_watcher.stop()
+        await self.pipeline.stop()
+        if self.hub is not None:
+            await self.hub.disconnect()
+        shutdown_executors()
 
 # Global channel manager instance
 channel_manager = ChannelManager()
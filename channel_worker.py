@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Channel worker
+Runs the monitors for every channel started from the API, and starts or
+stops them as channels are switched on and off. With sharding enabled,
+several workers (processes or hosts) split the channels between them.
+
+Worker n of a host logs in with its own Telegram session,
+channel_manager_session_<n>.session; create it once by running
+`WORKER_INDEX=n python channel_worker.py` and entering the login code.
+Workers started by supervise() cannot prompt, so one without an
+authorized session exits and is not restarted.
+
+Checkpoints live in the shared channels table, but the seen-message set
+and the signal outbox are kept in this host's trading_bot.db. A channel
+taken over by a worker on another host is resumed from the shared
+checkpoint; messages after it are analyzed again and the Supabase upsert
+key keeps them from being stored twice. Signals a failed host had not
+synced yet stay in its outbox until it runs again.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from typing import Dict, Optional
+from config import Config
+from supabase_database import init_supabase_db
+from channel_monitor import ChannelManager, channel_manager
+from image_analyzer import start_ocr_pool
+from telegram_hub import NotLoggedIn
+from reconciler import ChannelReconciler
+from sharding import ShardCoordinator
+from supabase_writer import get_supabase_writer, close_supabase_writer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Exit code of a worker whose Telegram session needs an interactive login
+NOT_LOGGED_IN = 3
+
+def session_name_for(index: int) -> str:
+    """Telethon session of worker `index` on this host"""
+    return f"channel_manager_session_{index}"
+
+async def main(index: Optional[int] = None, interactive: bool = True):
+    """
+    Run one worker until interrupted
+
+    Args:
+        index: Worker number on this host, picking its Telegram session
+        interactive: Whether to prompt for a login the session lacks
+    """
+    init_supabase_db()
+
+    shard = None
+    manager = channel_manager
+    if index is not None:
+        manager = ChannelManager(shared_client=True, session_name=session_name_for(index), interactive=interactive)
+        # Log in before claiming any channel
+        await manager.hub.connect()
+    if Config.CHANNEL_SHARDING or Config.CHANNEL_WORKER_PROCESSES > 1:
+        worker_id = Config.WORKER_ID
+        if worker_id and index is not None:
+            worker_id = f"{worker_id}-{index}"
+        shard = ShardCoordinator(
+            worker_id=worker_id,
+            lease_ttl=Config.SHARD_LEASE_TTL_SECONDS,
+            heartbeat_interval=Config.SHARD_HEARTBEAT_SECONDS
+        )
+        logger.info(f"Starting sharded channel worker {shard.worker_id}")
+
+    # Sync signals left in the outbox by earlier runs
+    get_supabase_writer().start()
+    await start_ocr_pool()
+
+    reconciler = ChannelReconciler(
+        manager,
+        poll_interval=Config.CHANNEL_POLL_INTERVAL_MS / 1000,
+        resync_interval=Config.CHANNEL_RESYNC_SECONDS,
+        shard=shard
+    )
+
+    try:
+        await reconciler.run()
+    finally:
+        logger.info("Stopping all channel monitors...")
+        await manager.stop_all()
+        await close_supabase_writer()
+        # Hand the channels over only once their monitors have stopped
+        if shard is not None:
+            await shard.leave()
+
+def run_worker(index: Optional[int] = None, interactive: bool = True):
+    """Process entry point of one worker"""
+    try:
+        asyncio.run(main(index, interactive))
+    except KeyboardInterrupt:
+        pass
+    except NotLoggedIn as e:
+        logger.error(f"✗ {str(e)}; log it in with WORKER_INDEX={index} python channel_worker.py")
+        sys.exit(NOT_LOGGED_IN)
+
+def supervise(processes: int):
+    """Run sharded workers in child processes, restarting any that exit"""
+    context = multiprocessing.get_context('spawn')
+    workers: Dict[int, multiprocessing.Process] = {}
+    skipped = set()
+    for index in range(processes):
+        if not os.path.exists(f"{session_name_for(index)}.session"):
+            logger.error(f"✗ No Telegram session for channel worker {index}; log it in with WORKER_INDEX={index} python channel_worker.py")
+            skipped.add(index)
+    try:
+        while True:
+            if len(skipped) == processes:
+                logger.error("✗ No channel worker has a Telegram session, stopping")
+                return
+            for index in range(processes):
+                if index in skipped:
+                    continue
+                process = workers.get(index)
+                if process is not None and process.is_alive():
+                    continue
+                if process is not None and process.exitcode == NOT_LOGGED_IN:
+                    skipped.add(index)
+                    continue
+                if process is not None:
+                    logger.warning(f"Channel worker {index} exited with code {process.exitcode}, restarting")
+                process = context.Process(target=run_worker, args=(index, False), name=f"channel-worker-{index}")
+                process.start()
+                workers[index] = process
+            time.sleep(5)
+    except KeyboardInterrupt:
+        # The workers got the interrupt too and are releasing their leases
+        for process in workers.values():
+            process.join(timeout=30)
+    finally:
+        for process in workers.values():
+            if process.is_alive():
+                process.terminate()
+
+if __name__ == "__main__":
+    if Config.CHANNEL_WORKER_PROCESSES > 1:
+        supervise(Config.CHANNEL_WORKER_PROCESSES)
+    else:
+        run_worker(int(Config.WORKER_INDEX) if Config.WORKER_INDEX else None)
@@ -7,7 +7,7 @@ import asyncio
 from config import Config
 from telegram_client import TelegramGroupMonitor
 from text_parser import TradingSignalParser
-from image_analyzer import ImageAnalyzer
+from image_analyzer import ImageAnalyzer, shutdown_executors
 
 async def check_signals():
     # Validate configuration
@@ -43,24 +43,27 @@ async def check_signals():
     signals_found = []
     processed = 0
     
-    for message in reversed(messages):
+    messages = list(reversed(messages))
+    text_signals = text_parser.parse_many(message.text for message in messages)
+    
+    for message, text_signal in zip(messages, text_signals):
         processed += 1
         signal = None
         
         # Check for media (images/screenshots)
         if message.media:
             print(f"Processing message {processed}/100: Found image, analyzing with AI...")
-            media_bytes = await telegram_monitor.download_media(message)
-            if media_bytes:
-                signal = image_analyzer.analyze_image(media_bytes)
-                if signal:
-                    print(f"  ✓ Found signal in image: {signal.get('action')} {signal.get('instrument')}")
-        
-        # Check for text
-        if not signal and message.text:
-            signal = text_parser.parse_message(message.text)
+            signal, _ = await image_analyzer.analyze_media_async(
+                caption=message.text,
+                fetch_image=lambda: telegram_monitor.download_media(message)
+            )
             if signal:
-                print(f"Processing message {processed}/100: Found signal in text: {signal.get('action')} {signal.get('instrument')}")
+                print(f"  ✓ Found signal in image: {signal.get('action')} {signal.get('instrument')}")
+        
+        # Check for text (parsed in bulk above)
+        if not signal and text_signal:
+            signal = text_signal
+            print(f"Processing message {processed}/100: Found signal in text: {signal.get('action')} {signal.get('instrument')}")
         
         # Store valid signals
         if signal and text_parser.validate_signal(signal):
@@ -86,6 +89,7 @@ async def check_signals():
         print(f"{'-'*60}\n")
     
     await telegram_monitor.disconnect()
+    shutdown_executors()
 
 if __name__ == "__main__":
     asyncio.run(check_signals())
@@ -0,0 +1,330 @@
+"""
+Per-channel checkpoints of the newest fully processed message
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+from database import SessionLocal, engine, TelegramChannel, TradingSignal, add_missing_columns
+
+logger = logging.getLogger(__name__)
+
+_schema_ready = False
+
+def _ensure_schema():
+    """Create telegram_channels, or add last_message_id to an older table, once"""
+    global _schema_ready
+    if not _schema_ready:
+        TelegramChannel.__table__.create(bind=engine, checkfirst=True)
+        add_missing_columns(engine, TelegramChannel.__table__)
+        _schema_ready = True
+
+def load_checkpoint(channel_id: int) -> Optional[int]:
+    """
+    Get the id of the newest message processed for a channel
+
+    Returns:
+        Message id, or None if the channel has never been processed
+    """
+    try:
+        _ensure_schema()
+        db = SessionLocal()
+        channel = db.query(TelegramChannel).filter(TelegramChannel.id == channel_id).first()
+        db.close()
+        return channel.last_message_id if channel else None
+    except Exception as e:
+        logger.warning(f"Could not load checkpoint for channel {channel_id}: {str(e)}")
+        return None
+
+def save_checkpoint(channel_id: int, message_id: int):
+    """Record message_id as processed for a channel; checkpoints never move back"""
+    try:
+        _ensure_schema()
+        db = SessionLocal()
+        db.query(TelegramChannel).filter(
+            TelegramChannel.id == channel_id,
+            (TelegramChannel.last_message_id == None) | (TelegramChannel.last_message_id < message_id)
+        ).update({TelegramChannel.last_message_id: message_id}, synchronize_session=False)
+        db.commit()
+        db.close()
+    except Exception as e:
+        logger.warning(f"Could not save checkpoint for channel {channel_id}: {str(e)}")
+
+def load_shared_checkpoint(channel_id: int) -> Optional[int]:
+    """
+    Get a channel's checkpoint from the shared channels table
+
+    Used by channel monitors, so a worker on any host that takes a channel
+    over continues from where the previous owner stopped.
+
+    Returns:
+        Message id, or None if the channel has never been processed
+    """
+    try:
+        # Imported here: the single-group bot never touches the shared database
+        from supabase_database import SessionLocal as SharedSession, Channel
+        db = SharedSession()
+        row = db.query(Channel.last_message_id).filter(Channel.id == channel_id).first()
+        db.close()
+        return row[0] if row else None
+    except Exception as e:
+        logger.warning(f"Could not load shared checkpoint for channel {channel_id}: {str(e)}")
+        return None
+
+def save_shared_checkpoint(channel_id: int, message_id: int):
+    """Record message_id as processed in the shared channels table; checkpoints never move back"""
+    try:
+        from supabase_database import SessionLocal as SharedSession, Channel
+        db = SharedSession()
+        db.query(Channel).filter(
+            Channel.id == channel_id,
+            (Channel.last_message_id == None) | (Channel.last_message_id < message_id)
+        ).update({Channel.last_message_id: message_id}, synchronize_session=False)
+        db.commit()
+        db.close()
+    except Exception as e:
+        logger.warning(f"Could not save shared checkpoint for channel {channel_id}: {str(e)}")
+
+def channel_id_for(username: str, name: str) -> Optional[int]:
+    """
+    Get the telegram_channels row id for a username, creating the row if needed
+
+    Lets the single-group bot keep its checkpoint in the same table as the
+    monitored channels.
+    """
+    try:
+        _ensure_schema()
+        db = SessionLocal()
+        channel = db.query(TelegramChannel).filter(TelegramChannel.username == username).first()
+        if channel is None:
+            channel = TelegramChannel(name=name, username=username)
+            db.add(channel)
+            db.commit()
+        channel_id = channel.id
+        db.close()
+        return channel_id
+    except Exception as e:
+        logger.warning(f"Could not register channel {username}: {str(e)}")
+        return None
+
+class CheckpointTracker:
+    """
+    Advance a channel's checkpoint as messages finish, even out of order
+
+    Messages are processed concurrently, so the checkpoint only moves up to
+    just below the oldest message still in flight; a crash can then
+    reprocess a few messages but never skip one.
+    """
+
+    def __init__(self, channel_id: Optional[int], shared: bool = False, save_interval: float = 0):
+        """
+        Args:
+            channel_id: telegram_channels row id (channels row id if shared),
+                or None to track without saving
+            shared: Keep the checkpoint in the shared channels table
+            save_interval: Minimum seconds between saves of a shared
+                checkpoint; those saves run off the event loop
+        """
+        self.channel_id = channel_id
+        self.shared = shared
+        self.save_interval = save_interval
+        self._last_save = 0.0
+        self._load = load_shared_checkpoint if shared else load_checkpoint
+        self._save = save_shared_checkpoint if shared else save_checkpoint
+        self.saved = self._load(channel_id) if channel_id is not None else None
+        self.highest_done = self.saved or 0
+        self.in_flight: Set[int] = set()
+        # Floors the checkpoint must not pass, e.g. the start of a gap being fetched
+        self.holds: List[int] = []
+        # While set, nothing is saved (used while a gap is being backfilled)
+        self.paused = False
+
+    def seed(self, message_id: Optional[int]):
+        """Start from an older checkpoint (e.g. one kept elsewhere before) if none is saved yet"""
+        if self.saved is None and message_id:
+            self.saved = message_id
+            self.highest_done = max(self.highest_done, message_id)
+
+    def begin(self, message_id: int):
+        """Mark a message as received and not yet processed"""
+        self.in_flight.add(message_id)
+
+    def done(self, message_id: int):
+        """Mark a message as processed and save the checkpoint if it advanced"""
+        self.in_flight.discard(message_id)
+        self.highest_done = max(self.highest_done, message_id)
+        self.flush()
+
+    def hold(self, message_id: int):
+        """Keep the checkpoint at or below message_id until release(message_id)"""
+        self.holds.append(message_id)
+
+    def release(self, message_id: int):
+        """Drop a hold and save the checkpoint if it can advance now"""
+        self.holds.remove(message_id)
+        self.flush()
+
+    def flush(self, force: bool = False):
+        """
+        Save the newest id below every message still in flight
+
+        Args:
+            force: Save a shared checkpoint now, on this thread, even
+                within save_interval of the last save (e.g. on stop)
+        """
+        if self.paused or self.channel_id is None:
+            return
+        safe = min(self.in_flight) - 1 if self.in_flight else self.highest_done
+        safe = min(safe, self.highest_done, *self.holds)
+        if safe <= (self.saved or 0):
+            return
+        if self.shared and not force:
+            now = time.monotonic()
+            if now - self._last_save < self.save_interval:
+                # Saved with a later message, or on stop
+                return
+            self._last_save = now
+            try:
+                # Saves are forward-only, so they may finish in any order
+                asyncio.get_running_loop().run_in_executor(None, self._save, self.channel_id, safe)
+            except RuntimeError:
+                self._save(self.channel_id, safe)
+        else:
+            self._save(self.channel_id, safe)
+        self.saved = safe
+
+class AnalysisRetries:
+    """
+    Analyze messages again in-process after their analysis failed
+
+    The checkpoint is held below a failed message while it waits, so a
+    restart in the meantime still picks it up. Each retry waits twice as
+    long as the one before; after `attempts` retries the message is given
+    up and the hold is not renewed, so one bad message cannot pin the
+    checkpoint for the rest of the process.
+    """
+
+    def __init__(self, checkpoint: CheckpointTracker, process: Callable[[List], Awaitable[None]], attempts: int = 3, delay: float = 30.0):
+        """
+        Args:
+            checkpoint: Tracker of the channel the messages belong to
+            process: Coroutine function that analyzes a message (or album's
+                parts) again, calling schedule() if it fails again
+            attempts: Retries per message before giving up
+            delay: Seconds before the first retry
+        """
+        self.checkpoint = checkpoint
+        self.process = process
+        self.attempts = attempts
+        self.delay = delay
+        # First part's id -> retries scheduled so far
+        self.scheduled: Dict[int, int] = {}
+        self.given_up = 0
+        self._tasks: Set[asyncio.Task] = set()
+
+    def schedule(self, parts: List) -> bool:
+        """
+        Retry a message (or album) whose analysis failed, after a backoff
+
+        Must be called from the running event loop.
+
+        Returns:
+            False if the message has used up its retries and is given up
+        """
+        key = parts[0].id
+        attempt = self.scheduled.get(key, 0)
+        if attempt >= self.attempts:
+            self.scheduled.pop(key, None)
+            self.given_up += 1
+            return False
+
+        self.scheduled[key] = attempt + 1
+        floor = min(part.id for part in parts) - 1
+        self.checkpoint.hold(floor)
+        task = asyncio.create_task(self._retry(parts, floor, self.delay * 2 ** attempt))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _retry(self, parts: List, floor: int, delay: float):
+        """Wait, then analyze the message again with the checkpoint kept below it"""
+        await asyncio.sleep(delay)
+        key = parts[0].id
+        attempt = self.scheduled.get(key)
+        for part in parts:
+            self.checkpoint.begin(part.id)
+        # The message is in flight now, which keeps the checkpoint below it
+        self.checkpoint.release(floor)
+        try:
+            await self.process(parts)
+        except asyncio.CancelledError:
+            self.checkpoint.hold(floor)
+            raise
+        except Exception as e:
+            logger.error(f"Retry of message {key} failed: {str(e)}")
+        finally:
+            for part in parts:
+                self.checkpoint.done(part.id)
+            if self.scheduled.get(key) == attempt:
+                # Not scheduled again, so it succeeded
+                del self.scheduled[key]
+
+    async def stop(self):
+        """Cancel pending retries; their holds stay, so the checkpoint is not saved past them"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+class SeenMessages:
+    """
+    Bounded set of a channel's message ids that were processed already
+
+    Seeded with the messages whose signals are stored, and extended with
+    every message processed since, so messages read again (startup
+    backfill after a restart, overlapping catch-ups) skip analysis.
+    """
+
+    def __init__(self, limit: int = 10000):
+        """
+        Args:
+            limit: Message ids kept; the oldest are forgotten first
+        """
+        self.limit = limit
+        self.skipped = 0
+        self._ids: "OrderedDict[int, None]" = OrderedDict()
+
+    def load(self, channel_id: int):
+        """Remember the messages of the newest signals stored for a channel"""
+        try:
+            db = SessionLocal()
+            rows = db.query(TradingSignal.message_id).filter(
+                TradingSignal.channel_id == channel_id,
+                TradingSignal.message_id != None
+            ).order_by(TradingSignal.id.desc()).limit(self.limit).all()
+            db.close()
+        except Exception as e:
+            logger.warning(f"Could not load stored messages of channel {channel_id}: {str(e)}")
+            return
+        for (message_id,) in reversed(rows):
+            self._remember(message_id)
+
+    def _remember(self, message_id: int):
+        """Add an id, forgetting the oldest beyond the limit"""
+        self._ids[message_id] = None
+        self._ids.move_to_end(message_id)
+        if len(self._ids) > self.limit:
+            self._ids.popitem(last=False)
+
+    def known(self, parts: Iterable) -> bool:
+        """True if any part of a message or album was processed already"""
+        if any(message.id in self._ids for message in parts):
+            self.skipped += 1
+            return True
+        return False
+
+    def add(self, parts: Iterable):
+        """Record a message or album as processed"""
+        for message in parts:
+            self._remember(message.id)
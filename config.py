@@ -12,17 +12,103 @@ class Config:
     TELEGRAM_API_HASH = os.getenv('TELEGRAM_API_HASH')
     TELEGRAM_PHONE = os.getenv('TELEGRAM_PHONE')
     TELEGRAM_GROUP_USERNAME = os.getenv('TELEGRAM_GROUP_USERNAME')
+    # Serve all monitored channels from one connection (false: one client per channel)
+    TELEGRAM_SHARED_CLIENT = os.getenv('TELEGRAM_SHARED_CLIENT', 'true').lower() == 'true'
     
     # Supabase Configuration
     SUPABASE_URL = os.getenv('SUPABASE_URL')
     SUPABASE_KEY = os.getenv('SUPABASE_KEY')
     SUPABASE_TABLE = os.getenv('SUPABASE_TABLE', 'trading_signals')
     
+    # Supabase Sync (signals are stored locally first and synced from that outbox:
+    # rows per insert; longest wait for a batch to fill; rejections before a row is parked)
+    SUPABASE_BATCH_SIZE = int(os.getenv('SUPABASE_BATCH_SIZE', '50'))
+    SUPABASE_FLUSH_MS = int(os.getenv('SUPABASE_FLUSH_MS', '1000'))
+    SUPABASE_MAX_ATTEMPTS = int(os.getenv('SUPABASE_MAX_ATTEMPTS', '5'))
+    
     # Azure OpenAI Configuration (optional)
     AZURE_OPENAI_ENDPOINT = os.getenv('AZURE_OPENAI_ENDPOINT')
     AZURE_OPENAI_KEY = os.getenv('AZURE_OPENAI_KEY')
     AZURE_OPENAI_DEPLOYMENT = os.getenv('AZURE_OPENAI_DEPLOYMENT', 'gpt-4o')
     
+    # Message Pipeline (workers processing new messages; per-channel queue bound)
+    PIPELINE_WORKERS = int(os.getenv('PIPELINE_WORKERS', '4'))
+    PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '100'))
+    
+    # Channel Worker (how fast API start/stop clicks reach the running monitors)
+    CHANNEL_POLL_INTERVAL_MS = int(os.getenv('CHANNEL_POLL_INTERVAL_MS', '500'))
+    CHANNEL_RESYNC_SECONDS = int(os.getenv('CHANNEL_RESYNC_SECONDS', '30'))
+    
+    # Channel Sharding (workers claim channels through leases; several processes per host)
+    CHANNEL_SHARDING = os.getenv('CHANNEL_SHARDING', 'false').lower() == 'true'
+    CHANNEL_WORKER_PROCESSES = int(os.getenv('CHANNEL_WORKER_PROCESSES', '1'))
+    WORKER_ID = os.getenv('WORKER_ID')
+    WORKER_INDEX = os.getenv('WORKER_INDEX')  # Picks the Telegram session of a sharded worker
+    SHARD_LEASE_TTL_SECONDS = int(os.getenv('SHARD_LEASE_TTL_SECONDS', '30'))
+    SHARD_HEARTBEAT_SECONDS = int(os.getenv('SHARD_HEARTBEAT_SECONDS', '10'))
+    CHECKPOINT_SAVE_SECONDS = float(os.getenv('CHECKPOINT_SAVE_SECONDS', '5'))
+    
+    # History Backfill (messages analyzed at once; messages fetched per batch)
+    BACKFILL_CONCURRENCY = int(os.getenv('BACKFILL_CONCURRENCY', '8'))
+    BACKFILL_BATCH_SIZE = int(os.getenv('BACKFILL_BATCH_SIZE', '100'))
+    
+    # Catch-up (messages missed during outages: probe interval; fetch rate shared by all channels)
+    CATCHUP_PROBE_SECONDS = int(os.getenv('CATCHUP_PROBE_SECONDS', '60'))
+    CATCHUP_PER_MINUTE = int(os.getenv('CATCHUP_PER_MINUTE', '120'))
+    
+    # Azure OpenAI Rate Limits (deployment quota shared by all channel monitors)
+    AZURE_OPENAI_RPM = int(os.getenv('AZURE_OPENAI_RPM', '60'))
+    AZURE_OPENAI_TPM = int(os.getenv('AZURE_OPENAI_TPM', '60000'))
+    AZURE_OPENAI_MAX_IN_FLIGHT = int(os.getenv('AZURE_OPENAI_MAX_IN_FLIGHT', '4'))
+    AZURE_OPENAI_MAX_RETRIES = int(os.getenv('AZURE_OPENAI_MAX_RETRIES', '5'))
+    
+    # Image Analysis Concurrency (pools shared by all channel monitors)
+    IMAGE_VISION_WORKERS = int(os.getenv('IMAGE_VISION_WORKERS', '4'))
+    IMAGE_OCR_WORKERS = int(os.getenv('IMAGE_OCR_WORKERS', '2'))
+    
+    # OCR Workers (long-lived processes; restarted if they hang or crash)
+    OCR_LANGUAGE = os.getenv('OCR_LANGUAGE', 'eng')
+    OCR_TIMEOUT_SECONDS = float(os.getenv('OCR_TIMEOUT_SECONDS', '30'))
+    OCR_HEALTH_CHECK_SECONDS = float(os.getenv('OCR_HEALTH_CHECK_SECONDS', '60'))
+    
+    # Media Downloads (non-image media is skipped; photos are fetched at the
+    # smallest size whose longest edge reaches MEDIA_MIN_EDGE)
+    MEDIA_MIN_EDGE = int(os.getenv('MEDIA_MIN_EDGE', '1280'))
+    MEDIA_MAX_BYTES = int(os.getenv('MEDIA_MAX_MB', '10')) * 1024 * 1024
+    MEDIA_MAX_PIXELS = int(os.getenv('MEDIA_MAX_PIXELS', '40000000'))
+    MEDIA_MEMORY_BUDGET_MB = int(os.getenv('MEDIA_MEMORY_BUDGET_MB', '64'))
+    
+    # Image Preprocessing (longest edge in pixels; JPEG or WEBP uploads)
+    IMAGE_MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', '1024'))
+    IMAGE_OCR_MAX_EDGE = int(os.getenv('IMAGE_OCR_MAX_EDGE', '1600'))
+    IMAGE_ENCODE_FORMAT = os.getenv('IMAGE_ENCODE_FORMAT', 'JPEG')
+    IMAGE_ENCODE_QUALITY = int(os.getenv('IMAGE_ENCODE_QUALITY', '80'))
+    
+    # Analysis Cascade (cheapest first; vision only runs if earlier stages fail)
+    ANALYSIS_CASCADE = os.getenv('ANALYSIS_CASCADE', 'caption,ocr,vision')
+    OCR_MIN_CONFIDENCE = float(os.getenv('OCR_MIN_CONFIDENCE', '60'))
+    
+    # Analysis Retries (messages whose image analysis failed; the wait doubles each time)
+    ANALYSIS_RETRY_ATTEMPTS = int(os.getenv('ANALYSIS_RETRY_ATTEMPTS', '3'))
+    ANALYSIS_RETRY_SECONDS = float(os.getenv('ANALYSIS_RETRY_SECONDS', '30'))
+    
+    # Vision Batching (images arriving within the window share one request)
+    VISION_BATCH_SIZE = int(os.getenv('VISION_BATCH_SIZE', '4'))
+    VISION_BATCH_WINDOW_MS = int(os.getenv('VISION_BATCH_WINDOW_MS', '250'))
+    
+    # Albums (parts sharing a grouped_id are collected until none arrives for the window)
+    ALBUM_WINDOW_MS = int(os.getenv('ALBUM_WINDOW_MS', '500'))
+    
+    # Image Dedupe Cache (exact content hash of previously analyzed images)
+    IMAGE_CACHE_TTL_HOURS = int(os.getenv('IMAGE_CACHE_TTL_HOURS', '168'))
+    
+    # Entity Cache (usernames resolved to peer id + access hash, kept across restarts)
+    ENTITY_CACHE_TTL_HOURS = int(os.getenv('ENTITY_CACHE_TTL_HOURS', '24'))
+    ENTITY_RESOLVE_CONCURRENCY = int(os.getenv('ENTITY_RESOLVE_CONCURRENCY', '4'))
+    
+    # Signal Cache Configuration (shared by all channel monitors)
+    SIGNAL_CACHE_SIZE = int(os.getenv('SIGNAL_CACHE_SIZE', '10000'))
+    
     @classmethod
     def validate(cls):
         """Validate that all required configuration is present"""
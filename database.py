@@ -1,7 +1,7 @@
 """
 Database models and configuration
 """
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, JSON
+from sqlalchemy import create_engine, inspect, text, Column, Index, Integer, BigInteger, String, Boolean, DateTime, Text, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -28,13 +28,18 @@ class TelegramChannel(Base):
     total_signals = Column(Integer, default=0)
     status = Column(String, default="stopped")  # stopped, running, error
     error_message = Column(Text, nullable=True)
+    last_message_id = Column(Integer, nullable=True)  # Checkpoint: newest message fully processed
 
 class TradingSignal(Base):
     """Model for trading signals detected"""
     __tablename__ = "trading_signals_local"
+    __table_args__ = (
+        # One row per message, however often it is re-read
+        Index('uq_trading_signals_local_channel_message', 'channel_id', 'message_id', unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    channel_id = Column(Integer, nullable=False)
+    channel_id = Column(BigInteger, nullable=False)  # Telegram (marked) chat id, e.g. -100...
     channel_name = Column(String, nullable=False)
     action = Column(String, nullable=False)  # BUY/SELL
     instrument = Column(String, nullable=False)
@@ -46,11 +51,73 @@ class TradingSignal(Base):
     message_id = Column(Integer, nullable=True)
     message_date = Column(DateTime, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-    synced_to_supabase = Column(Boolean, default=False)
+    synced_to_supabase = Column(Boolean, default=False)  # Outbox: sent to the Supabase signals table
+    sync_attempts = Column(Integer, default=0)  # Inserts Supabase rejected; the row is parked at the limit
+    sync_owner = Column(String, nullable=True)  # Process currently syncing the row
+    sync_claimed_until = Column(DateTime, nullable=True)
+
+class ImageAnalysisCache(Base):
+    """Model for analysis results of previously seen images, keyed by content hash"""
+    __tablename__ = "image_content_cache"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), nullable=False, index=True)  # SHA-256 of decoded pixels as hex
+    result = Column(JSON, nullable=True)  # Signal dict, or null if the image held no signal
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class ResolvedEntity(Base):
+    """Model for Telegram usernames resolved to peers, so restarts skip the network lookup"""
+    __tablename__ = "resolved_entities"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String, unique=True, nullable=False)  # Lowercase, without @ or t.me/
+    peer_type = Column(String, nullable=False)  # channel, chat, user
+    peer_id = Column(BigInteger, nullable=False)
+    access_hash = Column(BigInteger, nullable=True)  # Not used by basic chats
+    title = Column(String, nullable=True)
+    resolved_at = Column(DateTime, default=datetime.utcnow)
+
+def add_missing_columns(bind, table):
+    """
+    Add columns a model gained since its table was created
+    
+    create_all never alters existing tables, so new nullable columns are
+    added here with ALTER TABLE.
+    """
+    existing = {column['name'] for column in inspect(bind).get_columns(table.name)}
+    with bind.begin() as conn:
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=bind.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+def add_unique_index(bind, table, name, columns):
+    """
+    Create a unique index on a table that may predate it
+    
+    create_all only creates indexes together with new tables. Duplicates
+    already in the table would make the index fail, so of each set of rows
+    sharing the key only the oldest (lowest id) is kept; rows with a NULL
+    key column are left alone.
+    """
+    key = ', '.join(columns)
+    key_present = ' AND '.join(f'{column} IS NOT NULL' for column in columns)
+    existing = {index['name'] for index in inspect(bind).get_indexes(table.name)}
+    if name in existing:
+        return
+    with bind.begin() as conn:
+        conn.execute(text(
+            f'DELETE FROM {table.name} WHERE {key_present} AND id NOT IN '
+            f'(SELECT MIN(id) FROM {table.name} WHERE {key_present} GROUP BY {key})'
+        ))
+        conn.execute(text(f'CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table.name} ({key})'))
 
 # Create tables
 def init_db():
     Base.metadata.create_all(bind=engine)
+    add_missing_columns(engine, TelegramChannel.__table__)
+    add_missing_columns(engine, TradingSignal.__table__)
+    add_unique_index(engine, TradingSignal.__table__, 'uq_trading_signals_local_channel_message', ['channel_id', 'message_id'])
 
 # Get DB session
 def get_db():
@@ -0,0 +1,203 @@
+"""
+Persistent cache of Telegram usernames resolved to peers
+"""
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Tuple
+from telethon import utils
+from telethon.tl.types import InputPeerChannel, InputPeerChat, InputPeerUser
+from config import Config
+from database import SessionLocal, engine, ResolvedEntity
+
+logger = logging.getLogger(__name__)
+
+class ResolvedPeer(NamedTuple):
+    """A resolved chat: the input peer every client call accepts, and its title"""
+    peer: Any
+    title: str
+
+def normalize_username(username: str) -> str:
+    """Reduce @name, t.me/name and https://t.me/name to name"""
+    username = username.strip().rstrip('/')
+    if 't.me/' in username:
+        username = username.split('/')[-1]
+    return username.lstrip('@')
+
+def _input_peer(peer_type: str, peer_id: int, access_hash: Optional[int]):
+    """Rebuild the input peer for a cached entry"""
+    if peer_type == 'channel':
+        return InputPeerChannel(peer_id, access_hash)
+    if peer_type == 'chat':
+        return InputPeerChat(peer_id)
+    return InputPeerUser(peer_id, access_hash)
+
+class EntityCache:
+    """
+    Username -> (peer id, access hash) cache kept in the database
+
+    Resolving a username costs a network round-trip, and many of them in a
+    row on every restart invite FloodWait. The peer id and access hash of a
+    chat do not change, so they are stored and reused until `ttl` old.
+    Lookups that do go to Telegram are limited to `max_concurrent` at once.
+    """
+
+    def __init__(self, ttl: timedelta = timedelta(hours=24), max_concurrent: int = 4):
+        """
+        Args:
+            ttl: How long a resolved entry is used before it is refreshed
+            max_concurrent: Network resolutions in flight at the same time
+        """
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        # key -> (peer_type, peer_id, access_hash, title, resolved_at)
+        self._entries: Optional[Dict[str, Tuple[str, int, Optional[int], str, datetime]]] = None
+        self._lock = threading.Lock()
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    def _load(self):
+        """Load stored entries from the database on first use"""
+        if self._entries is not None:
+            return
+
+        self._entries = {}
+        try:
+            ResolvedEntity.__table__.create(bind=engine, checkfirst=True)
+            db = SessionLocal()
+            for row in db.query(ResolvedEntity).all():
+                self._entries[row.username] = (row.peer_type, row.peer_id, row.access_hash, row.title or '', row.resolved_at)
+            db.close()
+            logger.info(f"Loaded {len(self._entries)} resolved Telegram entities")
+        except Exception as e:
+            logger.warning(f"Could not load entity cache: {str(e)}")
+
+    def get(self, username: str, allow_expired: bool = False) -> Optional[ResolvedPeer]:
+        """
+        Look up a username without touching the network
+
+        Args:
+            username: Username or t.me link
+            allow_expired: Also return entries older than the TTL
+
+        Returns:
+            The cached peer, or None on a miss
+        """
+        key = normalize_username(username).lower()
+        with self._lock:
+            self._load()
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        peer_type, peer_id, access_hash, title, resolved_at = entry
+        if not allow_expired and datetime.utcnow() - resolved_at > self.ttl:
+            return None
+        return ResolvedPeer(_input_peer(peer_type, peer_id, access_hash), title)
+
+    def _store(self, username: str, entity) -> ResolvedPeer:
+        """Remember a freshly resolved entity"""
+        key = normalize_username(username).lower()
+        peer = utils.get_input_peer(entity)
+        if isinstance(peer, InputPeerChannel):
+            entry = ('channel', peer.channel_id, peer.access_hash)
+        elif isinstance(peer, InputPeerChat):
+            entry = ('chat', peer.chat_id, None)
+        else:
+            entry = ('user', peer.user_id, peer.access_hash)
+        title = utils.get_display_name(entity)
+        resolved_at = datetime.utcnow()
+
+        with self._lock:
+            self._load()
+            self._entries[key] = entry + (title, resolved_at)
+        try:
+            db = SessionLocal()
+            row = db.query(ResolvedEntity).filter(ResolvedEntity.username == key).first()
+            if row is None:
+                row = ResolvedEntity(username=key)
+                db.add(row)
+            row.peer_type, row.peer_id, row.access_hash = entry
+            row.title = title
+            row.resolved_at = resolved_at
+            db.commit()
+            db.close()
+        except Exception as e:
+            logger.warning(f"Could not store resolved entity {key}: {str(e)}")
+        return ResolvedPeer(peer, title)
+
+    def invalidate(self, username: str):
+        """Forget a username, e.g. after its stored access hash was rejected"""
+        key = normalize_username(username).lower()
+        with self._lock:
+            self._load()
+            self._entries.pop(key, None)
+        try:
+            db = SessionLocal()
+            db.query(ResolvedEntity).filter(ResolvedEntity.username == key).delete()
+            db.commit()
+            db.close()
+        except Exception as e:
+            logger.warning(f"Could not invalidate resolved entity {key}: {str(e)}")
+
+    async def resolve(self, client, username: str) -> ResolvedPeer:
+        """
+        Resolve a username, asking Telegram only on a miss or expired entry
+
+        If the refresh of an expired entry fails, the old entry is still
+        used; access hashes stay valid for the same account.
+
+        Args:
+            client: Connected TelegramClient
+            username: Username or t.me link
+
+        Returns:
+            The resolved peer
+
+        Raises:
+            Exception: Telegram's error if the username is unknown and cannot be resolved
+        """
+        cached = self.get(username)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        async with self._semaphore:
+            try:
+                entity = await client.get_entity(normalize_username(username))
+            except Exception as e:
+                stale = self.get(username, allow_expired=True)
+                if stale is None:
+                    raise
+                self.stale += 1
+                logger.warning(f"Could not refresh {username}, using the cached peer: {str(e)}")
+                return stale
+        return self._store(username, entity)
+
+    async def resolve_many(self, client, usernames: Iterable[str]) -> Dict[str, Any]:
+        """
+        Resolve several usernames concurrently
+
+        Returns:
+            username -> ResolvedPeer, or the exception if it could not be resolved
+        """
+        usernames = list(usernames)
+        results = await asyncio.gather(*(self.resolve(client, username) for username in usernames), return_exceptions=True)
+        return dict(zip(usernames, results))
+
+    def stats(self) -> Dict:
+        """Get hit/miss counters"""
+        return {
+            'entries': len(self._entries or {}),
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+        }
+
+# Global entity cache instance
+entity_cache = EntityCache(
+    ttl=timedelta(hours=Config.ENTITY_CACHE_TTL_HOURS),
+    max_concurrent=Config.ENTITY_RESOLVE_CONCURRENCY
+)
@@ -1,6 +1,11 @@
 import os
-from typing import Dict, Optional
-from PIL import Image
+import re
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from PIL import Image, ImageOps, ImageStat
 import io
 
 try:
@@ -16,12 +21,384 @@ except ImportError:
     OPENAI_AVAILABLE = False
 
 from text_parser import TradingSignalParser
+from config import Config
+from image_cache import compute_content_hash, image_hash_cache
+from signal_cache import signal_cache
+from rate_limiter import get_rate_limiter
+from ocr_pool import OcrFailed, OcrWorkerPool
+
+# Pools shared by every ImageAnalyzer in the process, created on first use
+_vision_executor: Optional[ThreadPoolExecutor] = None
+_ocr_pool: Optional[OcrWorkerPool] = None
+_ocr_pool_lock = threading.Lock()
+
+def get_vision_executor() -> ThreadPoolExecutor:
+    """Get the thread pool that runs blocking Azure OpenAI vision calls"""
+    global _vision_executor
+    if _vision_executor is None:
+        _vision_executor = ThreadPoolExecutor(
+            max_workers=Config.IMAGE_VISION_WORKERS,
+            thread_name_prefix="vision"
+        )
+    return _vision_executor
+
+def get_ocr_pool() -> OcrWorkerPool:
+    """Get the warm OCR worker processes (CPU-bound, so kept off the GIL)"""
+    global _ocr_pool
+    with _ocr_pool_lock:
+        if _ocr_pool is None:
+            _ocr_pool = OcrWorkerPool(
+                size=Config.IMAGE_OCR_WORKERS,
+                timeout=Config.OCR_TIMEOUT_SECONDS,
+                health_check_interval=Config.OCR_HEALTH_CHECK_SECONDS,
+                language=Config.OCR_LANGUAGE
+            )
+    return _ocr_pool
+
+async def get_ocr_pool_async() -> OcrWorkerPool:
+    """Get the OCR workers, starting their processes off the event loop"""
+    if _ocr_pool is not None:
+        return _ocr_pool
+    return await asyncio.get_running_loop().run_in_executor(None, get_ocr_pool)
+
+async def start_ocr_pool():
+    """Start the OCR workers at startup if the configured cascade uses OCR"""
+    if 'ocr' in (stage.strip() for stage in Config.ANALYSIS_CASCADE.split(',')):
+        await get_ocr_pool_async()
+
+def shutdown_executors():
+    """Shut down the shared analysis pools"""
+    global _vision_executor, _ocr_pool
+    if _vision_executor is not None:
+        _vision_executor.shutdown(wait=False, cancel_futures=True)
+        _vision_executor = None
+    if _ocr_pool is not None:
+        _ocr_pool.shutdown()
+        _ocr_pool = None
+
+VISION_PROMPT = """You are a trading signal analyzer. Carefully examine this image and determine:
+
+1. **INTENT**: Is this a TRADING SIGNAL (future trade setup) or a TRADE RESULT (past trade outcome)?
+   - Trading signals have: entry zones, pending orders, future setup indicators, "wait for", "looking for"
+   - Trade results have: profit/loss amounts, "closed", "hit TP", equity changes, completed trades
+   
+2. **ONLY extract signals if this is a TRADING SIGNAL (pre-trade setup)**. Ignore trade results.
+
+3. If this IS a trading signal, extract:
+   - Action: BUY/SELL/LONG/SHORT (look at text, arrows, or chart patterns)
+   - Instrument: The trading pair/symbol (EURUSD, XAUUSD, BTCUSDT, etc.)
+   - Entry Price: The exact entry price or zone (look for "Entry", "Buy at", "Sell at", price levels)
+   - Stop Loss (SL): The stop loss level (may be marked with red line, "SL:", or below entry for buy/above for sell)
+   - Take Profit (TP): All target levels (TP1, TP2, TP3, or marked zones on chart)
+
+4. **Look at drawings/annotations**: 
+   - Lines, arrows, boxes indicating entry zones
+   - Red lines often = Stop Loss
+   - Green lines often = Take Profit
+   - Horizontal lines with prices
+   - Text annotations
+
+5. **Respond ONLY if this is a trading signal**. Use this exact format:
+
+SIGNAL_TYPE: [TRADE_SIGNAL or TRADE_RESULT]
+ACTION: [BUY/SELL/LONG/SHORT or N/A]
+INSTRUMENT: [exact symbol like EURUSD, XAUUSD, etc. or N/A]
+ENTRY: [exact price number or N/A]
+SL: [exact price number or N/A]
+TP: [comma-separated prices like 1.2000, 1.2100 or N/A]
+CONFIDENCE: [0-100, how sure you are of the extracted values]
+
+If SIGNAL_TYPE is TRADE_RESULT, respond with:
+SIGNAL_TYPE: TRADE_RESULT
+ACTION: N/A
+INSTRUMENT: N/A
+ENTRY: N/A
+SL: N/A
+TP: N/A
+CONFIDENCE: [0-100]
+
+Be precise with numbers. Extract exact prices from the image."""
+
+# Prepended to VISION_PROMPT when several images share one request
+VISION_BATCH_PROMPT = """You will receive {count} images. Analyze each image independently using the instructions below.
+For each image, in the order given, write a line "=== IMAGE n ===" (n starting at 1) followed by that image's answer in the exact format described.
+
+"""
+
+# Prepended to VISION_PROMPT when the images are the parts of one album
+VISION_ALBUM_PROMPT = """You will receive {count} images that were posted together as one message (an album).
+Treat them as a single post: combine what they show (e.g. a chart and a text card) and give ONE answer for the whole post in the exact format described.
+
+"""
+
+# Rough token costs used to reserve TPM quota before a vision call; the
+# limiter settles the difference once the response reports actual usage
+VISION_PROMPT_TOKENS = 700
+VISION_IMAGE_TOKENS = 800
+VISION_MAX_OUTPUT_TOKENS = 800
+
+# Header separating per-image blocks in a batched vision reply
+BATCH_HEADER_RE = re.compile(r'^[ \t]*=+[ \t]*IMAGE[ \t]+(\d+)[ \t]*=+[ \t]*$', re.MULTILINE | re.IGNORECASE)
+
+def split_batch_reply(reply: Optional[str], count: int) -> List[Optional[str]]:
+    """
+    Split a multi-image vision reply into one block per image
+    
+    Args:
+        reply: Model reply containing "=== IMAGE n ===" headers
+        count: Number of images in the request
+        
+    Returns:
+        Reply block for each image, or None where the block is missing
+    """
+    blocks: List[Optional[str]] = [None] * count
+    if not reply:
+        return blocks
+    parts = BATCH_HEADER_RE.split(reply)
+    # parts = [preamble, number, block, number, block, ...]
+    for number, block in zip(parts[1::2], parts[2::2]):
+        index = int(number) - 1
+        if 0 <= index < count and blocks[index] is None:
+            blocks[index] = block.strip()
+    return blocks
+
+class VisionBatcher:
+    """Collect images arriving close together and send them in one vision request"""
+    
+    def __init__(self, request: Callable[[List[bytes]], List[Optional[str]]], max_batch: int, window: float):
+        """
+        Args:
+            request: Blocking function sending a list of images, e.g. ImageAnalyzer.request_vision
+            max_batch: Maximum images per request
+            window: Seconds to wait for more images after the first one arrives
+        """
+        self.request = request
+        self.max_batch = max_batch
+        self.window = window
+        self.pending: List[Tuple[bytes, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Keep references so in-flight requests are not garbage collected
+        self._in_flight: Set[asyncio.Task] = set()
+    
+    async def submit(self, image_bytes: bytes) -> Optional[str]:
+        """
+        Queue an image for the next batch
+        
+        Args:
+            image_bytes: The image file as bytes
+            
+        Returns:
+            The model's reply for this image
+            
+        Raises:
+            Exception: If the vision request failed
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((image_bytes, future))
+        
+        if len(self.pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        
+        return await future
+    
+    def _flush(self):
+        """Send up to max_batch pending images"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        batch = self.pending[:self.max_batch]
+        self.pending = self.pending[self.max_batch:]
+        if batch:
+            task = asyncio.ensure_future(self._send(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+        if self.pending:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+    
+    async def _send(self, batch: List[Tuple[bytes, asyncio.Future]]):
+        """Run one request on the vision pool and hand each caller its reply or the error"""
+        loop = asyncio.get_running_loop()
+        try:
+            replies = await loop.run_in_executor(
+                get_vision_executor(), self.request, [image_bytes for image_bytes, _ in batch]
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), reply in zip(batch, replies):
+            if not future.done():
+                future.set_result(reply)
+
+# Batchers shared by every ImageAnalyzer using the same Azure deployment
+_vision_batchers: Dict[Tuple[Optional[str], Optional[str]], VisionBatcher] = {}
+
+# Per-stage counters of the analysis cascade, shared by every ImageAnalyzer
+cascade_stats: Dict[str, Dict] = {}
+
+def record_stage(stage: str, found_signal: bool, elapsed: float):
+    """Record one run of a cascade stage"""
+    stats = cascade_stats.setdefault(stage, {'runs': 0, 'hits': 0, 'seconds': 0.0})
+    stats['runs'] += 1
+    stats['hits'] += int(found_signal)
+    stats['seconds'] += elapsed
+
+def get_cascade_stats() -> Dict[str, Dict]:
+    """Get runs, hit rate and average time per cascade stage"""
+    return {
+        stage: {
+            'runs': stats['runs'],
+            'hits': stats['hits'],
+            'hit_rate': stats['hits'] / stats['runs'] if stats['runs'] else 0.0,
+            'avg_seconds': stats['seconds'] / stats['runs'] if stats['runs'] else 0.0,
+        }
+        for stage, stats in cascade_stats.items()
+    }
+
+# Lookup table mapping grayscale pixels to black or white
+BINARIZE_TABLE = [0] * 128 + [255] * 128
+
+def load_image(image_bytes: bytes, max_edge: int) -> Image.Image:
+    """
+    Decode an image no larger than max_edge on its longest side
+    
+    JPEGs are decoded directly at a reduced scale (draft mode), so large
+    screenshots are never fully decompressed just to be shrunk.
+    
+    Args:
+        image_bytes: The image file as bytes
+        max_edge: Maximum width/height in pixels
+        
+    Returns:
+        Decoded PIL image
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    image.draft('RGB', (max_edge, max_edge))
+    image.thumbnail((max_edge, max_edge))
+    return image
+
+def prepare_for_vision(image_bytes: bytes) -> Tuple[bytes, str]:
+    """
+    Downscale and re-encode an image for the vision model
+    
+    Args:
+        image_bytes: The image file as bytes
+        
+    Returns:
+        (image bytes, MIME type); the original bytes are kept if re-encoding
+        does not make them smaller
+    """
+    try:
+        original_format = Image.open(io.BytesIO(image_bytes)).format
+        original_mime = Image.MIME.get(original_format, 'image/jpeg')
+        
+        image = load_image(image_bytes, Config.IMAGE_MAX_EDGE)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        
+        buffer = io.BytesIO()
+        image.save(buffer, format=Config.IMAGE_ENCODE_FORMAT, quality=Config.IMAGE_ENCODE_QUALITY)
+        encoded = buffer.getvalue()
+        if len(encoded) < len(image_bytes):
+            return encoded, Image.MIME.get(Config.IMAGE_ENCODE_FORMAT.upper(), 'image/jpeg')
+        return image_bytes, original_mime
+    except Exception as e:
+        print(f"Image preprocessing failed, sending original: {str(e)}")
+        return image_bytes, 'image/jpeg'
+
+def prepare_for_ocr(image_bytes: bytes) -> Image.Image:
+    """
+    Produce a downscaled, grayscale, binarized image for Tesseract
+    
+    Dark-theme screenshots are inverted so text always ends up black on white.
+    
+    Args:
+        image_bytes: The image file as bytes
+        
+    Returns:
+        Black and white PIL image
+    """
+    image = load_image(image_bytes, Config.IMAGE_OCR_MAX_EDGE).convert('L')
+    image = ImageOps.autocontrast(image)
+    if ImageStat.Stat(image).mean[0] < 128:
+        image = ImageOps.invert(image)
+    return image.point(BINARIZE_TABLE)
+
+def extract_text_with_ocr(image_bytes: bytes) -> Optional[str]:
+    """
+    Extract text from image using OCR (Tesseract)
+    
+    Args:
+        image_bytes: The image file as bytes
+        
+    Returns:
+        Extracted text or None if OCR fails
+    """
+    if not TESSERACT_AVAILABLE:
+        print("Warning: pytesseract not available. Install it for OCR support.")
+        return None
+    
+    try:
+        # Decode, shrink and binarize the image
+        image = prepare_for_ocr(image_bytes)
+        
+        # Extract text using OCR
+        text = pytesseract.image_to_string(image)
+        return text
+    except Exception as e:
+        print(f"OCR extraction failed: {str(e)}")
+        return None
+
+def extract_text_with_confidence(image_bytes: bytes) -> Tuple[Optional[str], float]:
+    """
+    Extract text from image using OCR, with Tesseract's confidence
+    
+    Args:
+        image_bytes: The image file as bytes
+        
+    Returns:
+        (extracted text or None, mean word confidence from 0 to 100)
+    """
+    if not TESSERACT_AVAILABLE:
+        print("Warning: pytesseract not available. Install it for OCR support.")
+        return None, 0.0
+    
+    try:
+        image = prepare_for_ocr(image_bytes)
+        data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+    except Exception as e:
+        print(f"OCR extraction failed: {str(e)}")
+        return None, 0.0
+    
+    # Rebuild the text line by line; words with confidence -1 are layout boxes
+    lines: Dict[Tuple[int, int, int], List[str]] = {}
+    confidences = []
+    for i, word in enumerate(data['text']):
+        confidence = float(data['conf'][i])
+        if confidence < 0 or not word.strip():
+            continue
+        line = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+        lines.setdefault(line, []).append(word)
+        confidences.append(confidence)
+    
+    if not confidences:
+        return None, 0.0
+    text = '\n'.join(' '.join(words) for words in lines.values())
+    return text, sum(confidences) / len(confidences)
 
 class ImageAnalyzer:
     """Analyze images to extract trading signals"""
     
-    def __init__(self, azure_endpoint: Optional[str] = None, azure_api_key: Optional[str] = None, azure_deployment: Optional[str] = None):
+    def __init__(self, azure_endpoint: Optional[str] = None, azure_api_key: Optional[str] = None, azure_deployment: Optional[str] = None, cascade: Optional[str] = None):
         self.text_parser = TradingSignalParser()
+        # Stages tried in order until one yields a valid signal
+        self.cascade = [stage.strip() for stage in (cascade or Config.ANALYSIS_CASCADE).split(',') if stage.strip()]
         self.azure_endpoint = azure_endpoint
         self.azure_api_key = azure_api_key
         self.azure_deployment = azure_deployment
@@ -30,7 +407,9 @@ class ImageAnalyzer:
             self.openai_client = AzureOpenAI(
                 azure_endpoint=azure_endpoint,
                 api_key=azure_api_key,
-                api_version="2025-01-01-preview"
+                api_version="2025-01-01-preview",
+                # Retries are handled by the shared rate limiter
+                max_retries=0
             )
             self.use_openai = True
         else:
@@ -39,7 +418,7 @@ class ImageAnalyzer:
     
     def analyze_image_with_ocr(self, image_bytes: bytes) -> Optional[str]:
         """
-        Extract text from image using OCR (Tesseract)
+        Extract text from image using OCR (Tesseract) in the warm worker pool
         
         Args:
             image_bytes: The image file as bytes
@@ -47,20 +426,108 @@ class ImageAnalyzer:
         Returns:
             Extracted text or None if OCR fails
         """
-        if not TESSERACT_AVAILABLE:
-            print("Warning: pytesseract not available. Install it for OCR support.")
+        try:
+            text, _ = get_ocr_pool().extract_sync(image_bytes)
+        except OcrFailed:
             return None
+        return text
+    
+    def _vision_image_part(self, image_bytes: bytes) -> Dict:
+        """Build the image_url content part for one image"""
+        import base64
         
-        try:
-            # Open image from bytes
-            image = Image.open(io.BytesIO(image_bytes))
+        # Shrink the upload, then encode it to base64
+        upload_bytes, mime_type = prepare_for_vision(image_bytes)
+        base64_image = base64.b64encode(upload_bytes).decode('utf-8')
+        return {
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:{mime_type};base64,{base64_image}"
+            }
+        }
+    
+    def request_vision(self, images: List[bytes]) -> List[Optional[str]]:
+        """
+        Send one or more images to the vision model in a single request
+        
+        Several images share one request with a prompt asking for one
+        IMAGE block per image; the reply is split back per image. Images
+        whose block is missing from the reply are retried on their own.
+        
+        The call goes through the process-wide rate limiter, which waits
+        for RPM/TPM quota and retries throttled or transient failures.
+        
+        Args:
+            images: Image files as bytes
             
-            # Extract text using OCR
-            text = pytesseract.image_to_string(image)
-            return text
-        except Exception as e:
-            print(f"OCR extraction failed: {str(e)}")
+        Returns:
+            Model reply for each image (None if vision is not configured)
+            
+        Raises:
+            RateLimitExceeded: If the call still failed after all retries
+            Exception: Any non-retryable API error
+        """
+        if not self.use_openai or not images:
+            return [None] * len(images)
+        
+        if len(images) == 1:
+            prompt = VISION_PROMPT
+        else:
+            prompt = VISION_BATCH_PROMPT.format(count=len(images)) + VISION_PROMPT
+        reply = self._vision_completion(prompt, images, VISION_MAX_OUTPUT_TOKENS * len(images))
+        
+        if len(images) == 1:
+            return [reply]
+        
+        replies = split_batch_reply(reply, len(images))
+        for i, image_reply in enumerate(replies):
+            if image_reply is None:
+                replies[i] = self.request_vision([images[i]])[0]
+        return replies
+    
+    def request_vision_album(self, images: List[bytes]) -> Optional[str]:
+        """
+        Send all images of one album in a single request for one combined answer
+        
+        Unlike request_vision, the model sees the images as parts of the
+        same post, so a chart in one part and the levels in another make
+        up one signal.
+        
+        Args:
+            images: Image files as bytes
+            
+        Returns:
+            Model reply for the whole album (None if vision is not configured)
+            
+        Raises:
+            RateLimitExceeded: If the call still failed after all retries
+            Exception: Any non-retryable API error
+        """
+        if not self.use_openai or not images:
             return None
+        
+        prompt = VISION_ALBUM_PROMPT.format(count=len(images)) + VISION_PROMPT
+        return self._vision_completion(prompt, images, VISION_MAX_OUTPUT_TOKENS)
+    
+    def _vision_completion(self, prompt: str, images: List[bytes], max_tokens: int) -> str:
+        """Make one vision chat completion through the rate limiter"""
+        content = [{"type": "text", "text": prompt}]
+        content.extend(self._vision_image_part(image_bytes) for image_bytes in images)
+        
+        # Call Azure OpenAI Vision API
+        response = get_rate_limiter().call(
+            lambda: self.openai_client.chat.completions.create(
+                model=self.azure_deployment,
+                messages=[{"role": "user", "content": content}],
+                max_tokens=max_tokens
+            ),
+            estimated_tokens=VISION_PROMPT_TOKENS + VISION_IMAGE_TOKENS * len(images) + max_tokens
+        )
+        return response.choices[0].message.content
+    
+    def _signal_from_vision_reply(self, reply: Optional[str]) -> Optional[Dict]:
+        """Extract a signal from the vision model's reply; trade results yield None"""
+        return self.text_parser.parse_vision_reply(reply)
     
     def analyze_image_with_openai(self, image_bytes: bytes) -> Optional[Dict]:
         """
@@ -76,85 +543,35 @@ class ImageAnalyzer:
             return None
         
         try:
-            import base64
-            
-            # Encode image to base64
-            base64_image = base64.b64encode(image_bytes).decode('utf-8')
-            
-            # Call Azure OpenAI Vision API
-            response = self.openai_client.chat.completions.create(
-                model=self.azure_deployment,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": """You are a trading signal analyzer. Carefully examine this image and determine:
-
-1. **INTENT**: Is this a TRADING SIGNAL (future trade setup) or a TRADE RESULT (past trade outcome)?
-   - Trading signals have: entry zones, pending orders, future setup indicators, "wait for", "looking for"
-   - Trade results have: profit/loss amounts, "closed", "hit TP", equity changes, completed trades
-   
-2. **ONLY extract signals if this is a TRADING SIGNAL (pre-trade setup)**. Ignore trade results.
-
-3. If this IS a trading signal, extract:
-   - Action: BUY/SELL/LONG/SHORT (look at text, arrows, or chart patterns)
-   - Instrument: The trading pair/symbol (EURUSD, XAUUSD, BTCUSDT, etc.)
-   - Entry Price: The exact entry price or zone (look for "Entry", "Buy at", "Sell at", price levels)
-   - Stop Loss (SL): The stop loss level (may be marked with red line, "SL:", or below entry for buy/above for sell)
-   - Take Profit (TP): All target levels (TP1, TP2, TP3, or marked zones on chart)
-
-4. **Look at drawings/annotations**: 
-   - Lines, arrows, boxes indicating entry zones
-   - Red lines often = Stop Loss
-   - Green lines often = Take Profit
-   - Horizontal lines with prices
-   - Text annotations
-
-5. **Respond ONLY if this is a trading signal**. Use this exact format:
-
-SIGNAL_TYPE: [TRADE_SIGNAL or TRADE_RESULT]
-ACTION: [BUY/SELL/LONG/SHORT or N/A]
-INSTRUMENT: [exact symbol like EURUSD, XAUUSD, etc. or N/A]
-ENTRY: [exact price number or N/A]
-SL: [exact price number or N/A]
-TP: [comma-separated prices like 1.2000, 1.2100 or N/A]
-
-If SIGNAL_TYPE is TRADE_RESULT, respond with:
-SIGNAL_TYPE: TRADE_RESULT
-ACTION: N/A
-INSTRUMENT: N/A
-ENTRY: N/A
-SL: N/A
-TP: N/A
-
-Be precise with numbers. Extract exact prices from the image."""
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=800
-            )
-            
-            # Parse the response
-            content = response.choices[0].message.content
-            return self.text_parser.parse_message(content)
-            
+            return self._signal_from_vision_reply(self.request_vision([image_bytes])[0])
         except Exception as e:
             print(f"OpenAI Vision analysis failed: {str(e)}")
             return None
     
+    def lookup_cached(self, image_bytes: bytes):
+        """
+        Look the image up in the content-hash cache
+        
+        Args:
+            image_bytes: The image file as bytes
+            
+        Returns:
+            (image_hash, hit, signal); image_hash is None if the image could not be hashed
+        """
+        image_hash = compute_content_hash(image_bytes)
+        if image_hash is None:
+            return None, False, None
+        hit, signal = image_hash_cache.lookup(image_hash)
+        return image_hash, hit, signal
+    
     def analyze_image(self, image_bytes: bytes) -> Optional[Dict]:
         """
         Analyze an image to extract trading signals
-        Tries OpenAI first, then falls back to OCR
+        Reuses the result for a previously seen identical image,
+        otherwise runs the OCR/vision stages in cascade order. Results are
+        not cached when the vision call failed, so the image is analyzed
+        again next time instead of being remembered as "no signal".
+        Blocks until done; from a coroutine use analyze_image_async.
         
         Args:
             image_bytes: The image file as bytes
@@ -162,17 +579,251 @@ Be precise with numbers. Extract exact prices from the image."""
         Returns:
             Trading signal dictionary or None
         """
-        # Try OpenAI Vision first if available
+        image_hash, hit, signal = self.lookup_cached(image_bytes)
+        if hit:
+            return signal
+        
+        signal, complete = self._analyze_uncached(image_bytes)
+        if image_hash is not None and complete:
+            image_hash_cache.store(image_hash, signal)
+        return signal
+    
+    def _signal_from_ocr(self, text: Optional[str], confidence: float) -> Optional[Dict]:
+        """Parse OCR output, accepting it only if it is confident and valid"""
+        if not text or confidence < Config.OCR_MIN_CONFIDENCE:
+            return None
+        signal = self.text_parser.parse_message(text)
+        if signal and self.text_parser.validate_signal(signal):
+            signal['confidence'] = round(confidence / 100, 2)
+            return signal
+        return None
+    
+    def _analyze_uncached(self, image_bytes: bytes) -> Tuple[Optional[Dict], bool]:
+        """
+        Run the image stages of the cascade, blocking until they finish
+        
+        Runs its own event loop, so it must not be called from a coroutine;
+        use _analyze_uncached_async there.
+        
+        Returns:
+            (signal, complete) like _run_cascade
+        """
+        async def ocr():
+            return self._signal_from_ocr(*get_ocr_pool().extract_sync(image_bytes))
+        
+        async def vision():
+            return self._signal_from_vision_reply(self.request_vision([image_bytes])[0])
+        
+        return asyncio.run(self._run_cascade(ocr, vision))
+    
+    async def _run_cascade(self, ocr: Callable[[], Awaitable[Optional[Dict]]], vision: Callable[[], Awaitable[Optional[Dict]]]) -> Tuple[Optional[Dict], bool]:
+        """
+        Run the image stages of the cascade (OCR, vision) in the configured order
+        
+        Args:
+            ocr: Coroutine function returning the OCR stage's signal; raises
+                OcrFailed if the image could not be read
+            vision: Coroutine function returning the vision stage's signal;
+                any exception it raises counts as a failed call
+        
+        Returns:
+            (signal, complete) where complete is False if a stage failed
+            rather than finding no signal
+        """
+        stages = {'ocr': ocr}
         if self.use_openai:
-            signal = self.analyze_image_with_openai(image_bytes)
-            if signal and self.text_parser.validate_signal(signal):
-                return signal
+            stages['vision'] = vision
         
-        # Fall back to OCR
-        extracted_text = self.analyze_image_with_ocr(image_bytes)
-        if extracted_text:
-            signal = self.text_parser.parse_message(extracted_text)
-            if signal and self.text_parser.validate_signal(signal):
-                return signal
+        complete = True
+        for stage in self.cascade:
+            run = stages.get(stage)
+            if run is None:
+                continue
+            start = time.perf_counter()
+            try:
+                signal = await run()
+            except OcrFailed:
+                signal = None
+                complete = False
+            except Exception as e:
+                if stage != 'vision':
+                    raise
+                print(f"OpenAI Vision analysis failed: {str(e)}")
+                signal = None
+                complete = False
+            if signal and not self.text_parser.validate_signal(signal):
+                signal = None
+            record_stage(stage, signal is not None, time.perf_counter() - start)
+            if signal:
+                return signal, True
         
-        return None
+        return None, complete
+    
+    async def analyze_image_async(self, image_bytes: bytes) -> Optional[Dict]:
+        """
+        Analyze an image without blocking the event loop
+        
+        Same cascade as analyze_image, but hashing and the vision call run
+        on the shared thread pool and OCR on the shared process pool, so
+        other channels keep processing messages meanwhile.
+        
+        Args:
+            image_bytes: The image file as bytes
+            
+        Returns:
+            Trading signal dictionary or None
+        """
+        signal, _ = await self._analyze_image_async(image_bytes)
+        return signal
+    
+    async def _analyze_image_async(self, image_bytes: bytes) -> Tuple[Optional[Dict], bool]:
+        """Cached async analysis returning (signal, complete) like _analyze_uncached"""
+        loop = asyncio.get_running_loop()
+        
+        # Hashing and cache I/O use the default executor so they are not
+        # queued behind throttled vision calls
+        image_hash, hit, signal = await loop.run_in_executor(None, self.lookup_cached, image_bytes)
+        if hit:
+            return signal, True
+        
+        signal, complete = await self._analyze_uncached_async(image_bytes)
+        if image_hash is not None and complete:
+            await loop.run_in_executor(None, image_hash_cache.store, image_hash, signal)
+        return signal, complete
+    
+    async def _analyze_uncached_async(self, image_bytes: bytes) -> Tuple[Optional[Dict], bool]:
+        """Run the image stages of the cascade using the shared pools"""
+        async def ocr():
+            return self._signal_from_ocr(*await (await get_ocr_pool_async()).extract(image_bytes))
+        
+        async def vision():
+            return self._signal_from_vision_reply(await self._get_vision_batcher().submit(image_bytes))
+        
+        return await self._run_cascade(ocr, vision)
+    
+    def _get_vision_batcher(self) -> VisionBatcher:
+        """Get the batcher shared by analyzers using this Azure deployment"""
+        key = (self.azure_endpoint, self.azure_deployment)
+        if key not in _vision_batchers:
+            _vision_batchers[key] = VisionBatcher(
+                self.request_vision,
+                max_batch=Config.VISION_BATCH_SIZE,
+                window=Config.VISION_BATCH_WINDOW_MS / 1000
+            )
+        return _vision_batchers[key]
+    
+    async def analyze_media_async(self, caption: Optional[str], fetch_image: Callable[[], Awaitable[Optional[bytes]]], media_key: Optional[str] = None) -> Tuple[Optional[Dict], bool]:
+        """
+        Analyze a media message, cheapest stage first
+        
+        If the cascade includes "caption", the caption is parsed before
+        anything is downloaded. Otherwise a previous result for the same
+        Telegram file is reused, and only then is the image fetched and
+        run through the OCR/vision stages.
+        
+        Args:
+            caption: Text sent with the media, if any
+            fetch_image: Coroutine function that downloads the image bytes
+            media_key: Key from signal_cache.media_key, if the media has one
+            
+        Returns:
+            (signal or None, complete) where complete is False if a stage
+            failed rather than finding no signal, so the message is worth
+            analyzing again later
+        """
+        signal = self._signal_from_caption(caption)
+        if signal:
+            return signal, True
+        
+        if media_key:
+            hit, signal = signal_cache.get(media_key)
+            if hit:
+                return signal, True
+        
+        image_bytes = await fetch_image()
+        if not image_bytes:
+            return None, True
+        
+        signal, complete = await self._analyze_image_async(image_bytes)
+        if media_key and complete:
+            signal_cache.put(media_key, signal)
+        return signal, complete
+    
+    async def analyze_album_async(self, caption: Optional[str], fetch_images: Callable[[], Awaitable[List[Optional[bytes]]]], album_key: Optional[str] = None) -> Tuple[Optional[Dict], bool]:
+        """
+        Analyze the parts of an album as one post
+        
+        The caption (carried by only one part) is parsed once; then OCR
+        runs on every image and the recognized text is parsed together,
+        and vision gets all images in one request for one combined answer.
+        
+        Args:
+            caption: The album's caption, if any
+            fetch_images: Coroutine function that downloads every part's image
+            album_key: Key from signal_cache.album_key, if every part has one
+            
+        Returns:
+            (signal or None, complete) like analyze_media_async
+        """
+        signal = self._signal_from_caption(caption)
+        if signal:
+            return signal, True
+        
+        if album_key:
+            hit, signal = signal_cache.get(album_key)
+            if hit:
+                return signal, True
+        
+        images = [image_bytes for image_bytes in await fetch_images() if image_bytes]
+        if not images:
+            return None, True
+        
+        if len(images) == 1:
+            signal, complete = await self._analyze_image_async(images[0])
+        else:
+            signal, complete = await self._analyze_album_uncached_async(images)
+        if album_key and complete:
+            signal_cache.put(album_key, signal)
+        return signal, complete
+    
+    async def _analyze_album_uncached_async(self, images: List[bytes]) -> Tuple[Optional[Dict], bool]:
+        """Run the image stages of the cascade over all of an album's images at once"""
+        async def ocr():
+            ocr_pool = await get_ocr_pool_async()
+            results = await asyncio.gather(
+                *(ocr_pool.extract(image_bytes) for image_bytes in images), return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, BaseException) and not isinstance(result, OcrFailed):
+                    raise result
+            failed = [result for result in results if isinstance(result, OcrFailed)]
+            read = [result for result in results if not isinstance(result, OcrFailed)]
+            texts = [(text, confidence) for text, confidence in read if text and confidence >= Config.OCR_MIN_CONFIDENCE]
+            signal = None
+            if texts:
+                signal = self._signal_from_ocr(
+                    '\n'.join(text for text, _ in texts), min(confidence for _, confidence in texts)
+                )
+            if signal is None and failed:
+                # The images that could not be read may hold the signal
+                raise failed[0]
+            return signal
+        
+        async def vision():
+            loop = asyncio.get_running_loop()
+            return self._signal_from_vision_reply(
+                await loop.run_in_executor(get_vision_executor(), self.request_vision_album, images)
+            )
+        
+        return await self._run_cascade(ocr, vision)
+    
+    def _signal_from_caption(self, caption: Optional[str]) -> Optional[Dict]:
+        """Run the caption stage, if the cascade has one"""
+        if 'caption' not in self.cascade or not caption:
+            return None
+        start = time.perf_counter()
+        signal = self.text_parser.parse_message(caption)
+        if signal and not self.text_parser.validate_signal(signal):
+            signal = None
+        record_stage('caption', signal is not None, time.perf_counter() - start)
+        return signal
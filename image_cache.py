@@ -0,0 +1,162 @@
+"""
+Content-hash cache of image analysis results
+"""
+import copy
+import hashlib
+import io
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from PIL import Image
+from config import Config
+from database import SessionLocal, engine, ImageAnalysisCache
+
+logger = logging.getLogger(__name__)
+
+# Longest edge the image is decoded at before hashing
+HASH_EDGE = 256
+
+# How often expired entries are purged from memory and the database
+EVICTION_INTERVAL = timedelta(hours=1)
+
+def compute_content_hash(image_bytes: bytes, max_edge: int = HASH_EDGE) -> Optional[str]:
+    """
+    Compute an exact hash of an image's decoded pixels
+    
+    The image is decoded at a reduced size and the SHA-256 of its RGB pixels
+    is taken, so the same picture re-sent with different metadata or
+    container still matches while any change to its content, such as BUY
+    vs SELL or a different price on an otherwise identical card, does not.
+    
+    Args:
+        image_bytes: The image file as bytes
+        max_edge: Longest edge of the decoded image that is hashed
+    
+    Returns:
+        Hex digest, or None if the image cannot be decoded
+    """
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        # Let the JPEG decoder downscale while decoding
+        image.draft('RGB', (max_edge, max_edge))
+        image = image.convert('RGB')
+        image.thumbnail((max_edge, max_edge))
+        pixels = image.tobytes()
+    except Exception as e:
+        logger.warning(f"Could not hash image: {str(e)}")
+        return None
+    
+    digest = hashlib.sha256(f"{image.width}x{image.height}:".encode())
+    digest.update(pixels)
+    return digest.hexdigest()
+
+class ImageHashCache:
+    """Persistent cache of image analysis results keyed by content hash"""
+    
+    def __init__(self, ttl: timedelta = timedelta(days=7)):
+        """
+        Initialize the cache
+        
+        Args:
+            ttl: How long a stored result stays valid
+        """
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: Optional[Dict[str, Tuple[Optional[Dict], datetime]]] = None
+        self._last_eviction = datetime.utcnow()
+        self._lock = threading.Lock()
+    
+    def _load(self):
+        """Load unexpired entries from the database on first use"""
+        if self._entries is not None:
+            return
+        
+        self._entries = {}
+        try:
+            ImageAnalysisCache.__table__.create(bind=engine, checkfirst=True)
+            db = SessionLocal()
+            cutoff = datetime.utcnow() - self.ttl
+            db.query(ImageAnalysisCache).filter(ImageAnalysisCache.created_at < cutoff).delete()
+            db.commit()
+            for row in db.query(ImageAnalysisCache).all():
+                self._entries[row.content_hash] = (row.result, row.created_at)
+            db.close()
+            logger.info(f"Loaded {len(self._entries)} cached image analyses")
+        except Exception as e:
+            logger.warning(f"Could not load image analysis cache: {str(e)}")
+    
+    def lookup(self, content_hash: str) -> Tuple[bool, Optional[Dict]]:
+        """
+        Find the result for a previously analyzed identical image
+        
+        Args:
+            content_hash: Hash from compute_content_hash
+        
+        Returns:
+            (hit, signal) where signal is None if the matching image held no signal
+        """
+        with self._lock:
+            self._load()
+            entry = self._entries.get(content_hash)
+            if entry is None or entry[1] < datetime.utcnow() - self.ttl:
+                self.misses += 1
+                return False, None
+            
+            self.hits += 1
+            return True, copy.deepcopy(entry[0])
+    
+    def store(self, content_hash: str, signal: Optional[Dict]):
+        """
+        Remember the analysis result for an image
+        
+        Args:
+            content_hash: Hash from compute_content_hash
+            signal: Extracted signal or None
+        """
+        now = datetime.utcnow()
+        with self._lock:
+            self._load()
+            if content_hash in self._entries:
+                return
+            self._entries[content_hash] = (signal, now)
+            try:
+                db = SessionLocal()
+                db.add(ImageAnalysisCache(content_hash=content_hash, result=signal, created_at=now))
+                db.commit()
+                db.close()
+            except Exception as e:
+                logger.warning(f"Could not persist image analysis: {str(e)}")
+            
+            if now - self._last_eviction >= EVICTION_INTERVAL:
+                self._evict_expired(now)
+    
+    def _evict_expired(self, now: datetime):
+        """Drop entries older than the TTL from memory and the database"""
+        self._last_eviction = now
+        cutoff = now - self.ttl
+        self._entries = {
+            content_hash: entry for content_hash, entry in self._entries.items()
+            if entry[1] >= cutoff
+        }
+        try:
+            db = SessionLocal()
+            db.query(ImageAnalysisCache).filter(ImageAnalysisCache.created_at < cutoff).delete()
+            db.commit()
+            db.close()
+        except Exception as e:
+            logger.warning(f"Could not evict expired image analyses: {str(e)}")
+    
+    def stats(self) -> Dict:
+        """Get hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self._entries or {}),
+        }
+
+# Global cache shared by every ImageAnalyzer in the process
+image_hash_cache = ImageHashCache(ttl=timedelta(hours=Config.IMAGE_CACHE_TTL_HOURS))
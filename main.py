@@ -6,11 +6,18 @@ Monitors a Telegram group for trading signals and stores them in Supabase
 
 import asyncio
 from datetime import datetime
+from typing import Optional, Tuple
 from config import Config
 from telegram_client import TelegramGroupMonitor
 from text_parser import TradingSignalParser
-from image_analyzer import ImageAnalyzer
-from supabase_client import SupabaseClient
+from image_analyzer import ImageAnalyzer, shutdown_executors, get_cascade_stats, start_ocr_pool
+from supabase_writer import get_supabase_writer, close_supabase_writer
+from signal_cache import signal_cache
+from rate_limiter import get_rate_limiter
+from checkpoints import AnalysisRetries, CheckpointTracker, SeenMessages, channel_id_for
+from backfill import StreamingBackfill, iterate
+from albums import caption_part, group_albums
+from catch_up import CatchUp, GapWatcher, sequential_ids
 
 class TradingSignalBot:
     """Main bot class that coordinates all components"""
@@ -33,52 +40,89 @@ class TradingSignalBot:
             azure_deployment=Config.AZURE_OPENAI_DEPLOYMENT
         )
         
-        self.supabase_client = SupabaseClient(
-            url=Config.SUPABASE_URL,
-            key=Config.SUPABASE_KEY,
-            table_name=Config.SUPABASE_TABLE
-        )
+        # Signals are stored locally and synced to Supabase in the background
+        self.supabase_writer = get_supabase_writer()
+        self.supabase_client = self.supabase_writer.client
+        
+        # Newest processed message, kept in telegram_channels across restarts
+        self.checkpoint: Optional[CheckpointTracker] = None
+        self.retries: Optional[AnalysisRetries] = None
+        # Messages processed already, so re-reads skip analysis
+        self.seen = SeenMessages()
+        # Newest message id covered by the startup backfill, and its progress
+        self._backfill_until = 0
+        self.backfill: Optional[StreamingBackfill] = None
+        # Fetches messages missed while updates were not arriving
+        self.catch_up: Optional[CatchUp] = None
+        self.gap_watcher = GapWatcher(interval=Config.CATCHUP_PROBE_SECONDS)
         
         print("\n" + "="*60)
         print("TELEGRAM TO SUPABASE TRADING BOT")
         print("="*60 + "\n")
     
-    async def process_message(self, event):
+    async def handle_new_message(self, parts):
+        """Process a live message or album unless the startup backfill already covers it"""
+        if parts[-1].id <= self._backfill_until:
+            return
+        for message in parts:
+            self.checkpoint.begin(message.id)
+        try:
+            await self.process_message(parts)
+        finally:
+            for message in parts:
+                self.checkpoint.done(message.id)
+    
+    async def submit_catch_up(self, parts):
+        """Queue a message missed during an outage, apart from live messages"""
+        await self.telegram_monitor.pipeline.submit(('catch-up', parts[0].chat_id), self.handle_new_message, parts)
+    
+    async def process_message(self, parts):
         """
         Process a new message from the Telegram group
         
         Args:
-            event: Telegram message event
+            parts: The message, or every part of an album (analyzed as one post)
         """
-        message = event.message
+        if self.seen.known(parts):
+            print(f"ℹ️  Message #{parts[0].id} was processed already, skipping")
+            return
+        
+        message = caption_part(parts)
+        media_count = sum(1 for part in parts if part.media)
         
         print(f"\n{'='*60}")
         print(f"New message received at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"{'='*60}")
         
         signal = None
+        complete = True
         
-        # Check if message has media (image)
-        if message.media:
-            print("📷 Message contains media, analyzing image...")
-            
-            # Download the media
-            media_bytes = await self.telegram_monitor.download_media(message)
+        # Check if message has media (images)
+        if media_count > 1:
+            print(f"📷 Album of {media_count} images, analyzing caption and images as one post...")
+        elif media_count:
+            print("📷 Message contains media, analyzing caption and image...")
+        if media_count:
+            signal, complete = await self.analyze_media(parts)
             
-            if media_bytes:
-                # Analyze the image
-                signal = self.image_analyzer.analyze_image(media_bytes)
-                
-                if signal:
-                    print(f"✓ Signal extracted from image")
+            if signal:
+                print(f"✓ Signal extracted from media message")
         
         # If no signal from image, try to parse text
         if not signal and message.text:
             print("📝 Analyzing text message...")
-            signal = self.text_parser.parse_message(message.text)
+            text_key = signal_cache.text_key(message.text)
+            hit, signal = signal_cache.get(text_key)
+            if not hit:
+                signal = self.text_parser.parse_message(message.text)
+                signal_cache.put(text_key, signal)
+            elif signal:
+                signal['raw_text'] = message.text
             
             if signal:
                 print(f"✓ Signal extracted from text")
+        # A failed image stage only matters if nothing else was found
+        complete = complete or signal is not None
         
         # If we have a valid signal, store it in Supabase
         if signal and self.text_parser.validate_signal(signal):
@@ -94,61 +138,172 @@ class TradingSignalBot:
             print(f"   Stop Loss: {signal.get('stop_loss')}")
             print(f"   Take Profits: {signal.get('take_profits')}")
             
-            # Insert into Supabase
-            result = self.supabase_client.insert_signal(signal)
-            
-            if result:
-                print(f"✓ Signal stored in Supabase (ID: {result.get('id')})")
+            # Store locally; synced to Supabase in the background
+            if self.save_signal(signal):
+                print("✓ Signal stored, syncing to Supabase")
             else:
-                print("✗ Failed to store signal in Supabase")
+                print("ℹ️  Signal not stored (already stored, or the local write failed)")
+        elif not complete:
+            self.retry_later(parts)
         else:
             print("ℹ️  No valid trading signal found in this message")
         
+        if complete:
+            self.seen.add(parts)
         print(f"{'='*60}\n")
     
+    def retry_later(self, parts):
+        """Analyze a message whose image analysis failed again after a backoff, holding the checkpoint below it meanwhile"""
+        if self.retries.schedule(parts):
+            print(f"⚠️  Analysis of message #{parts[0].id} failed, it will be retried shortly")
+        else:
+            print(f"✗ Analysis of message #{parts[0].id} failed {self.retries.attempts + 1} times, giving up on it")
+    
+    def save_signal(self, signal: dict) -> bool:
+        """Commit a signal to the local outbox, keyed on the group's Telegram id"""
+        return self.supabase_writer.save(
+            signal,
+            channel_id=self.telegram_monitor.peer_id,
+            channel_name=self.telegram_monitor.group_title or Config.TELEGRAM_GROUP_USERNAME
+        )
+    
+    async def analyze_media(self, parts) -> Tuple[Optional[dict], bool]:
+        """
+        Run the caption/OCR/vision cascade over a message's or album's images
+        
+        Forwarded images that were analyzed before are not downloaded again.
+        
+        Args:
+            parts: The message, or every part of an album
+            
+        Returns:
+            (signal or None, complete) as from ImageAnalyzer.analyze_media_async
+        """
+        caption = caption_part(parts).text
+        media_parts = [part for part in parts if part.media]
+        if len(media_parts) > 1:
+            return await self.image_analyzer.analyze_album_async(
+                caption=caption,
+                fetch_images=lambda: asyncio.gather(*(self.telegram_monitor.download_media(part) for part in media_parts)),
+                album_key=signal_cache.album_key(part.media for part in media_parts)
+            )
+        return await self.image_analyzer.analyze_media_async(
+            caption=caption,
+            fetch_image=lambda: self.telegram_monitor.download_media(media_parts[0]),
+            media_key=signal_cache.media_key(media_parts[0].media)
+        )
+    
     async def process_historical_messages(self, limit: int = 100):
         """
-        Process historical messages from the group
+        Process the messages posted since the last run
+        
+        Only the gap after the checkpoint is fetched, streamed oldest first;
+        without a checkpoint (first run) the last `limit` messages are
+        processed. Messages are analyzed BACKFILL_CONCURRENCY at a time and
+        stored in message order.
         
         Args:
-            limit: Number of recent messages to process
+            limit: Number of recent messages to process on the first run
         """
-        print(f"\n📚 Processing {limit} recent messages from the group...")
-        print("="*60)
+        # Hold the checkpoint until the whole gap is processed
+        self.checkpoint.paused = True
         
-        messages = await self.telegram_monitor.get_recent_messages(limit=limit)
+        latest = await self.telegram_monitor.get_recent_messages(limit=1)
+        self._backfill_until = latest[0].id if latest else 0
+        self.catch_up.last_seen = max(self.catch_up.last_seen, self._backfill_until)
+        
+        if not latest:
+            messages = iterate([])
+            first_id = 0
+        elif self.checkpoint.saved is None:
+            print(f"\n📚 Processing {limit} recent messages from the group...")
+            recent = await self.telegram_monitor.get_recent_messages(limit=limit)
+            messages = iterate(reversed(recent))
+            first_id = recent[-1].id - 1 if recent else 0
+        else:
+            print(f"\n📚 Processing messages since #{self.checkpoint.saved} from the group...")
+            messages = self.telegram_monitor.iter_messages(
+                min_id=self.checkpoint.saved, max_id=self._backfill_until + 1
+            )
+            first_id = self.checkpoint.saved
+        print("="*60)
         
-        processed_count = 0
         signal_count = 0
         
-        for message in reversed(messages):  # Process oldest first
+        async def analyze(parts, text_signal):
+            for message in parts:
+                self.checkpoint.begin(message.id)
+            if self.seen.known(parts):
+                return None
             signal = None
+            complete = True
             
             # Check for media
-            if message.media:
-                media_bytes = await self.telegram_monitor.download_media(message)
-                if media_bytes:
-                    signal = self.image_analyzer.analyze_image(media_bytes)
-            
-            # Check for text
-            if not signal and message.text:
-                signal = self.text_parser.parse_message(message.text)
+            if any(part.media for part in parts):
+                signal, complete = await self.analyze_media(parts)
             
+            # Fall back to the text parsed in bulk for the batch
+            signal = signal or text_signal
+            return signal, complete or signal is not None
+        
+        def commit(parts, result):
+            nonlocal signal_count
+            signal, complete = result or (None, True)
+            message = caption_part(parts)
             # Store valid signals
             if signal and self.text_parser.validate_signal(signal):
                 signal['message_id'] = message.id
                 signal['message_date'] = message.date.isoformat()
                 
-                result = self.supabase_client.insert_signal(signal)
-                if result:
+                if self.save_signal(signal):
                     signal_count += 1
                     print(f"✓ Signal {signal_count}: {signal.get('action')} {signal.get('instrument')}")
-            
-            processed_count += 1
+            if complete:
+                self.seen.add(parts)
+            else:
+                self.retry_later(parts)
+            for part in parts:
+                self.checkpoint.done(part.id)
+        
+        def report(progress):
+            if progress['done']:
+                return
+            eta = f", ETA {progress['eta_seconds']:.0f}s" if progress['eta_seconds'] is not None else ""
+            print(f"… {progress['processed']} messages ({progress['percent']}%), {progress['rate']:.1f} msg/s{eta}")
+        
+        self.backfill = StreamingBackfill(
+            concurrency=Config.BACKFILL_CONCURRENCY,
+            batch_size=Config.BACKFILL_BATCH_SIZE,
+            on_progress=report,
+            failed_result=(None, False)
+        )
+        await self.backfill.run(
+            group_albums(messages),
+            analyze,
+            commit,
+            parse_batch=lambda batch: self.text_parser.parse_many(caption_part(parts).text for parts in batch),
+            first_id=first_id,
+            last_id=self._backfill_until
+        )
+        
+        self.checkpoint.paused = False
+        self.checkpoint.flush()
+        
+        progress = self.backfill.progress()
+        # Sync the last partial batch before reporting
+        await self.supabase_writer.flush()
         
         print(f"\n{'='*60}")
-        print(f"✓ Processed {processed_count} messages")
+        print(f"✓ Processed {progress['processed']} messages in {progress['elapsed_seconds']:.1f}s")
         print(f"✓ Found {signal_count} trading signals")
+        for stage, stats in get_cascade_stats().items():
+            print(f"  {stage}: {stats['runs']} runs, {stats['hit_rate']:.0%} hits, {stats['avg_seconds']:.2f}s avg")
+        limiter_stats = get_rate_limiter().stats()
+        if limiter_stats['throttled'] or limiter_stats['failures']:
+            print(f"  Azure OpenAI: {limiter_stats['throttled']} throttled, {limiter_stats['retries']} retries, {limiter_stats['failures']} failed")
+        sync_stats = self.supabase_writer.stats()
+        if sync_stats['pending'] or sync_stats['parked']:
+            print(f"  Supabase sync: {sync_stats['pending']} pending ({sync_stats['lag_seconds']:.0f}s behind), {sync_stats['parked']} rejected")
         print(f"{'='*60}\n")
     
     async def start(self, process_history: bool = True, history_limit: int = 100):
@@ -163,18 +318,43 @@ class TradingSignalBot:
             # Print table creation SQL
             self.supabase_client.create_table_if_not_exists()
             
+            # Sync signals left in the outbox by earlier runs
+            self.supabase_writer.start()
+            await start_ocr_pool()
+            
             # Start Telegram client
             await self.telegram_monitor.start()
             
             # Join the group
             await self.telegram_monitor.join_group(Config.TELEGRAM_GROUP_USERNAME)
+            self.checkpoint = CheckpointTracker(channel_id_for(
+                Config.TELEGRAM_GROUP_USERNAME, self.telegram_monitor.group_title
+            ))
+            self.seen.load(self.telegram_monitor.peer_id)
+            self.retries = AnalysisRetries(
+                self.checkpoint,
+                self.process_message,
+                attempts=Config.ANALYSIS_RETRY_ATTEMPTS,
+                delay=Config.ANALYSIS_RETRY_SECONDS
+            )
+            self.catch_up = CatchUp(
+                fetch=self.telegram_monitor.iter_messages,
+                submit=self.submit_catch_up,
+                checkpoint=self.checkpoint,
+                detect_jumps=sequential_ids(self.telegram_monitor.group_entity)
+            )
+            self.telegram_monitor.catch_up = self.catch_up
+            
+            # Register message handler for new messages first, so nothing
+            # posted while the history is processed is missed
+            self.telegram_monitor.register_message_handler(self.handle_new_message)
             
-            # Process historical messages if requested
+            # Process messages missed since the last run if requested
             if process_history:
                 await self.process_historical_messages(limit=history_limit)
             
-            # Register message handler for new messages
-            self.telegram_monitor.register_message_handler(self.process_message)
+            # Probe for messages lost while Telegram was reconnecting
+            self.gap_watcher.watch(self.telegram_monitor.client, self.telegram_monitor.group_entity, self.catch_up)
             
             # Run until disconnected
             await self.telegram_monitor.run_until_disconnected()
@@ -184,7 +364,14 @@ class TradingSignalBot:
         except Exception as e:
             print(f"\n✗ Error: {str(e)}")
         finally:
+            await self.gap_watcher.stop()
+            if self.catch_up is not None:
+                await self.catch_up.stop()
+            if self.retries is not None:
+                await self.retries.stop()
             await self.telegram_monitor.disconnect()
+            await close_supabase_writer()
+            shutdown_executors()
 
 async def main():
     """Main entry point"""
@@ -0,0 +1,158 @@
+"""
+Media download policy: which media to fetch, at what size, and how much at once
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, List, NamedTuple, Optional
+from telethon.tl.types import (
+    MessageMediaPhoto, MessageMediaDocument, PhotoSize, PhotoSizeProgressive,
+    DocumentAttributeImageSize,
+)
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class MediaChoice(NamedTuple):
+    """What to download for a message's media"""
+    thumb: Optional[object]  # PhotoSize to fetch, or None for the whole file
+    size: int                # Expected size in bytes
+
+def _photo_size_bytes(photo_size) -> int:
+    """Byte size of a PhotoSize (progressive sizes list every scan)"""
+    if isinstance(photo_size, PhotoSizeProgressive):
+        return max(photo_size.sizes)
+    return photo_size.size
+
+def pick_photo_size(sizes: List, min_edge: int):
+    """
+    Pick the smallest photo size that is still large enough to read
+
+    Stripped/cached inline previews and vector outlines are ignored.
+
+    Args:
+        sizes: Photo.sizes or Document.thumbs
+        min_edge: Longest edge in pixels the analysis needs
+
+    Returns:
+        The smallest size whose longest edge reaches min_edge, the largest
+        size if none does, or None if there is no downloadable size
+    """
+    candidates = [size for size in sizes if isinstance(size, (PhotoSize, PhotoSizeProgressive))]
+    if not candidates:
+        return None
+    candidates.sort(key=lambda size: max(size.w, size.h))
+    for size in candidates:
+        if max(size.w, size.h) >= min_edge:
+            return size
+    return candidates[-1]
+
+def select_media(media) -> Optional[MediaChoice]:
+    """
+    Decide what to download for message media, using only its metadata
+
+    Photos are fetched at the smallest adequate PhotoSize. Documents are
+    only fetched if their MIME type is an image and they fit the size and
+    pixel caps; an adequate thumbnail is preferred over the full file.
+    Anything else (video, PDFs, stickers, web pages...) is skipped.
+
+    Args:
+        media: message.media
+
+    Returns:
+        MediaChoice, or None if the media should not be downloaded
+    """
+    if isinstance(media, MessageMediaPhoto):
+        photo_size = pick_photo_size(getattr(media.photo, 'sizes', None) or [], Config.MEDIA_MIN_EDGE)
+        if photo_size is None:
+            return None
+        return MediaChoice(photo_size, _photo_size_bytes(photo_size))
+
+    if isinstance(media, MessageMediaDocument):
+        document = media.document
+        mime_type = getattr(document, 'mime_type', None) or ''
+        if not mime_type.startswith('image/'):
+            logger.debug(f"Skipping {mime_type or 'unknown'} document")
+            return None
+
+        for attribute in document.attributes:
+            if isinstance(attribute, DocumentAttributeImageSize) and attribute.w * attribute.h > Config.MEDIA_MAX_PIXELS:
+                logger.debug(f"Skipping {attribute.w}x{attribute.h} image document")
+                return None
+
+        thumb = pick_photo_size(document.thumbs or [], Config.MEDIA_MIN_EDGE)
+        if thumb is not None and max(thumb.w, thumb.h) >= Config.MEDIA_MIN_EDGE:
+            return MediaChoice(thumb, _photo_size_bytes(thumb))
+
+        if document.size > Config.MEDIA_MAX_BYTES:
+            logger.debug(f"Skipping {document.size} byte image document")
+            return None
+        return MediaChoice(None, document.size)
+
+    return None
+
+class DownloadBudget:
+    """Cap on the bytes of media being downloaded at once across the process"""
+
+    def __init__(self, max_bytes: int):
+        """
+        Args:
+            max_bytes: Total expected size of downloads allowed in flight
+        """
+        self.max_bytes = max_bytes
+        self.in_use = 0
+        self.peak = 0
+        self.waits = 0
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def reserve(self, size: int):
+        """
+        Hold size bytes of the budget, waiting until they are free
+
+        A file larger than the whole budget reserves all of it, so it runs
+        alone instead of waiting forever.
+        """
+        size = min(size, self.max_bytes)
+        async with self._condition:
+            if self.in_use + size > self.max_bytes:
+                self.waits += 1
+            await self._condition.wait_for(lambda: self.in_use + size <= self.max_bytes)
+            self.in_use += size
+            self.peak = max(self.peak, self.in_use)
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_use -= size
+                self._condition.notify_all()
+
+    def stats(self) -> Dict:
+        """Get current and peak reserved bytes and how often downloads waited"""
+        return {
+            'in_use': self.in_use,
+            'peak': self.peak,
+            'waits': self.waits,
+            'max_bytes': self.max_bytes,
+        }
+
+# Global budget shared by every monitor in the process
+download_budget = DownloadBudget(max_bytes=Config.MEDIA_MEMORY_BUDGET_MB * 1024 * 1024)
+
+async def download_image(client, media) -> Optional[bytes]:
+    """
+    Download the image in message media according to the policy
+
+    Args:
+        client: Connected TelegramClient
+        media: message.media
+
+    Returns:
+        Image bytes, or None if the media is not an image worth analyzing
+    """
+    choice = select_media(media)
+    if choice is None:
+        return None
+
+    async with download_budget.reserve(choice.size):
+        return await client.download_media(media, file=bytes, thumb=choice.thumb)
@@ -0,0 +1,137 @@
+"""
+Bounded work queue between Telegram update handlers and signal processing
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Any], Awaitable[None]]
+
+class MessagePipeline:
+    """
+    Staged processing of incoming messages
+
+    Update handlers only enqueue the event and return; a pool of worker
+    tasks does the slow part (download, OCR/vision, parsing, storage).
+    Each channel has its own bounded asyncio.Queue, which is where
+    backpressure applies: a flooding channel waits for room in its own
+    queue without holding up the others. Workers take channels in
+    round-robin order, one message at a time, so a busy channel cannot
+    starve a quiet one.
+    """
+
+    def __init__(self, workers: int = 4, max_per_channel: int = 100):
+        """
+        Args:
+            workers: Number of concurrent processing tasks
+            max_per_channel: Queued messages per channel before submit waits
+        """
+        self.workers = workers
+        self.max_per_channel = max_per_channel
+        self.queues: Dict[Hashable, "asyncio.Queue[Tuple[Handler, Any, float]]"] = {}
+        # Channels with queued messages, in the order workers will serve them
+        self._ready: Deque[Hashable] = deque()
+        self._available = asyncio.Semaphore(0)
+        self._tasks: List[asyncio.Task] = []
+
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.blocked = 0
+        self.peak_depth = 0
+        self.wait_seconds = 0.0
+        self.process_seconds = 0.0
+
+    def start(self):
+        """Start the worker tasks (must be called from the running event loop)"""
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"pipeline-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def submit(self, channel: Hashable, handler: Handler, event: Any):
+        """
+        Queue a message for processing, waiting while its channel's queue is full
+
+        Args:
+            channel: Key messages are grouped by for fairness, e.g. the chat id
+            handler: Coroutine function that processes the event
+            event: The NewMessage event (or anything with .message)
+        """
+        queue = self.queues.get(channel)
+        if queue is None:
+            queue = self.queues[channel] = asyncio.Queue(maxsize=self.max_per_channel)
+        if queue.full():
+            self.blocked += 1
+        await queue.put((handler, event, time.monotonic()))
+
+        self.enqueued += 1
+        self.peak_depth = max(self.peak_depth, self.depth())
+        if queue.qsize() == 1:
+            self._ready.append(channel)
+        self._available.release()
+
+    async def _worker(self):
+        """Process one message at a time, taking channels in turn"""
+        while True:
+            await self._available.acquire()
+            channel = self._ready.popleft()
+            queue = self.queues[channel]
+            handler, event, enqueued_at = queue.get_nowait()
+            if not queue.empty():
+                self._ready.append(channel)
+
+            start = time.monotonic()
+            self.wait_seconds += start - enqueued_at
+            try:
+                await handler(event)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error processing queued message: {str(e)}")
+            finally:
+                self.processed += 1
+                self.process_seconds += time.monotonic() - start
+                queue.task_done()
+
+    def depth(self) -> int:
+        """Messages currently queued across all channels"""
+        return sum(queue.qsize() for queue in self.queues.values())
+
+    async def join(self):
+        """Wait until every queued message has been processed"""
+        for queue in list(self.queues.values()):
+            await queue.join()
+
+    async def stop(self, drain: bool = True):
+        """
+        Stop the workers
+
+        Args:
+            drain: Finish the queued messages first
+        """
+        if drain and self._tasks:
+            await self.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> Dict:
+        """Get queue depth, throughput and latency counters"""
+        return {
+            'depth': self.depth(),
+            'peak_depth': self.peak_depth,
+            'channel_depths': {channel: queue.qsize() for channel, queue in self.queues.items() if queue.qsize()},
+            'enqueued': self.enqueued,
+            'processed': self.processed,
+            'failed': self.failed,
+            'blocked': self.blocked,
+            'avg_wait_seconds': self.wait_seconds / self.processed if self.processed else 0.0,
+            'avg_process_seconds': self.process_seconds / self.processed if self.processed else 0.0,
+        }
@@ -0,0 +1,241 @@
+"""
+Pool of long-lived OCR worker processes
+"""
+import asyncio
+import logging
+import multiprocessing
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+class OcrFailed(Exception):
+    """A worker died or hung on an image, so it was not read (unlike an image without text)"""
+
+def _ocr_with_engine(engine, image_bytes: bytes) -> Tuple[Optional[str], float]:
+    """Run OCR on one image with an already initialized tesserocr engine"""
+    from image_analyzer import prepare_for_ocr
+
+    try:
+        engine.SetImage(prepare_for_ocr(image_bytes))
+        text = engine.GetUTF8Text()
+        confidence = float(engine.MeanTextConf())
+    except Exception as e:
+        print(f"OCR extraction failed: {str(e)}")
+        return None, 0.0
+    if not text.strip():
+        return None, 0.0
+    return text, confidence
+
+def _worker_main(conn, language: str):
+    """
+    OCR worker process: load the engine once, then answer requests
+
+    Requests are ("ocr", image_bytes) or ("ping",); None stops the worker.
+    Without tesserocr each request falls back to pytesseract, which still
+    starts tesseract per image but keeps Python and Pillow warm.
+    """
+    from image_analyzer import extract_text_with_confidence
+
+    engine = tesserocr.PyTessBaseAPI(lang=language) if TESSEROCR_AVAILABLE else None
+    conn.send('ready')
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            break
+        if request is None:
+            break
+        if request[0] == 'ping':
+            conn.send('pong')
+        elif engine is not None:
+            conn.send(_ocr_with_engine(engine, request[1]))
+        else:
+            conn.send(extract_text_with_confidence(request[1]))
+    if engine is not None:
+        engine.End()
+
+class OcrWorker:
+    """One OCR worker process and the pipe to it"""
+
+    def __init__(self, context, language: str):
+        self.context = context
+        self.language = language
+        self.process = None
+        self.conn = None
+        self.ready = False
+        self.last_used = time.monotonic()
+        self.start()
+
+    def start(self):
+        """Start the worker process"""
+        parent_conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(
+            target=_worker_main, args=(child_conn, self.language), name="ocr-worker", daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.ready = False
+
+    def stop(self):
+        """Ask the worker to exit, killing it if it does not"""
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+    def restart(self):
+        """Replace the worker process with a fresh one"""
+        self.stop()
+        self.start()
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def request(self, message: Tuple, timeout: float):
+        """
+        Send one request and wait for the reply
+
+        Raises:
+            TimeoutError: If the worker does not answer in time
+            EOFError, OSError: If the worker died
+        """
+        if not self.ready:
+            # Loading the engine happens once, on the first request
+            if not self.conn.poll(timeout):
+                raise TimeoutError("OCR worker did not start")
+            self.conn.recv()
+            self.ready = True
+
+        self.conn.send(message)
+        if not self.conn.poll(timeout):
+            raise TimeoutError("OCR worker did not answer")
+        self.last_used = time.monotonic()
+        return self.conn.recv()
+
+class OcrWorkerPool:
+    """
+    Long-lived OCR workers fed over pipes
+
+    Each worker process loads the OCR engine once and then handles one
+    image at a time. A worker that died, hung past the timeout or fails a
+    health check (a ping after sitting idle) is restarted, so one bad image
+    cannot take OCR down for the rest of the process.
+    """
+
+    def __init__(self, size: int, timeout: float = 30.0, health_check_interval: float = 60.0, language: str = 'eng'):
+        """
+        Args:
+            size: Number of worker processes
+            timeout: Seconds to wait for one image before restarting the worker
+            health_check_interval: Idle seconds after which a worker is pinged before use
+            language: Tesseract language
+        """
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.restarts = 0
+        self.failures = 0
+
+        # One thread per worker waits on that worker's pipe
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="ocr")
+        self._idle: "queue.Queue[OcrWorker]" = queue.Queue()
+        self.workers: List[OcrWorker] = []
+        try:
+            # Spawn rather than fork: the pool is created from a threaded
+            # process, and restarts happen on the executor threads
+            context = multiprocessing.get_context('spawn')
+            for _ in range(size):
+                worker = OcrWorker(context, language)
+                self.workers.append(worker)
+                self._idle.put(worker)
+        except (OSError, NotImplementedError) as e:
+            # Some sandboxes cannot create processes; OCR then runs in the threads
+            print(f"Warning: OCR worker processes unavailable ({str(e)}), using threads")
+            for worker in self.workers:
+                worker.stop()
+            self.workers = []
+
+        if self.workers and not TESSEROCR_AVAILABLE:
+            logger.warning("tesserocr is not installed, so OCR starts a tesseract process for every "
+                           "image; pip install tesserocr to keep the engine loaded in the workers")
+
+    async def extract(self, image_bytes: bytes) -> Tuple[Optional[str], float]:
+        """
+        Run OCR on an image in the next free worker
+
+        Args:
+            image_bytes: The image file as bytes
+
+        Returns:
+            (extracted text or None, mean word confidence from 0 to 100)
+            
+        Raises:
+            OcrFailed: If the worker died or timed out (it is restarted)
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.extract_sync, image_bytes)
+
+    def extract_sync(self, image_bytes: bytes) -> Tuple[Optional[str], float]:
+        """Blocking version of extract: wait for a free worker, run one image, hand the worker back"""
+        if not self.workers:
+            from image_analyzer import extract_text_with_confidence
+            return extract_text_with_confidence(image_bytes)
+
+        worker = self._idle.get()
+        try:
+            self._check_health(worker)
+            return worker.request(('ocr', image_bytes), self.timeout)
+        except (TimeoutError, EOFError, OSError) as e:
+            logger.warning(f"OCR worker failed ({str(e) or type(e).__name__}), restarting it")
+            self.failures += 1
+            self._restart(worker)
+            raise OcrFailed(str(e) or type(e).__name__) from e
+        finally:
+            self._idle.put(worker)
+
+    def _check_health(self, worker: OcrWorker):
+        """Restart a worker that died, or that does not answer a ping after idling"""
+        if not worker.is_alive():
+            logger.warning("OCR worker died, restarting it")
+            self._restart(worker)
+        elif worker.ready and time.monotonic() - worker.last_used > self.health_check_interval:
+            try:
+                worker.request(('ping',), self.timeout)
+            except (TimeoutError, EOFError, OSError):
+                logger.warning("OCR worker failed its health check, restarting it")
+                self._restart(worker)
+
+    def _restart(self, worker: OcrWorker):
+        worker.restart()
+        self.restarts += 1
+
+    def shutdown(self):
+        """Stop all workers"""
+        for worker in self.workers:
+            worker.stop()
+        self.workers = []
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict:
+        """Get pool size, restarts and failed images"""
+        return {
+            'size': len(self.workers),
+            'engine': 'tesserocr' if TESSEROCR_AVAILABLE else 'pytesseract',
+            'restarts': self.restarts,
+            'failures': self.failures,
+        }
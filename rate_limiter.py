@@ -0,0 +1,196 @@
+"""
+Rate limiting and retry for Azure OpenAI calls shared across the process
+"""
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional, TypeVar
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# HTTP statuses worth retrying: throttling and transient server errors
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# Client errors that carry no status code but are worth retrying
+RETRYABLE_ERRORS = {'APIConnectionError', 'APITimeoutError'}
+
+class RateLimitExceeded(Exception):
+    """Raised when a call still fails after all retries"""
+
+class TokenBucket:
+    """Token bucket refilled continuously at a per-minute rate"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.fill_rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self, now: float, scale: float):
+        """Add the tokens earned since the last refill, at scale times the normal rate"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate * scale)
+        self.updated = now
+
+    def wait_time(self, amount: float, scale: float) -> float:
+        """Seconds until amount tokens are available (amount is capped at capacity)"""
+        missing = min(amount, self.capacity) - self.tokens
+        if missing <= 0:
+            return 0.0
+        return missing / (self.fill_rate * scale)
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limiter with adaptive backoff
+
+    Blocking, so it is meant to be used from the vision worker threads.
+    Every ImageAnalyzer in the process shares one instance, so the limits
+    apply to the deployment as a whole rather than per channel.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, max_in_flight: int, max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+        """
+        Args:
+            requests_per_minute: Deployment RPM quota
+            tokens_per_minute: Deployment TPM quota
+            max_in_flight: Maximum concurrent requests
+            max_retries: Retries after a throttled or transient failure
+            base_delay: First backoff delay in seconds
+            max_delay: Longest backoff delay in seconds
+        """
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        # Fraction of the quota currently used; cut on 429s, restored on success
+        self.rate_scale = 1.0
+        # Monotonic time before which nobody may send (from Retry-After)
+        self.paused_until = 0.0
+
+        self.throttled = 0
+        self.retries = 0
+        self.failures = 0
+
+        self._lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    def _acquire(self, estimated_tokens: int):
+        """Block until one request and estimated_tokens fit in the buckets"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.requests.refill(now, self.rate_scale)
+                self.tokens.refill(now, self.rate_scale)
+                wait = max(
+                    self.paused_until - now,
+                    self.requests.wait_time(1, self.rate_scale),
+                    self.tokens.wait_time(estimated_tokens, self.rate_scale),
+                )
+                if wait <= 0:
+                    self.requests.tokens -= 1
+                    self.tokens.tokens -= estimated_tokens
+                    return
+            time.sleep(wait)
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """Delay before the next attempt: Retry-After if given, else exponential backoff with jitter"""
+        response = getattr(error, 'response', None)
+        headers = getattr(response, 'headers', None) or {}
+        try:
+            if headers.get('retry-after-ms'):
+                return float(headers['retry-after-ms']) / 1000
+            if headers.get('retry-after'):
+                return float(headers['retry-after'])
+        except (TypeError, ValueError):
+            pass
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        """Whether an OpenAI client error is throttling or transient"""
+        if getattr(error, 'status_code', None) in RETRYABLE_STATUSES:
+            return True
+        return type(error).__name__ in RETRYABLE_ERRORS
+
+    def call(self, request: Callable[[], T], estimated_tokens: int) -> T:
+        """
+        Run a request within the limits, retrying throttled and transient failures
+
+        Args:
+            request: Function making one API call; its result may carry usage.total_tokens
+            estimated_tokens: Tokens the call is expected to use (prompt + images + max output)
+
+        Returns:
+            The request's result
+
+        Raises:
+            RateLimitExceeded: If the call still fails after max_retries retries
+        """
+        for attempt in range(self.max_retries + 1):
+            self._acquire(estimated_tokens)
+            with self._in_flight:
+                try:
+                    result = request()
+                except Exception as e:
+                    if not self.is_retryable(e):
+                        raise
+                    error = e
+                else:
+                    self._on_success(result, estimated_tokens)
+                    return result
+
+            delay = self._retry_delay(error, attempt)
+            self._on_throttle(error, delay)
+            if attempt < self.max_retries:
+                self.retries += 1
+                logger.warning(f"Azure OpenAI call failed ({str(error)}), retrying in {delay:.1f}s")
+
+        self.failures += 1
+        raise RateLimitExceeded(f"Azure OpenAI call failed after {self.max_retries} retries: {str(error)}")
+
+    def _on_success(self, result, estimated_tokens: int):
+        """Settle actual token usage and slowly restore the rate"""
+        usage = getattr(getattr(result, 'usage', None), 'total_tokens', None)
+        with self._lock:
+            if usage is not None:
+                self.tokens.tokens += estimated_tokens - usage
+            self.rate_scale = min(1.0, self.rate_scale + 0.05)
+
+    def _on_throttle(self, error: Exception, delay: float):
+        """Pause everyone for delay and halve the rate after a 429"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+            if getattr(error, 'status_code', None) == 429:
+                self.throttled += 1
+                self.rate_scale = max(0.1, self.rate_scale / 2)
+
+    def stats(self) -> Dict:
+        """Get throttling counters and the current rate scale"""
+        return {
+            'throttled': self.throttled,
+            'retries': self.retries,
+            'failures': self.failures,
+            'rate_scale': self.rate_scale,
+        }
+
+_rate_limiter: Optional[RateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+def get_rate_limiter() -> RateLimiter:
+    """Get the process-wide Azure OpenAI rate limiter"""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter(
+                requests_per_minute=Config.AZURE_OPENAI_RPM,
+                tokens_per_minute=Config.AZURE_OPENAI_TPM,
+                max_in_flight=Config.AZURE_OPENAI_MAX_IN_FLIGHT,
+                max_retries=Config.AZURE_OPENAI_MAX_RETRIES,
+            )
+        return _rate_limiter
@@ -0,0 +1,203 @@
+"""
+Keeps the running channel monitors in line with the channels marked active
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Tuple
+from sqlalchemy import create_engine, func
+from sqlalchemy.pool import NullPool
+from supabase_database import SessionLocal, Channel, CHANNEL_STATE_NOTIFY, listen_url
+from sharding import ShardCoordinator
+
+logger = logging.getLogger(__name__)
+
+class ChannelReconciler:
+    """
+    Start and stop monitors so they match Channel.is_active
+
+    The API only records the desired state. Changes are noticed through
+    LISTEN/NOTIFY on PostgreSQL, or on SQLite by polling a fingerprint of
+    the state_version column (one aggregate query); the active channels are
+    then read and the difference applied to the ChannelManager. A full
+    reconcile also runs every `resync_interval`, covering lost notifications
+    and monitors that stopped on an error.
+
+    With a ShardCoordinator, only the active channels whose lease this
+    worker holds are run, and the reconcile doubles as the lease heartbeat.
+    """
+
+    def __init__(self, manager, poll_interval: float = 0.5, resync_interval: float = 30.0, shard: Optional[ShardCoordinator] = None):
+        """
+        Args:
+            manager: ChannelManager whose monitors are started and stopped
+            poll_interval: Seconds between state_version polls when not listening
+            resync_interval: Seconds between full reconciles without any change
+            shard: Lease coordinator when running as one of several workers
+        """
+        self.manager = manager
+        self.poll_interval = poll_interval
+        self.shard = shard
+        self.resync_interval = min(resync_interval, shard.heartbeat_interval) if shard else resync_interval
+        self.listening = False
+        self.reconciles = 0
+        self.started = 0
+        self.stopped = 0
+        self._listen_engine = None
+        self._listen_conn = None
+        self._wake = asyncio.Event()
+
+    def _listen(self) -> bool:
+        """Open a dedicated connection that LISTENs for channel changes; False if not possible"""
+        url = listen_url()
+        if url is None:
+            return False
+        try:
+            # Outside the shared pool, and direct even when queries go
+            # through the transaction pooler
+            self._listen_engine = create_engine(url, poolclass=NullPool)
+            conn = self._listen_engine.raw_connection()
+            driver = conn.driver_connection
+            driver.autocommit = True
+            with driver.cursor() as cursor:
+                cursor.execute(f"LISTEN {CHANNEL_STATE_NOTIFY}")
+            self._listen_conn = conn
+            return True
+        except Exception as e:
+            logger.warning(f"Could not LISTEN for channel changes, polling instead: {str(e)}")
+            if self._listen_engine is not None:
+                self._listen_engine.dispose()
+                self._listen_engine = None
+            return False
+
+    def _on_notify(self):
+        """Drain notifications from the LISTEN connection and wake the loop"""
+        driver = self._listen_conn.driver_connection
+        try:
+            driver.poll()
+        except Exception as e:
+            logger.warning(f"LISTEN connection lost, polling channel state instead: {str(e)}")
+            self._stop_listening()
+            self._wake.set()
+            return
+        if driver.notifies:
+            driver.notifies.clear()
+            self._wake.set()
+
+    def _stop_listening(self):
+        """Close the LISTEN connection and fall back to polling"""
+        if self._listen_conn is None:
+            return
+        try:
+            asyncio.get_running_loop().remove_reader(self._listen_conn.driver_connection.fileno())
+            self._listen_conn.close()
+            self._listen_engine.dispose()
+        except Exception:
+            pass
+        self._listen_conn = None
+        self._listen_engine = None
+        self.listening = False
+
+    def _fingerprint(self) -> Tuple[int, int]:
+        """Count and state_version sum of all channels; changes on every start, stop, add and delete"""
+        db = SessionLocal()
+        try:
+            count, versions = db.query(func.count(Channel.id), func.coalesce(func.sum(Channel.state_version), 0)).one()
+            return count, versions
+        finally:
+            db.close()
+
+    def _desired(self) -> Dict[int, Tuple[str, str]]:
+        """Active channels: id -> (username, name)"""
+        db = SessionLocal()
+        try:
+            rows = db.query(Channel.id, Channel.username, Channel.name).filter(Channel.is_active == True).all()
+            return {channel_id: (username, name) for channel_id, username, name in rows}
+        finally:
+            db.close()
+
+    async def reconcile(self):
+        """Stop monitors of inactive channels and start (or restart) the active ones"""
+        loop = asyncio.get_running_loop()
+        desired = await loop.run_in_executor(None, self._desired)
+        if self.shard is not None:
+            desired = await self.shard.claim(desired)
+        self.reconciles += 1
+
+        for channel_id in list(self.manager.monitors):
+            task = self.manager.tasks.get(channel_id)
+            failed = task is not None and task.done()
+            if channel_id not in desired or failed:
+                await self.manager.stop_channel(channel_id)
+                self.stopped += 1
+
+        to_start = [
+            (channel_id, username, name)
+            for channel_id, (username, name) in desired.items()
+            if channel_id not in self.manager.monitors
+        ]
+        if to_start:
+            await self.manager.start_channels(to_start)
+            self.started += len(to_start)
+
+        if self.shard is not None:
+            await self.shard.release(self.manager.monitors)
+
+    async def _fence(self):
+        """Stop every monitor once our leases may have passed to other workers"""
+        if self.shard is None or not self.shard.lease_lost() or not self.manager.monitors:
+            return
+        logger.error(f"Leases of {self.shard.worker_id} could not be renewed; stopping its monitors")
+        for channel_id in list(self.manager.monitors):
+            await self.manager.stop_channel(channel_id)
+            self.stopped += 1
+
+    async def run(self):
+        """Reconcile now and then on every change until cancelled"""
+        loop = asyncio.get_running_loop()
+        self.listening = await loop.run_in_executor(None, self._listen)
+        if self.listening:
+            loop.add_reader(self._listen_conn.driver_connection.fileno(), self._on_notify)
+            logger.info(f"Listening for channel changes on '{CHANNEL_STATE_NOTIFY}'")
+            # Reconcile once right away
+            self._wake.set()
+
+        fingerprint: Optional[Tuple[int, int]] = None
+        last_reconcile = 0.0
+        try:
+            while True:
+                if self.listening:
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout=self.resync_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._wake.clear()
+                    changed = True
+                else:
+                    current = await loop.run_in_executor(None, self._fingerprint)
+                    changed = current != fingerprint or time.monotonic() - last_reconcile >= self.resync_interval
+                    fingerprint = current
+
+                if changed:
+                    try:
+                        await self.reconcile()
+                    except Exception as e:
+                        logger.error(f"Error reconciling channels: {str(e)}")
+                        await self._fence()
+                    last_reconcile = time.monotonic()
+
+                if not self.listening:
+                    await asyncio.sleep(self.poll_interval)
+        finally:
+            self._stop_listening()
+
+    def stats(self) -> Dict:
+        """Get how the reconciler is watching and what it has done"""
+        return {
+            'mode': 'listen' if self.listening else 'poll',
+            'reconciles': self.reconciles,
+            'started': self.started,
+            'stopped': self.stopped,
+            'monitors': len(self.manager.monitors),
+            'shard': self.shard.stats() if self.shard else None,
+        }
@@ -0,0 +1,218 @@
+"""
+Sharding of channels across worker processes and hosts through database leases
+"""
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import or_
+from sqlalchemy.dialects import postgresql, sqlite
+from supabase_database import SessionLocal, engine, ChannelLease, ChannelWorker
+
+logger = logging.getLogger(__name__)
+
+_schema_ready = False
+
+def _ensure_schema():
+    """Create the worker and lease tables once"""
+    global _schema_ready
+    if not _schema_ready:
+        ChannelWorker.__table__.create(bind=engine, checkfirst=True)
+        ChannelLease.__table__.create(bind=engine, checkfirst=True)
+        _schema_ready = True
+
+def _insert_lease(db, channel_id: int, worker_id: str, expires_at: datetime):
+    """Create a channel's lease unless another worker created it first"""
+    # ON CONFLICT instead of a savepoint: pysqlite's SAVEPOINT handling is broken
+    insert = postgresql.insert if engine.dialect.name == 'postgresql' else sqlite.insert
+    db.execute(
+        insert(ChannelLease.__table__)
+        .values(channel_id=channel_id, worker_id=worker_id, expires_at=expires_at)
+        .on_conflict_do_nothing(index_elements=['channel_id'])
+    )
+
+def default_worker_id() -> str:
+    """host-pid, unique per running worker"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def _hash(key: str) -> int:
+    """Stable 64-bit position on the ring (Python's hash() differs per process)"""
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+class HashRing:
+    """
+    Consistent hash ring of worker ids
+
+    Each worker is placed at `replicas` points; a channel belongs to the
+    first worker point at or after its own hash. Adding or removing a
+    worker only moves the channels next to its points.
+    """
+
+    def __init__(self, nodes: Iterable[str], replicas: int = 64):
+        """
+        Args:
+            nodes: Worker ids
+            replicas: Points per worker; more spreads channels more evenly
+        """
+        points: List[Tuple[int, str]] = sorted(
+            (_hash(f"{node}#{i}"), node) for node in set(nodes) for i in range(replicas)
+        )
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        """Worker a key is assigned to, or None if the ring is empty"""
+        if not self._hashes:
+            return None
+        i = bisect.bisect_left(self._hashes, _hash(key)) % len(self._hashes)
+        return self._nodes[i]
+
+class ShardCoordinator:
+    """
+    Decide which active channels this worker runs
+
+    Every heartbeat the worker records itself in channel_workers, builds
+    the hash ring from the workers seen within the lease TTL, and claims
+    the leases of the channels the ring assigns to it (from its second
+    heartbeat on, so workers starting together do not all grab everything). A lease is taken
+    only if it is free, expired or already ours, so a channel never has two
+    owners; it is released only after the channel's monitor has stopped.
+    A worker that could not renew its leases for a whole TTL stops all of
+    its monitors, since other workers may already have taken them over.
+    Only the checkpoint moves with a channel; see channel_worker for the
+    state that stays on each host.
+    """
+
+    def __init__(self, worker_id: Optional[str] = None, lease_ttl: float = 30.0, heartbeat_interval: float = 10.0):
+        """
+        Args:
+            worker_id: Unique id of this worker (default host-pid)
+            lease_ttl: Seconds a lease and a heartbeat stay valid
+            heartbeat_interval: Seconds between renewals; well below lease_ttl
+        """
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_ttl = timedelta(seconds=lease_ttl)
+        self.heartbeat_interval = heartbeat_interval
+        self.members: List[str] = []
+        self.claimed = 0
+        self.released = 0
+        self._last_renewed: Optional[float] = None
+
+    def _claim(self, channel_ids: Set[int]) -> Set[int]:
+        """Heartbeat, renew our leases and claim the assigned channels; returns the assigned channels we hold"""
+        _ensure_schema()
+        now = datetime.utcnow()
+        expires = now + self.lease_ttl
+        db = SessionLocal()
+        try:
+            worker = db.query(ChannelWorker).filter(ChannelWorker.worker_id == self.worker_id).first()
+            if worker is None:
+                db.add(ChannelWorker(worker_id=self.worker_id, heartbeat_at=now))
+            else:
+                worker.heartbeat_at = now
+            db.query(ChannelWorker).filter(
+                ChannelWorker.worker_id != self.worker_id,
+                ChannelWorker.heartbeat_at < now - self.lease_ttl
+            ).delete(synchronize_session=False)
+            db.commit()
+
+            if self._last_renewed is None:
+                # Announce ourselves first and claim from the next heartbeat,
+                # once workers starting together have all joined the ring
+                self._last_renewed = time.monotonic()
+                return set()
+
+            self.members = sorted(worker_id for (worker_id,) in db.query(ChannelWorker.worker_id).all())
+            ring = HashRing(self.members)
+            assigned = {channel_id for channel_id in channel_ids if ring.owner(str(channel_id)) == self.worker_id}
+
+            # Renew everything we hold, including channels about to be handed
+            # over, whose monitors are still running until released
+            db.query(ChannelLease).filter(ChannelLease.worker_id == self.worker_id).update(
+                {ChannelLease.expires_at: expires}, synchronize_session=False
+            )
+            for channel_id in assigned:
+                taken = db.query(ChannelLease).filter(
+                    ChannelLease.channel_id == channel_id,
+                    or_(ChannelLease.worker_id == self.worker_id, ChannelLease.expires_at < now)
+                ).update({ChannelLease.worker_id: self.worker_id, ChannelLease.expires_at: expires}, synchronize_session=False)
+                if not taken:
+                    # Left alone if held by another worker that has not released it yet
+                    _insert_lease(db, channel_id, self.worker_id, expires)
+            db.commit()
+
+            held = {
+                channel_id for (channel_id,) in
+                db.query(ChannelLease.channel_id).filter(ChannelLease.worker_id == self.worker_id).all()
+            }
+            self._last_renewed = time.monotonic()
+            return held & assigned
+        finally:
+            db.close()
+
+    def _release(self, running: Set[int]) -> int:
+        """Drop our leases of channels we are not running"""
+        db = SessionLocal()
+        try:
+            query = db.query(ChannelLease).filter(ChannelLease.worker_id == self.worker_id)
+            if running:
+                query = query.filter(ChannelLease.channel_id.notin_(running))
+            released = query.delete(synchronize_session=False)
+            db.commit()
+            return released
+        finally:
+            db.close()
+
+    def _leave(self):
+        """Remove this worker and its leases, handing its channels over at once"""
+        db = SessionLocal()
+        try:
+            db.query(ChannelLease).filter(ChannelLease.worker_id == self.worker_id).delete(synchronize_session=False)
+            db.query(ChannelWorker).filter(ChannelWorker.worker_id == self.worker_id).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def claim(self, desired: Dict[int, Tuple[str, str]]) -> Dict[int, Tuple[str, str]]:
+        """
+        Narrow the active channels down to the ones this worker should run
+
+        Args:
+            desired: Active channels, id -> (username, name)
+        """
+        loop = asyncio.get_running_loop()
+        owned = await loop.run_in_executor(None, self._claim, set(desired))
+        self.claimed = len(owned)
+        return {channel_id: desired[channel_id] for channel_id in owned}
+
+    async def release(self, running: Iterable[int]):
+        """Release the leases of channels whose monitors are no longer running"""
+        loop = asyncio.get_running_loop()
+        self.released += await loop.run_in_executor(None, self._release, set(running))
+
+    async def leave(self):
+        """Give up every lease on shutdown"""
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._leave)
+        except Exception as e:
+            logger.warning(f"Could not release leases of {self.worker_id}: {str(e)}")
+
+    def lease_lost(self) -> bool:
+        """True if the leases were not renewed for a whole TTL and may belong to others now"""
+        if self._last_renewed is None:
+            return False
+        return time.monotonic() - self._last_renewed > self.lease_ttl.total_seconds()
+
+    def stats(self) -> Dict:
+        """Get this worker's view of the shard"""
+        return {
+            'worker_id': self.worker_id,
+            'members': list(self.members),
+            'claimed': self.claimed,
+            'released': self.released,
+        }
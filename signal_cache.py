@@ -0,0 +1,110 @@
+"""
+Shared cache of signal extraction results for duplicated and forwarded messages
+"""
+import copy
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from config import Config
+
+class SignalCache:
+    """Bounded LRU cache of parse/analysis results keyed by message content"""
+    
+    def __init__(self, max_size: int = 10000):
+        """
+        Initialize the cache
+        
+        Args:
+            max_size: Maximum number of entries kept before evicting the least recently used
+        """
+        self.max_size = max_size
+        self.entries: "OrderedDict[str, Optional[Dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def text_key(text: str) -> str:
+        """
+        Build the cache key for a text message
+        
+        Only case is normalized away, since TradingSignalParser works on the
+        uppercased text; whitespace is kept ("STOP  LOSS" is not "STOP LOSS"
+        to the parser).
+        """
+        return 'text:' + hashlib.sha1(text.upper().encode('utf-8')).hexdigest()
+    
+    @staticmethod
+    def media_key(media) -> Optional[str]:
+        """
+        Build the cache key for message media
+        
+        Forwarded media keeps the id of the original Telegram file, so the
+        key is known before anything is downloaded.
+        
+        Returns:
+            Cache key, or None if the media has no file id
+        """
+        file = getattr(media, 'photo', None) or getattr(media, 'document', None)
+        file_id = getattr(file, 'id', None)
+        if file_id is None:
+            return None
+        return f"media:{file_id}"
+    
+    @staticmethod
+    def album_key(media_list) -> Optional[str]:
+        """
+        Build the cache key for the media of an album's parts
+        
+        Returns:
+            Cache key, or None if any part's media has no file id
+        """
+        keys = [SignalCache.media_key(media) for media in media_list]
+        if not keys or None in keys:
+            return None
+        return "album:" + ",".join(sorted(key.split(':', 1)[1] for key in keys))
+    
+    def get(self, key: str) -> Tuple[bool, Optional[Dict]]:
+        """
+        Look up a cached result
+        
+        Args:
+            key: Key from text_key or media_key
+        
+        Returns:
+            (hit, signal) where signal is a copy callers may modify, or None
+            if the content was seen before and held no signal
+        """
+        if key not in self.entries:
+            self.misses += 1
+            return False, None
+        
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return True, copy.deepcopy(self.entries[key])
+    
+    def put(self, key: str, signal: Optional[Dict]):
+        """
+        Store a result; None records that the content held no signal
+        
+        Args:
+            key: Key from text_key or media_key
+            signal: Extracted signal or None
+        """
+        self.entries[key] = copy.deepcopy(signal)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+    
+    def stats(self) -> Dict:
+        """Get hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self.entries),
+            'max_size': self.max_size,
+        }
+
+# Global cache shared by every monitor in the process
+signal_cache = SignalCache(max_size=Config.SIGNAL_CACHE_SIZE)
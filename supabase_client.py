@@ -1,4 +1,4 @@
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 import logging
 
@@ -7,6 +7,13 @@ logger = logging.getLogger(__name__)
 class SupabaseClient:
     """Client for interacting with Supabase database"""
     
+    # Unique key of the signals table; re-read messages are not stored twice
+    CONFLICT_KEY = 'channel_id,message_id'
+    
+    # Errors of a table created before that key: no unique index to upsert
+    # on (42P10), or no channel_id column (PGRST204, 42703)
+    UNKEYED_ERRORS = {'42P10', 'PGRST204', '42703'}
+    
     def __init__(self, url: str, key: str, table_name: str = 'trading_signals'):
         """
         Initialize Supabase client
@@ -20,6 +27,10 @@ class SupabaseClient:
         self.key = key
         self.table_name = table_name
         self.client = None
+        # Cleared once the table turns out to lack the (channel_id, message_id)
+        # key or the channel_id column; writes then fall back to plain inserts
+        self.keyed = True
+        self.has_channel_id = True
         
         try:
             from supabase import create_client
@@ -29,46 +40,137 @@ class SupabaseClient:
             logger.warning(f"Could not initialize Supabase client: {str(e)}")
             logger.warning("Signals will only be stored locally")
     
+    @staticmethod
+    def build_record(signal: Dict) -> Dict:
+        """
+        Convert a parsed signal into a row of the signals table
+        
+        Args:
+            signal: Dictionary containing trading signal data
+            
+        Returns:
+            Record ready to insert
+        """
+        return {
+            'action': signal.get('action'),
+            'instrument': signal.get('instrument'),
+            'entry_price': signal.get('entry_price'),
+            'stop_loss': signal.get('stop_loss'),
+            'take_profits': signal.get('take_profits', []),
+            'signal_type': signal.get('signal_type', 'unknown'),
+            'raw_text': signal.get('raw_text', ''),
+            'channel_id': signal.get('channel_id'),
+            'message_id': signal.get('message_id'),
+            'message_date': signal.get('message_date'),
+            'created_at': datetime.utcnow().isoformat(),
+            'processed': False
+        }
+    
     def insert_signal(self, signal: Dict) -> Optional[Dict]:
         """
-        Insert a trading signal into Supabase
+        Insert a trading signal into Supabase unless its message is stored already
         
         Args:
             signal: Dictionary containing trading signal data
             
         Returns:
-            Inserted record or None if failed
+            Inserted record or None if failed or already stored
         """
         if not self.client:
             logger.debug("Supabase client not available, skipping cloud sync")
             return None
             
         try:
-            # Prepare the record
-            record = {
-                'action': signal.get('action'),
-                'instrument': signal.get('instrument'),
-                'entry_price': signal.get('entry_price'),
-                'stop_loss': signal.get('stop_loss'),
-                'take_profits': signal.get('take_profits', []),
-                'signal_type': signal.get('signal_type', 'unknown'),
-                'raw_text': signal.get('raw_text', ''),
-                'message_id': signal.get('message_id'),
-                'message_date': signal.get('message_date'),
-                'created_at': datetime.utcnow().isoformat(),
-                'processed': False
-            }
-            
             # Insert into Supabase
-            response = self.client.table(self.table_name).insert(record).execute()
+            inserted = self.insert_records([self.build_record(signal)])
             
             logger.info(f"✓ Signal synced to Supabase: {signal.get('action')} {signal.get('instrument')}")
-            return response.data[0] if response.data else None
+            return inserted[0] if inserted else None
             
         except Exception as e:
             logger.error(f"✗ Error syncing signal to Supabase: {str(e)}")
             return None
     
+    def insert_records(self, records: List[Dict]) -> List[Dict]:
+        """
+        Insert several prepared records in one request, skipping messages stored already
+        
+        Args:
+            records: Rows built with build_record
+            
+        Returns:
+            Newly inserted records
+            
+        Raises:
+            Exception: Whatever the request failed with, so callers can retry
+        """
+        if not records:
+            return []
+        if self.keyed:
+            try:
+                response = self.client.table(self.table_name).upsert(
+                    records, on_conflict=self.CONFLICT_KEY, ignore_duplicates=True
+                ).execute()
+                return response.data or []
+            except Exception as e:
+                if not self._is_unkeyed(e):
+                    raise
+                self._fall_back(e)
+        if self.has_channel_id:
+            try:
+                response = self.client.table(self.table_name).insert(records).execute()
+                return response.data or []
+            except Exception as e:
+                if not self._is_unkeyed(e):
+                    raise
+                self._fall_back(e)
+        records = [{k: v for k, v in record.items() if k != 'channel_id'} for record in records]
+        response = self.client.table(self.table_name).insert(records).execute()
+        return response.data or []
+    
+    def _is_unkeyed(self, error: Exception) -> bool:
+        """Whether an error means the table predates the (channel_id, message_id) key"""
+        code = getattr(error, 'code', None)
+        if code not in self.UNKEYED_ERRORS:
+            return False
+        # A missing column other than channel_id is a real error
+        return code == '42P10' or 'channel_id' in str(error)
+    
+    def _fall_back(self, error: Exception):
+        """Switch to plain inserts for a table that was not migrated, saying so loudly once"""
+        if getattr(error, 'code', None) != '42P10':
+            self.has_channel_id = False
+        if not self.keyed:
+            return
+        self.keyed = False
+        logger.error("=" * 60)
+        logger.error(f"✗ Supabase table {self.table_name} has no unique (channel_id, message_id) key: {str(error)}")
+        logger.error("  Falling back to plain inserts; messages re-read after a restart may be stored twice.")
+        logger.error("  Run the migration SQL printed by create_table_if_not_exists() (see README,")
+        logger.error("  'Upgrading an existing table') in the Supabase SQL editor, then restart.")
+        logger.error("=" * 60)
+    
+    def check_schema(self) -> bool:
+        """
+        Check at startup that the table has the channel_id column writes are keyed on
+        
+        Postgres only reports a missing unique index when an upsert runs,
+        so that case is caught on the first write instead.
+        
+        Returns:
+            False if the table needs the migration (writes use plain inserts)
+        """
+        if not self.client:
+            return False
+        try:
+            self.client.table(self.table_name).select('channel_id').limit(1).execute()
+        except Exception as e:
+            if not self._is_unkeyed(e):
+                logger.warning(f"Could not check the Supabase table {self.table_name}: {str(e)}")
+                return self.keyed
+            self._fall_back(e)
+        return self.keyed
+    
     def get_recent_signals(self, limit: int = 10) -> list:
         """
         Retrieve recent trading signals
@@ -127,6 +229,7 @@ class SupabaseClient:
             take_profits JSONB,
             signal_type TEXT,
             raw_text TEXT,
+            channel_id BIGINT,
             message_id BIGINT,
             message_date TIMESTAMP,
             created_at TIMESTAMP DEFAULT NOW(),
@@ -137,6 +240,16 @@ class SupabaseClient:
         CREATE INDEX IF NOT EXISTS idx_created_at ON {self.table_name}(created_at DESC);
         CREATE INDEX IF NOT EXISTS idx_processed ON {self.table_name}(processed);
         CREATE INDEX IF NOT EXISTS idx_instrument ON {self.table_name}(instrument);
+        
+        -- Tables created before signals were keyed by message: add the
+        -- column and drop duplicates (keeping the oldest) before the key
+        ALTER TABLE {self.table_name} ADD COLUMN IF NOT EXISTS channel_id BIGINT;
+        DELETE FROM {self.table_name} a USING {self.table_name} b
+            WHERE a.channel_id = b.channel_id AND a.message_id = b.message_id AND a.id > b.id;
+        
+        -- One row per message; writes upsert on this key
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_{self.table_name}_channel_message
+            ON {self.table_name}(channel_id, message_id);
         """
         
         print("\n" + "="*60)
@@ -1,11 +1,13 @@
 """
 Supabase database configuration and models
 """
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, ARRAY, text
+from sqlalchemy import create_engine, Column, Index, Integer, BigInteger, String, Boolean, DateTime, Text, ARRAY, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 import os
+from database import add_missing_columns, add_unique_index
 
 # Supabase connection details
 SUPABASE_URL = os.getenv('SUPABASE_URL', 'https://mfxrghawkoiemxgxfzti.supabase.co')
@@ -55,6 +57,23 @@ if engine is None:
 print(f"🗄️ Using database: {connected_db}")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def listen_url():
+    """
+    URL to LISTEN for notifications on, or None if the database has none
+
+    Supabase's transaction pooler (port 6543) does not deliver
+    notifications, so when connected through it the direct connection
+    (port 5432) to the same database is used instead.
+    """
+    if engine.dialect.name != "postgresql":
+        return None
+    if engine.url.port != 6543:
+        return engine.url
+    for db_url in DATABASE_URLS:
+        if db_url.startswith("postgresql") and make_url(db_url).port == 5432:
+            return db_url
+    return None
 Base = declarative_base()
 
 class Channel(Base):
@@ -66,15 +85,22 @@ class Channel(Base):
     username = Column(String(255), unique=True, nullable=False)
     is_active = Column(Boolean, default=False)
     signal_count = Column(Integer, default=0)
+    last_message_id = Column(Integer, nullable=True)  # Checkpoint of the channel's monitor, read by whichever worker runs it
+    state_version = Column(Integer, default=0)  # Bumped on every start/stop, watched by the channel worker
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Signal(Base):
     """Model for trading signals detected"""
     __tablename__ = "signals"
+    __table_args__ = (
+        # One row per message, however often it is re-read
+        Index('uq_signals_channel_message', 'channel_id', 'message_id', unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     channel_id = Column(Integer, nullable=True)  # Can be null for compatibility
+    message_id = Column(BigInteger, nullable=True)  # Telegram message the signal came from
     raw_text = Column(Text, nullable=False)
     action = Column(String(50), nullable=True)
     instrument = Column(String(100), nullable=True)
@@ -85,15 +111,48 @@ class Signal(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+class ChannelWorker(Base):
+    """Model for channel worker processes taking part in sharded monitoring"""
+    __tablename__ = "channel_workers"
+    
+    worker_id = Column(String(255), primary_key=True)  # host-pid, or WORKER_ID
+    heartbeat_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime, default=datetime.utcnow)
+
+class ChannelLease(Base):
+    """Model for the worker currently running a channel's monitor (one owner per channel)"""
+    __tablename__ = "channel_leases"
+    
+    channel_id = Column(Integer, primary_key=True)
+    worker_id = Column(String(255), nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False)
+
 # Create tables
 def init_supabase_db():
     """Initialize Supabase database tables"""
     try:
         Base.metadata.create_all(bind=engine)
+        add_missing_columns(engine, Channel.__table__)
+        add_missing_columns(engine, Signal.__table__)
+        add_unique_index(engine, Signal.__table__, 'uq_signals_channel_message', ['channel_id', 'message_id'])
         print("✅ Database tables created/verified")
     except Exception as e:
         print(f"❌ Error creating database tables: {e}")
 
+# Notification channel the channel worker LISTENs on (PostgreSQL only)
+CHANNEL_STATE_NOTIFY = "channel_state"
+
+def mark_channel_changed(db, channel):
+    """
+    Tell the channel worker that a channel's desired state changed
+    
+    Bumps the row's state_version (polled on SQLite) and, on PostgreSQL,
+    queues a NOTIFY that is delivered when the transaction commits.
+    """
+    channel.state_version = (channel.state_version or 0) + 1
+    if engine.dialect.name == "postgresql":
+        db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL_STATE_NOTIFY, "payload": str(channel.id)})
+
 # Get DB session
 def get_supabase_db():
     db = SessionLocal()
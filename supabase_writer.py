@@ -0,0 +1,414 @@
+"""
+Local outbox of trading signals, synced to Supabase in the background
+"""
+import asyncio
+import logging
+import os
+import random
+import socket
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import func, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from config import Config
+from database import SessionLocal, engine, TradingSignal, add_missing_columns, add_unique_index
+from supabase_client import SupabaseClient
+
+logger = logging.getLogger(__name__)
+
+# Postgres error classes that mean the database, not the row, is in trouble:
+# connection, transaction rollback, resources, operator intervention, system
+TRANSIENT_SQLSTATE_CLASSES = {'08', '40', '53', '57', '58'}
+
+# PostgREST's own error groups that are transient: PGRST0xx are failures
+# to connect to (or time out waiting for) the database. The others (bad
+# request, unknown column or table, auth) fail the same way every time.
+TRANSIENT_POSTGREST_PREFIX = 'PGRST0'
+
+_schema_ready = False
+
+def _ensure_schema():
+    """Create trading_signals_local, or add the outbox columns and message key to an older table, once"""
+    global _schema_ready
+    if _schema_ready:
+        return
+    table = TradingSignal.__table__
+    # Rows stored before the outbox stay unsynced: the inline inserts of the
+    # time could fail, and resending is deduplicated by the upsert key
+    table.create(bind=engine, checkfirst=True)
+    add_missing_columns(engine, table)
+    add_unique_index(engine, table, 'uq_trading_signals_local_channel_message', ['channel_id', 'message_id'])
+    _schema_ready = True
+
+def _number(value) -> Optional[float]:
+    """Price stored as text back to a number, or None"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def record_from_row(row: TradingSignal) -> Dict:
+    """Supabase record of a stored signal"""
+    record = SupabaseClient.build_record({
+        'action': row.action,
+        'instrument': row.instrument,
+        'entry_price': _number(row.entry_price),
+        'stop_loss': _number(row.stop_loss),
+        'take_profits': row.take_profits or [],
+        'signal_type': row.signal_type,
+        'raw_text': row.raw_text or '',
+        'channel_id': row.channel_id,
+        'message_id': row.message_id,
+        'message_date': row.message_date.isoformat() if row.message_date else None,
+    })
+    if row.created_at:
+        record['created_at'] = row.created_at.isoformat()
+    return record
+
+class SupabaseWriter:
+    """
+    Sync the local signal outbox to Supabase
+
+    save() commits a signal to trading_signals_local, and that local write
+    is all a message handler waits for. A message already stored (re-read
+    after a restart) is skipped by the (channel_id, message_id) key, and
+    batches are upserted on the same key in Supabase. A background task claims unsynced
+    rows in batches of `batch_size`, every `flush_interval` seconds or as
+    soon as a batch is full. It inserts each batch with one PostgREST
+    request run in a thread, then marks the rows synced.
+
+    While Supabase is unreachable, the rows stay in the outbox and the task
+    backs off exponentially with jitter for as long as the outage lasts.
+    Rows Supabase rejects are retried one by one, so a bad row does not
+    hold back its batch, and are parked after `max_attempts`. Claims expire
+    after `claim_ttl`, so processes sharing the database never send the same
+    row at the same time, and rows claimed by a crashed process are picked up.
+    """
+
+    def __init__(self, client: SupabaseClient, batch_size: int = 50, flush_interval: float = 1.0, max_attempts: int = 5, base_delay: float = 0.5, max_delay: float = 60.0, claim_ttl: float = 120.0, owner: Optional[str] = None):
+        """
+        Args:
+            client: SupabaseClient the batches are inserted through
+            batch_size: Rows per insert; a full batch is synced at once
+            flush_interval: Seconds a saved signal may wait for its batch to fill
+            max_attempts: Rejected inserts of a row before it is parked
+            base_delay: Backoff after the first failed sync, doubled on each one
+            max_delay: Longest backoff while Supabase is unreachable
+            claim_ttl: Seconds other processes leave claimed rows alone
+            owner: Id of this process in sync_owner (default host-pid)
+        """
+        self.client = client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.claim_ttl = timedelta(seconds=claim_ttl)
+        self.owner = owner or f"{socket.gethostname()}-{os.getpid()}"
+        self._unsent = 0
+        self._lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+        self.saved = 0
+        self.duplicates = 0
+        self.synced = 0
+        self.batches = 0
+        self.rejected = 0
+        self.failures = 0
+        self.pending = 0
+        self.parked = 0
+        self.lag_seconds = 0.0
+        self.last_synced_at: Optional[datetime] = None
+
+    @property
+    def enabled(self) -> bool:
+        """False when the Supabase client could not be created; rows then wait in the outbox"""
+        return self.client.client is not None
+
+    def start(self):
+        """Start syncing, including rows left by earlier runs (must be called from the running event loop)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def save(self, signal: Dict, channel_id: int, channel_name: str) -> bool:
+        """
+        Commit a signal to the local outbox (must be called from the running event loop)
+
+        Args:
+            signal: Dictionary containing trading signal data
+            channel_id: Telegram (marked) id of the chat the signal was found in;
+                the same id space for every caller, since it is half of the
+                (channel_id, message_id) key
+            channel_name: Display name of the channel
+
+        Returns:
+            True if stored, False if its message was stored already or the local write failed
+        """
+        if not channel_id:
+            logger.error(f"Signal from {channel_name} not stored: its Telegram chat id is unknown")
+            return False
+        try:
+            _ensure_schema()
+            insert = sqlite_insert(TradingSignal).values(
+                channel_id=channel_id,
+                channel_name=channel_name,
+                action=signal['action'],
+                instrument=signal['instrument'],
+                entry_price=str(signal.get('entry_price', '')),
+                stop_loss=str(signal.get('stop_loss', '')),
+                take_profits=signal.get('take_profits', []),
+                signal_type=signal.get('signal_type', 'unknown'),
+                raw_text=signal.get('raw_text', ''),
+                message_id=signal.get('message_id'),
+                message_date=datetime.fromisoformat(signal['message_date']) if signal.get('message_date') else None,
+                synced_to_supabase=False,
+                sync_attempts=0
+            ).on_conflict_do_nothing(index_elements=['channel_id', 'message_id'])
+            db = SessionLocal()
+            try:
+                inserted = db.execute(insert).rowcount
+                db.commit()
+            finally:
+                db.close()
+        except Exception as e:
+            logger.error(f"Error saving signal locally: {str(e)}")
+            return False
+
+        if not inserted:
+            self.duplicates += 1
+            return False
+        self.saved += 1
+        self._unsent += 1
+        self.start()
+        if self._unsent >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def _outbox_filter(self, now: datetime) -> Tuple:
+        """Conditions of rows this process may claim"""
+        return (
+            TradingSignal.synced_to_supabase.isnot(True),
+            func.coalesce(TradingSignal.sync_attempts, 0) < self.max_attempts,
+            or_(
+                TradingSignal.sync_owner == self.owner,
+                TradingSignal.sync_claimed_until == None,
+                TradingSignal.sync_claimed_until < now
+            )
+        )
+
+    def _claim(self) -> List[Tuple[int, Dict]]:
+        """Claim the oldest unsynced rows; returns (row id, Supabase record) pairs"""
+        _ensure_schema()
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            conditions = self._outbox_filter(now)
+            oldest = db.query(TradingSignal.id).filter(*conditions).order_by(TradingSignal.id).limit(self.batch_size)
+            # One UPDATE, so two processes cannot claim the same row
+            db.query(TradingSignal).filter(TradingSignal.id.in_(oldest.scalar_subquery()), *conditions).update(
+                {TradingSignal.sync_owner: self.owner, TradingSignal.sync_claimed_until: now + self.claim_ttl},
+                synchronize_session=False
+            )
+            db.commit()
+            rows = db.query(TradingSignal).filter(
+                TradingSignal.sync_owner == self.owner,
+                TradingSignal.sync_claimed_until >= now,
+                TradingSignal.synced_to_supabase.isnot(True)
+            ).order_by(TradingSignal.id).limit(self.batch_size).all()
+            return [(row.id, record_from_row(row)) for row in rows]
+        finally:
+            db.close()
+
+    def _finish(self, synced: List[int], rejected: List[int], released: List[int]):
+        """Mark rows synced, count a rejection, or hand them back to the outbox"""
+        db = SessionLocal()
+        try:
+            if synced:
+                db.query(TradingSignal).filter(TradingSignal.id.in_(synced)).update(
+                    {TradingSignal.synced_to_supabase: True, TradingSignal.sync_owner: None, TradingSignal.sync_claimed_until: None},
+                    synchronize_session=False
+                )
+            if rejected:
+                db.query(TradingSignal).filter(TradingSignal.id.in_(rejected)).update(
+                    {
+                        TradingSignal.sync_attempts: func.coalesce(TradingSignal.sync_attempts, 0) + 1,
+                        TradingSignal.sync_owner: None,
+                        TradingSignal.sync_claimed_until: None
+                    },
+                    synchronize_session=False
+                )
+            if released:
+                db.query(TradingSignal).filter(TradingSignal.id.in_(released)).update(
+                    {TradingSignal.sync_owner: None, TradingSignal.sync_claimed_until: None},
+                    synchronize_session=False
+                )
+            db.commit()
+        finally:
+            db.close()
+
+    def _measure(self):
+        """Update the outbox size and the age of its oldest unsynced row"""
+        db = SessionLocal()
+        try:
+            unsynced = db.query(TradingSignal).filter(TradingSignal.synced_to_supabase.isnot(True))
+            parked = func.coalesce(TradingSignal.sync_attempts, 0) >= self.max_attempts
+            self.parked = unsynced.filter(parked).count()
+            pending = unsynced.filter(~parked)
+            self.pending = pending.count()
+            oldest = pending.with_entities(func.min(TradingSignal.created_at)).scalar()
+            self.lag_seconds = (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0
+        finally:
+            db.close()
+
+    @staticmethod
+    def is_rejection(error: Exception) -> bool:
+        """Whether Supabase refused the data itself, so sending it unchanged again will fail too"""
+        code = getattr(error, 'code', None)
+        if type(error).__name__ != 'APIError' or not isinstance(code, str):
+            return False
+        if code.startswith('PGRST'):
+            return not code.startswith(TRANSIENT_POSTGREST_PREFIX)
+        if len(code) != 5:
+            return False
+        return code[:2] not in TRANSIENT_SQLSTATE_CLASSES
+
+    async def _send(self, batch: List[Tuple[int, Dict]]) -> bool:
+        """Insert one claimed batch; False if Supabase could not be reached"""
+        loop = asyncio.get_running_loop()
+        ids = [row_id for row_id, _ in batch]
+        try:
+            await loop.run_in_executor(None, self.client.insert_records, [record for _, record in batch])
+        except Exception as e:
+            if not self.is_rejection(e):
+                await loop.run_in_executor(None, self._finish, [], [], ids)
+                logger.warning(f"Could not sync {len(batch)} signals to Supabase: {str(e)}")
+                return False
+            if len(batch) == 1:
+                await loop.run_in_executor(None, self._finish, [], ids, [])
+                self.rejected += 1
+                logger.error(f"✗ Supabase rejected signal #{ids[0]}: {str(e)}")
+                return True
+            # Find the bad rows; the rest still go through
+            for i, row in enumerate(batch):
+                if not await self._send([row]):
+                    await loop.run_in_executor(None, self._finish, [], [], ids[i + 1:])
+                    return False
+            return True
+
+        await loop.run_in_executor(None, self._finish, ids, [], [])
+        self.synced += len(batch)
+        self.batches += 1
+        self.last_synced_at = datetime.utcnow()
+        logger.info(f"✓ {len(batch)} signals synced to Supabase")
+        return True
+
+    async def flush(self) -> bool:
+        """
+        Sync every unsynced row now
+
+        Returns:
+            False if Supabase could not be reached; the rows stay in the outbox
+        """
+        if not self.enabled:
+            return False
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            self._unsent = 0
+            try:
+                while True:
+                    batch = await loop.run_in_executor(None, self._claim)
+                    if not batch:
+                        return True
+                    if not await self._send(batch):
+                        self.failures += 1
+                        return False
+                    if len(batch) < self.batch_size:
+                        return True
+            finally:
+                try:
+                    await loop.run_in_executor(None, self._measure)
+                except Exception as e:
+                    logger.warning(f"Could not measure the signal outbox: {str(e)}")
+
+    async def _run(self):
+        """Sync on a timer or once a batch is full; back off while Supabase is down"""
+        if self.enabled:
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.client.check_schema)
+            except Exception as e:
+                logger.warning(f"Could not check the Supabase table: {str(e)}")
+        failed = 0
+        while not self._closing:
+            if failed:
+                # New signals do not cut the backoff short; they wait in the outbox
+                await asyncio.sleep(min(self.max_delay, self.base_delay * (2 ** (failed - 1))) * random.uniform(0.5, 1.0))
+            else:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wake.clear()
+            if self._closing:
+                break
+            try:
+                # Shielded, so close() never interrupts a batch between insert and marking it synced
+                ok = await asyncio.shield(self.flush())
+            except Exception as e:
+                logger.error(f"Error syncing signals to Supabase: {str(e)}")
+                ok = False
+            failed = 0 if ok or not self.enabled else failed + 1
+
+    async def close(self):
+        """Stop the background task and try one last sync; whatever fails stays for the next run"""
+        self._closing = True
+        try:
+            if self._task is not None:
+                self._wake.set()
+                self._task.cancel()
+                await asyncio.gather(self._task, return_exceptions=True)
+            await self.flush()
+        except Exception as e:
+            logger.warning(f"Final Supabase sync failed, signals stay in the outbox: {str(e)}")
+        finally:
+            self._task = None
+            self._closing = False
+
+    def stats(self) -> Dict:
+        """Get sync counters and the outbox lag"""
+        return {
+            'pending': self.pending,
+            'parked': self.parked,
+            'lag_seconds': self.lag_seconds,
+            'saved': self.saved,
+            'duplicates': self.duplicates,
+            'synced': self.synced,
+            'batches': self.batches,
+            'rejected': self.rejected,
+            'failures': self.failures,
+            'last_synced_at': self.last_synced_at.isoformat() if self.last_synced_at else None,
+        }
+
+_writer: Optional[SupabaseWriter] = None
+
+def get_supabase_writer() -> SupabaseWriter:
+    """Get the process-wide Supabase writer, shared by every channel monitor"""
+    global _writer
+    if _writer is None:
+        _writer = SupabaseWriter(
+            SupabaseClient(
+                url=Config.SUPABASE_URL,
+                key=Config.SUPABASE_KEY,
+                table_name=Config.SUPABASE_TABLE
+            ),
+            batch_size=Config.SUPABASE_BATCH_SIZE,
+            flush_interval=Config.SUPABASE_FLUSH_MS / 1000,
+            max_attempts=Config.SUPABASE_MAX_ATTEMPTS,
+        )
+    return _writer
+
+async def close_supabase_writer():
+    """Try to sync pending signals on shutdown"""
+    if _writer is not None:
+        await _writer.close()
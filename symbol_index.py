@@ -0,0 +1,188 @@
+"""
+Index of known trading instruments used to resolve symbols in signal text
+"""
+import json
+import os
+import re
+import string
+from typing import Dict, Iterable, Optional
+
+# Currencies combined into forex pairs (every ordered pair is indexed)
+FOREX_CURRENCIES = ('USD', 'EUR', 'GBP', 'JPY', 'CHF', 'AUD', 'NZD', 'CAD')
+
+# Metals and their common quote currencies
+METALS = ('XAU', 'XAG', 'XPT', 'XPD')
+METAL_QUOTES = ('USD', 'EUR', 'GBP', 'AUD', 'CHF', 'JPY')
+
+# Crypto bases, quoted in USDT and USD
+CRYPTO_BASES = (
+    'BTC', 'ETH', 'SOL', 'XRP', 'BNB', 'ADA', 'DOGE', 'DOT', 'LTC', 'AVAX',
+    'LINK', 'MATIC', 'TRX', 'SHIB', 'ATOM', 'UNI', 'BCH', 'XLM', 'NEAR', 'APT',
+    'ARB', 'OP', 'SUI', 'PEPE', 'TON',
+)
+CRYPTO_QUOTES = ('USDT', 'USD')
+
+# Indices and commodities as brokers usually name them
+OTHER_SYMBOLS = (
+    'US30', 'NAS100', 'US100', 'US500', 'SPX500', 'GER40', 'GER30', 'UK100',
+    'JP225', 'FRA40', 'HK50', 'AUS200', 'USOIL', 'UKOIL', 'NGAS', 'DXY',
+)
+
+# Names used in channel posts mapped to the canonical symbol
+DEFAULT_ALIASES = {
+    'GOLD': 'XAUUSD',
+    'SILVER': 'XAGUSD',
+    'BITCOIN': 'BTCUSDT',
+    'ETHEREUM': 'ETHUSDT',
+    'DOW': 'US30',
+    'DJ30': 'US30',
+    'NASDAQ': 'NAS100',
+    'USTEC': 'NAS100',
+    'NQ': 'NAS100',
+    'SP500': 'US500',
+    'SPX': 'US500',
+    'DAX': 'GER40',
+    'DE40': 'GER40',
+    'FTSE': 'UK100',
+    'NIKKEI': 'JP225',
+    'OIL': 'USOIL',
+    'WTI': 'USOIL',
+    'BRENT': 'UKOIL',
+}
+
+# Tokens inside punctuated words: letters/digits, optionally split by a slash (EUR/USD)
+TOKEN_PATTERN = r'[A-Z0-9]+(?:/[A-Z0-9]+)?'
+
+# Punctuation stripped from the ends of a word before looking it up (#XAUUSD, GOLD!)
+WORD_PUNCTUATION = string.punctuation.replace('/', '') + '‘’“”«»…'
+
+# Words split off the message at a time; instruments are usually named early
+WORDS_PER_SPLIT = 4
+
+def default_symbols() -> set:
+    """Build the built-in set of canonical symbols"""
+    symbols = set(OTHER_SYMBOLS)
+    symbols.update(base + quote for base in FOREX_CURRENCIES for quote in FOREX_CURRENCIES if base != quote)
+    symbols.update(metal + quote for metal in METALS for quote in METAL_QUOTES)
+    symbols.update(base + quote for base in CRYPTO_BASES for quote in CRYPTO_QUOTES)
+    return symbols
+
+class SymbolIndex:
+    """Resolve instrument symbols from uppercased message text"""
+    
+    def __init__(self, symbols: Iterable[str], aliases: Optional[Dict[str, str]] = None):
+        """
+        Build the lookup table
+        
+        Args:
+            symbols: Canonical symbols, e.g. EURUSD
+            aliases: Alternative names mapped to canonical symbols, e.g. GOLD -> XAUUSD
+        """
+        # A single dict covers both symbols and aliases so resolving a
+        # token is one lookup
+        self.lookup: Dict[str, str] = {}
+        for symbol in symbols:
+            symbol = symbol.upper()
+            self.lookup[symbol] = symbol
+        for alias, symbol in (aliases or {}).items():
+            self.lookup[alias.upper()] = symbol.upper()
+        self._token_re = re.compile(TOKEN_PATTERN)
+    
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> 'SymbolIndex':
+        """
+        Create an index from the built-in symbols, extended by a JSON file
+        
+        The file holds {"symbols": [...], "aliases": {"ALIAS": "SYMBOL"}};
+        both keys are optional.
+        
+        Args:
+            path: Path to the JSON file, or None for built-ins only
+        
+        Returns:
+            SymbolIndex instance
+        """
+        symbols = default_symbols()
+        aliases = dict(DEFAULT_ALIASES)
+        if path:
+            with open(path) as f:
+                data = json.load(f)
+            symbols.update(data.get('symbols', []))
+            aliases.update(data.get('aliases', {}))
+        return cls(symbols, aliases)
+    
+    def resolve(self, text_upper: str) -> Optional[str]:
+        """
+        Find the first known instrument in the text
+        
+        Whitespace-separated words are split off a few at a time and looked
+        up directly, so the rest of a long message is never split. Words
+        with punctuation around them (#XAUUSD, GOLD!) are stripped, slash
+        pairs (EUR/USD) joined, and only words still holding other
+        characters (XAUUSD🔥) are tokenized with a regex.
+        
+        This is slower than the old instrument regex (0.5-0.65x its rate on
+        benchmark_parser.py's signals): each word costs a Python-level dict
+        lookup, while the regex stops in C at the first word of 3-6 letters.
+        That word is often BUY or NEW rather than the instrument. Neither a
+        set intersection of the words nor one alternation of all known
+        symbols came out faster, so the slowdown is the accepted price of
+        a correct instrument.
+        
+        Args:
+            text_upper: Uppercased message text
+            
+        Returns:
+            Canonical symbol or None if the text names no known instrument
+        """
+        get = self.lookup.get
+        rest = text_upper
+        while rest:
+            words = rest.split(None, WORDS_PER_SPLIT)
+            rest = words.pop() if len(words) > WORDS_PER_SPLIT else ''
+            for word in words:
+                symbol = get(word)
+                if symbol is not None:
+                    return symbol
+                if word.isalnum():
+                    continue
+                word = word.strip(WORD_PUNCTUATION)
+                if word.isalnum():
+                    symbol = get(word)
+                elif word.replace('/', '', 1).isalnum():
+                    symbol = get(word) or get(word.replace('/', ''))
+                else:
+                    symbol = self._resolve_tokens(word)
+                if symbol is not None:
+                    return symbol
+        return None
+    
+    def _resolve_tokens(self, word: str) -> Optional[str]:
+        """Look up the letter/digit runs of a word with other characters attached"""
+        for token in self._token_re.findall(word):
+            symbol = self.lookup.get(token)
+            if symbol is None and '/' in token:
+                symbol = self.lookup.get(token.replace('/', ''))
+            if symbol is not None:
+                return symbol
+        return None
+    
+    def __contains__(self, symbol: str) -> bool:
+        return symbol.upper() in self.lookup
+    
+    def __len__(self) -> int:
+        return len(self.lookup)
+
+_default_index: Optional[SymbolIndex] = None
+
+def get_symbol_index() -> SymbolIndex:
+    """
+    Get the process-wide symbol index
+    
+    Loaded once, from the built-in symbols plus the JSON file named by the
+    SYMBOLS_FILE environment variable if it is set.
+    """
+    global _default_index
+    if _default_index is None:
+        _default_index = SymbolIndex.load(os.getenv('SYMBOLS_FILE'))
+    return _default_index
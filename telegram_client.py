@@ -1,7 +1,12 @@
-from telethon import TelegramClient, events
+from telethon import TelegramClient, events, utils
 from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument
 from typing import Optional, Callable
 import asyncio
+from media_policy import download_image
+from message_pipeline import MessagePipeline
+from albums import AlbumCollector
+from entity_cache import entity_cache, normalize_username
+from config import Config
 
 class TelegramGroupMonitor:
     """Monitor a Telegram group for trading signals"""
@@ -20,6 +25,16 @@ class TelegramGroupMonitor:
         self.phone = phone
         self.client = TelegramClient('trading_bot_session', api_id, api_hash)
         self.group_entity = None
+        self.group_title = None
+        # Telegram's marked id of the group, the key signals are stored under
+        self.peer_id: Optional[int] = None
+        self.pipeline = MessagePipeline(
+            workers=Config.PIPELINE_WORKERS,
+            max_per_channel=Config.PIPELINE_QUEUE_SIZE
+        )
+        self.albums = AlbumCollector(Config.ALBUM_WINDOW_MS / 1000)
+        # Set to a CatchUp to detect gaps and drop messages it already fetched
+        self.catch_up = None
     
     async def start(self):
         """Start the Telegram client"""
@@ -41,13 +56,12 @@ class TelegramGroupMonitor:
             group_username: Username or invite link of the group
         """
         try:
-            # Remove @ if present
-            if group_username.startswith('@'):
-                group_username = group_username[1:]
-            
-            # Get the group entity
-            self.group_entity = await self.client.get_entity(group_username)
-            print(f"✓ Connected to group: {self.group_entity.title}")
+            # Get the group peer, from the entity cache when possible
+            self.group_entity, self.group_title = await entity_cache.resolve(
+                self.client, normalize_username(group_username)
+            )
+            self.peer_id = utils.get_peer_id(self.group_entity)
+            print(f"✓ Connected to group: {self.group_title}")
             
         except Exception as e:
             print(f"✗ Error joining group: {str(e)}")
@@ -55,18 +69,21 @@ class TelegramGroupMonitor:
     
     async def download_media(self, message) -> Optional[bytes]:
         """
-        Download media from a message
+        Download the image in a message
+        
+        Non-image media is skipped and photos are fetched at the smallest
+        adequate size, within the process-wide download budget.
         
         Args:
             message: Telegram message object
             
         Returns:
-            Media file as bytes or None
+            Image as bytes or None
         """
         try:
             if message.media:
                 # Download to bytes
-                media_bytes = await self.client.download_media(message.media, file=bytes)
+                media_bytes = await download_image(self.client, message.media)
                 return media_bytes
         except Exception as e:
             print(f"✗ Error downloading media: {str(e)}")
@@ -76,31 +93,58 @@ class TelegramGroupMonitor:
         """
         Register a handler for new messages
         
+        The update handler only queues the message; the handler runs on the
+        pipeline's workers, so a slow message does not hold up later updates.
+        The parts of an album are collected first and queued together.
+        Must be called from the running event loop.
+        
         Args:
-            handler: Async function to handle new messages
+            handler: Async function called with the list of messages of one
+                post (a single message, or every part of an album)
         """
+        self.pipeline.start()
+        
         @self.client.on(events.NewMessage(chats=self.group_entity))
         async def message_handler(event):
-            await handler(event)
+            if self.catch_up is not None and not self.catch_up.observe(event.message.id):
+                return
+            parts = await self.albums.collect(event.message)
+            if parts is not None:
+                await self.pipeline.submit(event.chat_id, handler, parts)
     
-    async def get_recent_messages(self, limit: int = 100):
+    async def get_recent_messages(self, limit: Optional[int] = 100, min_id: int = 0, max_id: int = 0):
         """
-        Get recent messages from the group
+        Get recent messages from the group, newest first
         
         Args:
-            limit: Number of messages to retrieve
+            limit: Number of messages to retrieve (None for all in range)
+            min_id: Only messages with a greater id
+            max_id: Only messages with a smaller id (0 for no bound)
             
         Returns:
             List of messages
         """
         try:
-            messages = await self.client.get_messages(self.group_entity, limit=limit)
+            messages = await self.client.get_messages(self.group_entity, limit=limit, min_id=min_id, max_id=max_id)
             print(f"✓ Retrieved {len(messages)} recent messages")
             return messages
         except Exception as e:
             print(f"✗ Error retrieving messages: {str(e)}")
             return []
     
+    def iter_messages(self, min_id: int = 0, max_id: int = 0):
+        """
+        Stream messages from the group, oldest first, without loading them all
+        
+        Args:
+            min_id: Only messages with a greater id
+            max_id: Only messages with a smaller id (0 for no bound)
+            
+        Returns:
+            Async iterator of messages
+        """
+        return self.client.iter_messages(self.group_entity, min_id=min_id, max_id=max_id, reverse=True)
+    
     async def run_until_disconnected(self):
         """Keep the client running"""
         print("\n✓ Bot is now monitoring the group for trading signals...")
@@ -108,6 +152,7 @@ class TelegramGroupMonitor:
         await self.client.run_until_disconnected()
     
     async def disconnect(self):
-        """Disconnect the client"""
+        """Finish queued messages and disconnect the client"""
+        await self.pipeline.stop()
         await self.client.disconnect()
         print("✓ Telegram client disconnected")
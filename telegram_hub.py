@@ -0,0 +1,99 @@
+"""
+One shared Telegram connection routing new messages to channel monitors
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+from telethon import TelegramClient, events, utils
+from config import Config
+from entity_cache import ResolvedPeer, entity_cache
+
+logger = logging.getLogger(__name__)
+
+class NotLoggedIn(Exception):
+    """The session needs an interactive login first"""
+
+class TelegramHub:
+    """
+    A single authenticated TelegramClient shared by every channel monitor
+
+    The client logs in once and receives updates for all chats on one
+    MTProto connection. Each NewMessage is routed by chat id to the handler
+    of the channel subscribed to it, so channels can be added or removed
+    without reconnecting.
+    """
+
+    def __init__(self, session_name: str = 'channel_manager_session', interactive: bool = True):
+        """
+        Args:
+            session_name: Telethon session file for the shared login
+            interactive: Prompt for the login code if the session is not
+                authorized; otherwise raise NotLoggedIn (e.g. in a child
+                process, which has no terminal)
+        """
+        self.session_name = session_name
+        self.interactive = interactive
+        self.client: Optional[TelegramClient] = None
+        # chat id (marked, as in event.chat_id) -> handler
+        self.handlers: Dict[int, Callable[[events.NewMessage.Event], Awaitable[None]]] = {}
+        self._connect_lock = asyncio.Lock()
+
+    async def connect(self) -> TelegramClient:
+        """
+        Log in on first use and return the shared client
+
+        A client that lost its connection is reconnected rather than
+        replaced, since monitors and their gap watchers keep a reference
+        to it and its NewMessage handler is already registered.
+        """
+        async with self._connect_lock:
+            if self.client is None:
+                client = TelegramClient(self.session_name, Config.TELEGRAM_API_ID, Config.TELEGRAM_API_HASH)
+                if self.interactive:
+                    await client.start(phone=Config.TELEGRAM_PHONE)
+                else:
+                    await client.connect()
+                    if not await client.is_user_authorized():
+                        await client.disconnect()
+                        raise NotLoggedIn(f"Telegram session {self.session_name} is not logged in")
+                client.add_event_handler(self._dispatch, events.NewMessage())
+                self.client = client
+                logger.info("✓ Shared Telegram client connected")
+            elif not self.client.is_connected():
+                await self.client.connect()
+                logger.info("✓ Shared Telegram client reconnected")
+        return self.client
+
+    async def _dispatch(self, event):
+        """Route a new message to the handler of its chat, if any"""
+        handler = self.handlers.get(event.chat_id)
+        if handler is not None:
+            await handler(event)
+
+    async def subscribe(self, username: str, handler: Callable[[events.NewMessage.Event], Awaitable[None]]) -> ResolvedPeer:
+        """
+        Resolve a channel (through the entity cache) and start routing its new messages to handler
+
+        Args:
+            username: Channel username or t.me link
+            handler: Coroutine function called with each NewMessage event
+
+        Returns:
+            The channel's peer and title
+        """
+        client = await self.connect()
+        resolved = await entity_cache.resolve(client, username)
+        self.handlers[utils.get_peer_id(resolved.peer)] = handler
+        return resolved
+
+    def unsubscribe(self, peer):
+        """Stop routing messages of a channel; the connection stays up"""
+        self.handlers.pop(utils.get_peer_id(peer), None)
+
+    async def disconnect(self):
+        """Close the shared connection"""
+        self.handlers.clear()
+        if self.client is not None:
+            await self.client.disconnect()
+            self.client = None
+            logger.info("✓ Shared Telegram client disconnected")
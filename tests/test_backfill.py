@@ -0,0 +1,38 @@
+"""
+Tests for StreamingBackfill ordering and failure handling
+"""
+import asyncio
+from types import SimpleNamespace
+
+from backfill import StreamingBackfill, iterate
+
+
+def run_backfill(analyze, **kwargs):
+    """Backfill messages 1-5 and return what was committed, in order"""
+    committed = []
+    backfill = StreamingBackfill(concurrency=2, batch_size=2, **kwargs)
+    messages = iterate([SimpleNamespace(id=message_id) for message_id in range(1, 6)])
+    asyncio.run(backfill.run(messages, analyze, lambda message, result: committed.append((message.id, result))))
+    return backfill, committed
+
+
+def test_commits_in_message_order():
+    async def analyze(message, _):
+        await asyncio.sleep(0.01 * (6 - message.id))
+        return message.id
+
+    _, committed = run_backfill(analyze)
+    assert committed == [(1, 1), (2, 2), (3, 3), (4, 4), (5, 5)]
+
+
+def test_failed_analysis_commits_the_failure_marker():
+    async def analyze(message, _):
+        if message.id == 3:
+            raise RuntimeError("download failed")
+        return None, True
+
+    backfill, committed = run_backfill(analyze, failed_result=(None, False))
+    assert committed[2] == (3, (None, False))
+    assert [result for _, result in committed].count((None, True)) == 4
+    assert backfill.failed == 1
+    assert backfill.processed == 5
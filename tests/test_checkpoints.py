@@ -0,0 +1,168 @@
+"""
+Tests for CheckpointTracker, AnalysisRetries and SeenMessages, without a database
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+import checkpoints
+from checkpoints import CheckpointTracker
+
+
+@pytest.fixture
+def saves(monkeypatch):
+    """Record saved checkpoints instead of writing them to a database"""
+    saved = []
+    for shared in (False, True):
+        load = 'load_shared_checkpoint' if shared else 'load_checkpoint'
+        save = 'save_shared_checkpoint' if shared else 'save_checkpoint'
+        monkeypatch.setattr(checkpoints, load, lambda channel_id: 100)
+        monkeypatch.setattr(checkpoints, save, lambda channel_id, message_id: saved.append(message_id))
+    return saved
+
+
+def test_advances_only_below_messages_in_flight(saves):
+    tracker = CheckpointTracker(1)
+    for message_id in (101, 102, 103):
+        tracker.begin(message_id)
+    tracker.done(103)
+    tracker.done(102)
+    assert saves == []
+    tracker.done(101)
+    assert saves == [103]
+    assert tracker.saved == 103
+
+
+def test_hold_keeps_the_checkpoint_below_a_message(saves):
+    tracker = CheckpointTracker(1)
+    tracker.hold(104)
+    for message_id in (105, 106):
+        tracker.begin(message_id)
+        tracker.done(message_id)
+    assert saves == [104]
+    tracker.release(104)
+    assert saves == [104, 106]
+
+
+def test_paused_tracker_saves_on_flush(saves):
+    tracker = CheckpointTracker(1)
+    tracker.paused = True
+    tracker.begin(101)
+    tracker.done(101)
+    assert saves == []
+    tracker.paused = False
+    tracker.flush()
+    assert saves == [101]
+
+
+def test_never_moves_back(saves):
+    tracker = CheckpointTracker(1)
+    tracker.begin(50)
+    tracker.done(50)
+    assert saves == []
+    assert tracker.saved == 100
+
+
+def test_without_channel_nothing_is_saved(saves):
+    tracker = CheckpointTracker(None)
+    assert tracker.saved is None
+    tracker.begin(1)
+    tracker.done(1)
+    assert saves == []
+
+
+def test_seed_only_without_a_saved_checkpoint(monkeypatch, saves):
+    tracker = CheckpointTracker(1)
+    tracker.seed(500)
+    assert tracker.saved == 100
+    monkeypatch.setattr(checkpoints, 'load_checkpoint', lambda channel_id: None)
+    tracker = CheckpointTracker(1)
+    tracker.seed(500)
+    assert tracker.saved == 500
+    assert tracker.highest_done == 500
+
+
+def test_shared_saves_are_throttled_until_forced(saves):
+    async def run():
+        tracker = CheckpointTracker(1, shared=True, save_interval=60)
+        for message_id in (101, 102):
+            tracker.begin(message_id)
+            tracker.done(message_id)
+        # The first save runs off the event loop
+        await asyncio.sleep(0.1)
+        assert saves == [101]
+        tracker.flush(force=True)
+        assert saves == [101, 102]
+
+    asyncio.run(run())
+
+
+def run_retries(outcomes, attempts=2):
+    """Fail message 101 once, retry it with the given outcomes, and return the saves and retries"""
+    async def run():
+        tracker = CheckpointTracker(1)
+        calls = []
+
+        async def process(parts):
+            calls.append(parts[0].id)
+            if not outcomes.pop(0):
+                retries.schedule(parts)
+
+        retries = checkpoints.AnalysisRetries(tracker, process, attempts=attempts, delay=0.01)
+        parts = [SimpleNamespace(id=101)]
+        tracker.begin(101)
+        retries.schedule(parts)
+        tracker.done(101)
+        held = tracker.saved
+        for message_id in (102, 103):
+            tracker.begin(message_id)
+            tracker.done(message_id)
+        await asyncio.sleep(0.2)
+        return held, tracker, retries, calls
+
+    return asyncio.run(run())
+
+
+def test_retry_releases_the_hold_on_success(saves):
+    held, tracker, retries, calls = run_retries([True])
+    assert held == 100
+    assert calls == [101]
+    assert tracker.holds == []
+    assert saves == [103]
+    assert retries.scheduled == {}
+
+
+def test_retries_give_up_after_the_last_attempt(saves):
+    held, tracker, retries, calls = run_retries([False, False])
+    assert calls == [101, 101]
+    assert tracker.holds == []
+    assert saves == [103]
+    assert retries.given_up == 1
+    assert retries.scheduled == {}
+
+
+def test_stop_keeps_the_hold_of_a_pending_retry(saves):
+    async def run():
+        tracker = CheckpointTracker(1)
+        retries = checkpoints.AnalysisRetries(tracker, lambda parts: asyncio.sleep(0), delay=60)
+        retries.schedule([SimpleNamespace(id=101)])
+        await retries.stop()
+        return tracker
+
+    tracker = asyncio.run(run())
+    assert tracker.holds == [100]
+
+
+def test_seen_messages():
+    seen = checkpoints.SeenMessages(limit=2)
+    first, second, third = (SimpleNamespace(id=message_id) for message_id in (1, 2, 3))
+    seen.add([first])
+    assert seen.known([first])
+    assert not seen.known([second])
+    seen.add([second, third])
+    assert seen.known([third])
+    # Only the newest `limit` ids are kept
+    assert not seen.known([first])
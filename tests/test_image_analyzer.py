@@ -0,0 +1,94 @@
+"""
+Tests for splitting batched vision replies and running the analysis cascade
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip('PIL')
+pytest.importorskip('dotenv')
+
+from image_analyzer import ImageAnalyzer, split_batch_reply
+from ocr_pool import OcrFailed
+
+
+def test_split_batch_reply():
+    reply = (
+        "Here are the results.\n"
+        "=== IMAGE 1 ===\n"
+        "SIGNAL_TYPE: TRADE_SIGNAL\nACTION: BUY\n"
+        "  === image 2 ===  \n"
+        "SIGNAL_TYPE: TRADE_RESULT\n"
+    )
+    assert split_batch_reply(reply, 2) == [
+        "SIGNAL_TYPE: TRADE_SIGNAL\nACTION: BUY",
+        "SIGNAL_TYPE: TRADE_RESULT",
+    ]
+
+
+def test_split_batch_reply_marks_missing_and_ignores_extra_blocks():
+    reply = "=== IMAGE 3 ===\nthird\n=== IMAGE 7 ===\nnot requested\n=== IMAGE 3 ===\nrepeated"
+    assert split_batch_reply(reply, 3) == [None, None, "third"]
+
+
+@pytest.mark.parametrize('reply', [None, '', 'SIGNAL_TYPE: TRADE_SIGNAL without headers'])
+def test_split_batch_reply_without_blocks(reply):
+    assert split_batch_reply(reply, 2) == [None, None]
+
+
+@pytest.fixture
+def analyzer():
+    analyzer = ImageAnalyzer(cascade='ocr,vision')
+    analyzer.use_openai = True
+    return analyzer
+
+
+def signal_from(analyzer):
+    return analyzer.text_parser.parse_message("XAUUSD BUY 2315 SL 2305 TP 2325")
+
+
+def run_cascade(analyzer, ocr, vision):
+    return asyncio.run(analyzer._run_cascade(ocr, vision))
+
+
+def test_cascade_falls_through_to_vision(analyzer):
+    async def ocr():
+        raise OcrFailed("worker died")
+
+    async def vision():
+        return signal_from(analyzer)
+
+    signal, complete = run_cascade(analyzer, ocr, vision)
+    assert signal['instrument'] == 'XAUUSD'
+    assert complete
+
+
+def test_cascade_stops_at_the_first_signal(analyzer):
+    async def ocr():
+        return signal_from(analyzer)
+
+    async def vision():
+        raise AssertionError("vision must not run")
+
+    assert run_cascade(analyzer, ocr, vision) == (signal_from(analyzer), True)
+
+
+def test_failed_stage_leaves_the_result_incomplete(analyzer):
+    async def ocr():
+        return None
+
+    async def vision():
+        raise RuntimeError("rate limited")
+
+    assert run_cascade(analyzer, ocr, vision) == (None, False)
+
+
+def test_unexpected_ocr_errors_propagate(analyzer):
+    async def ocr():
+        raise ValueError("bug")
+
+    async def vision():
+        return None
+
+    with pytest.raises(ValueError):
+        run_cascade(analyzer, ocr, vision)
@@ -0,0 +1,59 @@
+"""
+Tests for the image analysis cache key, without a database
+"""
+import io
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+Image = pytest.importorskip('PIL.Image')
+ImageDraw = pytest.importorskip('PIL.ImageDraw')
+
+import image_cache
+from image_cache import ImageHashCache, compute_content_hash
+
+
+def card(text: str, image_format: str = 'PNG') -> bytes:
+    """Render a signal card with the same layout for every text"""
+    image = Image.new('RGB', (640, 360), 'white')
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((20, 20, 620, 340), outline='black', width=4)
+    draw.text((60, 80), text, fill='black')
+    draw.text((60, 200), 'SL 2340  TP 2370', fill='black')
+    output = io.BytesIO()
+    image.save(output, format=image_format)
+    return output.getvalue()
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """Cache that starts empty and does not persist anything"""
+    session = SimpleNamespace(add=lambda row: None, commit=lambda: None, close=lambda: None)
+    monkeypatch.setattr(image_cache, 'SessionLocal', lambda: session)
+    cache = ImageHashCache()
+    cache._entries = {}
+    return cache
+
+
+def test_different_signal_cards_do_not_collide(cache):
+    buy = compute_content_hash(card('BUY XAUUSD 2350'))
+    sell = compute_content_hash(card('SELL XAUUSD 2350'))
+    other_price = compute_content_hash(card('BUY XAUUSD 2351'))
+    assert len({buy, sell, other_price}) == 3
+
+    cache.store(buy, {'symbol': 'XAUUSD', 'direction': 'BUY'})
+    assert cache.lookup(sell) == (False, None)
+    assert cache.lookup(other_price) == (False, None)
+    assert cache.lookup(buy) == (True, {'symbol': 'XAUUSD', 'direction': 'BUY'})
+
+
+def test_same_pixels_in_another_container_hit(cache):
+    png = card('BUY XAUUSD 2350')
+    bmp = card('BUY XAUUSD 2350', image_format='BMP')
+    assert png != bmp
+    assert compute_content_hash(png) == compute_content_hash(bmp)
+
+
+def test_undecodable_image_is_not_hashed():
+    assert compute_content_hash(b'not an image') is None
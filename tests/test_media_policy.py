@@ -0,0 +1,80 @@
+"""
+Tests for choosing what to download from message media
+"""
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('telethon')
+pytest.importorskip('dotenv')
+
+from telethon.tl.types import (
+    Document, DocumentAttributeImageSize, MessageMediaDocument, MessageMediaPhoto,
+    Photo, PhotoSize, PhotoSizeProgressive, PhotoStrippedSize,
+)
+from config import Config
+from media_policy import select_media
+
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    monkeypatch.setattr(Config, 'MEDIA_MIN_EDGE', 1280)
+    monkeypatch.setattr(Config, 'MEDIA_MAX_BYTES', 10 * 1024 * 1024)
+    monkeypatch.setattr(Config, 'MEDIA_MAX_PIXELS', 40000000)
+
+
+def photo(sizes):
+    return MessageMediaPhoto(photo=Photo(
+        id=1, access_hash=2, file_reference=b'', date=datetime(2024, 1, 1), sizes=sizes, dc_id=2
+    ))
+
+
+def document(mime_type, size, attributes=(), thumbs=None):
+    return MessageMediaDocument(document=Document(
+        id=1, access_hash=2, file_reference=b'', date=datetime(2024, 1, 1), mime_type=mime_type,
+        size=size, dc_id=2, attributes=list(attributes), thumbs=thumbs
+    ))
+
+
+def test_photo_uses_the_smallest_adequate_size():
+    small = PhotoSize(type='m', w=320, h=240, size=20000)
+    medium = PhotoSizeProgressive(type='x', w=1280, h=960, sizes=[50000, 120000])
+    large = PhotoSize(type='w', w=2560, h=1920, size=600000)
+    choice = select_media(photo([PhotoStrippedSize(type='i', bytes=b''), large, small, medium]))
+    assert choice.thumb is medium
+    assert choice.size == 120000
+
+
+def test_photo_without_an_adequate_size_uses_the_largest():
+    small = PhotoSize(type='m', w=320, h=240, size=20000)
+    larger = PhotoSize(type='x', w=800, h=600, size=60000)
+    assert select_media(photo([larger, small])).thumb is larger
+
+
+def test_photo_without_downloadable_sizes_is_skipped():
+    assert select_media(photo([PhotoStrippedSize(type='i', bytes=b'')])) is None
+
+
+def test_image_document_prefers_an_adequate_thumbnail():
+    thumb = PhotoSize(type='x', w=1280, h=720, size=90000)
+    choice = select_media(document('image/png', 3000000, thumbs=[thumb]))
+    assert choice.thumb is thumb
+    assert choice.size == 90000
+
+
+def test_image_document_is_downloaded_whole_without_a_thumbnail():
+    choice = select_media(document('image/jpeg', 2000000, [DocumentAttributeImageSize(w=1920, h=1080)]))
+    assert choice.thumb is None
+    assert choice.size == 2000000
+
+
+@pytest.mark.parametrize('media', [
+    document('video/mp4', 2000000),
+    document('application/pdf', 2000000),
+    document('image/jpeg', 20 * 1024 * 1024),
+    document('image/png', 2000000, [DocumentAttributeImageSize(w=10000, h=10000)]),
+    None,
+    object(),
+])
+def test_skipped_media(media):
+    assert select_media(media) is None
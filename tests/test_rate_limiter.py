@@ -0,0 +1,45 @@
+"""
+Tests for the token buckets behind the Azure OpenAI rate limiter
+"""
+import pytest
+
+pytest.importorskip('dotenv')
+
+from rate_limiter import TokenBucket
+
+
+def test_starts_full():
+    bucket = TokenBucket(60)
+    assert bucket.tokens == 60
+    assert bucket.wait_time(60, 1.0) == 0.0
+
+
+def test_refills_at_the_per_minute_rate_up_to_capacity():
+    bucket = TokenBucket(60)
+    bucket.tokens = 0
+    bucket.refill(bucket.updated + 10, 1.0)
+    assert bucket.tokens == pytest.approx(10)
+    bucket.refill(bucket.updated + 3600, 1.0)
+    assert bucket.tokens == 60
+
+
+def test_scale_slows_the_refill():
+    bucket = TokenBucket(60)
+    bucket.tokens = 0
+    bucket.refill(bucket.updated + 10, 0.5)
+    assert bucket.tokens == pytest.approx(5)
+
+
+def test_wait_time():
+    bucket = TokenBucket(120)
+    bucket.tokens = 1
+    assert bucket.wait_time(1, 1.0) == 0.0
+    assert bucket.wait_time(5, 1.0) == pytest.approx(2.0)
+    assert bucket.wait_time(5, 0.5) == pytest.approx(4.0)
+
+
+def test_wait_time_caps_the_amount_at_capacity():
+    bucket = TokenBucket(60)
+    bucket.tokens = 0
+    # A request larger than the bucket waits for a full bucket, not forever
+    assert bucket.wait_time(1000, 1.0) == pytest.approx(60.0)
@@ -0,0 +1,38 @@
+"""
+Tests for the consistent hash ring assigning channels to workers
+"""
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+from sharding import HashRing
+
+CHANNELS = [str(channel_id) for channel_id in range(1000)]
+
+
+def test_empty_ring_has_no_owner():
+    assert HashRing([]).owner('1') is None
+
+
+def test_owner_is_stable_and_ignores_node_order():
+    first = HashRing(['a', 'b', 'c'])
+    second = HashRing(['c', 'a', 'b', 'a'])
+    assert [first.owner(key) for key in CHANNELS] == [second.owner(key) for key in CHANNELS]
+
+
+def test_channels_spread_over_every_worker():
+    ring = HashRing(['a', 'b', 'c', 'd'])
+    counts = {}
+    for key in CHANNELS:
+        owner = ring.owner(key)
+        counts[owner] = counts.get(owner, 0) + 1
+    assert set(counts) == {'a', 'b', 'c', 'd'}
+    assert min(counts.values()) > len(CHANNELS) / 4 / 2
+
+
+def test_removing_a_worker_only_moves_its_channels():
+    before = HashRing(['a', 'b', 'c', 'd'])
+    after = HashRing(['a', 'b', 'c'])
+    for key in CHANNELS:
+        if before.owner(key) != 'd':
+            assert after.owner(key) == before.owner(key)
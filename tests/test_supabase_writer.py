@@ -0,0 +1,48 @@
+"""
+Tests for telling rejected signal rows from failed requests
+"""
+import pytest
+
+pytest.importorskip('sqlalchemy')
+pytest.importorskip('dotenv')
+
+from supabase_writer import SupabaseWriter
+
+
+class APIError(Exception):
+    """Stands in for postgrest.exceptions.APIError, matched by name"""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+@pytest.mark.parametrize('code', [
+    '23502',     # not_null_violation
+    '22P02',     # invalid_text_representation
+    '42703',     # undefined_column
+    'PGRST204',  # column not in the schema cache
+    'PGRST102',  # invalid request body
+])
+def test_rejections(code):
+    assert SupabaseWriter.is_rejection(APIError(code))
+
+
+@pytest.mark.parametrize('code', [
+    '08006',     # connection_failure
+    '40001',     # serialization_failure
+    '53300',     # too_many_connections
+    '57014',     # query_canceled (statement timeout)
+    'PGRST000',  # could not connect to the database
+    'PGRST003',  # timed out acquiring a connection
+    None,
+    '500',
+])
+def test_transient_errors(code):
+    assert not SupabaseWriter.is_rejection(APIError(code))
+
+
+def test_other_exceptions_are_never_rejections():
+    error = ConnectionError('reset')
+    error.code = '23502'
+    assert not SupabaseWriter.is_rejection(error)
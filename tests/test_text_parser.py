@@ -0,0 +1,85 @@
+"""
+Tests for TradingSignalParser: messages, batch parsing and vision replies
+"""
+import pytest
+from benchmark_parser import CORPUS, LegacyTradingSignalParser
+from text_parser import TradingSignalParser
+
+
+@pytest.fixture(scope='module')
+def parser():
+    return TradingSignalParser()
+
+
+@pytest.mark.parametrize('text', CORPUS + ['buy eurusd 1.0850 sl 1.0800 tp 1.0900', 'BUYER SELLER LONGEST SHORTS'])
+def test_parse_message_matches_the_legacy_parser(parser, text):
+    expected = LegacyTradingSignalParser().parse_message(text)
+    actual = parser.parse_message(text)
+    if expected and actual:
+        # Instruments come from the symbol index rather than the first uppercase word
+        expected = dict(expected, instrument=None)
+        actual = dict(actual, instrument=None)
+    assert actual == expected
+
+
+def test_parse_many_matches_parse_message(parser):
+    texts = CORPUS + [None, '', 'buy eurusd 1.0850 sl 1.0800 tp 1.0900', 'BUYER SELLER LONGEST SHORTS']
+    assert parser.parse_many(texts) == [parser.parse_message(text) for text in texts]
+
+
+def test_parse_many_finds_a_keyword_repeated_in_later_messages(parser):
+    # The scan for a keyword resumes at the next message after each hit
+    texts = ['BUY BUY BUY', 'chatter', 'SELL GBPUSD SL 1.2670 TP 1.2760', 'BUY XAUUSD SL 2305 TP 2325']
+    results = parser.parse_many(texts)
+    assert results == [parser.parse_message(text) for text in texts]
+    assert results[1] is None
+    assert results[2]['instrument'] == 'GBPUSD'
+    assert results[3]['instrument'] == 'XAUUSD'
+
+
+def test_parse_many_of_nothing(parser):
+    assert parser.parse_many([]) == []
+
+
+def test_parse_vision_reply(parser):
+    reply = (
+        "**SIGNAL_TYPE**: TRADE_SIGNAL\n"
+        "- ACTION: LONG\n"
+        "INSTRUMENT: EUR/USD\n"
+        "ENTRY: 1.0850\n"
+        "SL: 1.0800\n"
+        "TP: 1.0900, 1.0950\n"
+        "CONFIDENCE: 85\n"
+        "ACTION: SELL\n"
+    )
+    signal = parser.parse_vision_reply(reply)
+    assert signal['action'] == 'BUY'  # The first ACTION wins
+    assert signal['instrument'] == 'EURUSD'
+    assert signal['entry_price'] == 1.085
+    assert signal['stop_loss'] == 1.08
+    assert signal['take_profits'] == [1.09, 1.095]
+    assert signal['confidence'] == 0.85
+    assert signal['signal_type'] == 'image'
+
+
+def test_parse_vision_reply_keeps_an_unknown_symbol_and_drops_na(parser):
+    signal = parser.parse_vision_reply(
+        "SIGNAL_TYPE: TRADE_SIGNAL\nACTION: SELL\nINSTRUMENT: ABC/XYZ\nENTRY: N/A\nSL: [1,234.5]\nTP: N/A"
+    )
+    assert signal['instrument'] == 'ABCXYZ'
+    assert signal['entry_price'] is None
+    assert signal['stop_loss'] == 1234.5
+    assert signal['take_profits'] == []
+    assert signal['confidence'] is None
+
+
+@pytest.mark.parametrize('reply', [
+    None,
+    '',
+    'SIGNAL_TYPE: TRADE_RESULT\nACTION: BUY\nINSTRUMENT: XAUUSD',
+    'SIGNAL_TYPE: TRADE_SIGNAL\nACTION: N/A\nINSTRUMENT: XAUUSD',
+    'SIGNAL_TYPE: TRADE_SIGNAL\nACTION: HOLD',
+    'ACTION: BUY\nINSTRUMENT: XAUUSD',
+])
+def test_parse_vision_reply_rejects(parser, reply):
+    assert parser.parse_vision_reply(reply) is None
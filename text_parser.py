@@ -1,19 +1,79 @@
 import re
-from typing import Dict, Optional, List
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Dict, Optional, List, Iterable
+from symbol_index import SymbolIndex, get_symbol_index
+
+def _is_word_char(char: str) -> bool:
+    """Same definition of a word character as the regex \\b anchor"""
+    return char.isalnum() or char == '_'
 
 class TradingSignalParser:
     """Parse trading signals from text messages"""
     
-    def __init__(self):
-        # Common patterns for trading signals
+    def __init__(self, symbol_index: Optional[SymbolIndex] = None):
+        """
+        Args:
+            symbol_index: Known instruments; defaults to the process-wide index
+        """
+        self.symbol_index = symbol_index or get_symbol_index()
+        
+        # Keywords a message must contain to be a trading signal
+        self.keywords = {
+            'action': ('BUY', 'SELL', 'LONG', 'SHORT'),
+        }
+        
+        # Common patterns for trading signals. The leading word boundary of
+        # action is checked in _search_word instead, which lets re skip
+        # straight to candidate first letters.
         self.patterns = {
-            'action': r'\b(BUY|SELL|LONG|SHORT)\b',
-            'instrument': r'\b([A-Z]{3,6}(?:USD|USDT|BTC|ETH)?)\b',
-            'entry': r'(?:ENTRY|ENTER|BUY AT|SELL AT)[:\s]+([0-9]+\.?[0-9]*)',
-            'stop_loss': r'(?:SL|STOP LOSS|STOPLOSS)[:\s]+([0-9]+\.?[0-9]*)',
-            'take_profit': r'(?:TP|TAKE PROFIT|TARGET)[:\s]*([0-9]+\.?[0-9]*)',
-            'price': r'(?:PRICE|@)[:\s]+([0-9]+\.?[0-9]*)',
+            'action': r'(BUY|SELL|LONG|SHORT)\b',
+            'levels': r'(ENTRY|ENTER|BUY AT|SELL AT|SL|STOP LOSS|STOPLOSS|TP|TAKE PROFIT|TARGET|PRICE|@)([:\s]*)([0-9]+\.?[0-9]*)',
+            # Prices in vision replies, allowing thousands separators (2,315.50)
+            'number': r'[0-9]{1,3}(?:,[0-9]{3})+(?:\.[0-9]+)?|[0-9]+(?:\.[0-9]+)?',
         }
+        
+        # Which field each level keyword introduces
+        self.level_keywords = {
+            'ENTRY': 'entry',
+            'ENTER': 'entry',
+            'BUY AT': 'entry',
+            'SELL AT': 'entry',
+            'SL': 'stop_loss',
+            'STOP LOSS': 'stop_loss',
+            'STOPLOSS': 'stop_loss',
+            'TP': 'take_profit',
+            'TAKE PROFIT': 'take_profit',
+            'TARGET': 'take_profit',
+            'PRICE': 'price',
+            '@': 'price',
+        }
+        
+        # Lines of the vision model's reply format (see image_analyzer.VISION_PROMPT)
+        self.vision_fields = ('SIGNAL_TYPE', 'ACTION', 'INSTRUMENT', 'ENTRY', 'SL', 'TP', 'CONFIDENCE')
+        self.vision_actions = {'BUY': 'BUY', 'LONG': 'BUY', 'SELL': 'SELL', 'SHORT': 'SELL'}
+        
+        # Compile once instead of going through the re cache on every message
+        self._action_re = re.compile(self.patterns['action'])
+        self._levels_re = re.compile(self.patterns['levels'])
+        self._number_re = re.compile(self.patterns['number'])
+    
+    @staticmethod
+    def _search_word(regex, text: str):
+        """
+        Search for a pattern that must start at a word boundary
+        
+        Args:
+            regex: Compiled pattern without a leading \\b
+            text: Text to search
+            
+        Returns:
+            The leftmost match that starts a word, or None
+        """
+        match = regex.search(text)
+        while match and match.start() and _is_word_char(text[match.start() - 1]):
+            match = regex.search(text, match.start() + 1)
+        return match
     
     def parse_message(self, text: str) -> Optional[Dict]:
         """
@@ -29,10 +89,49 @@ class TradingSignalParser:
             return None
         
         # Convert to uppercase for easier matching
-        text_upper = text.upper()
+        return self._parse_upper(text, text.upper())
+    
+    def parse_many(self, texts: Iterable[Optional[str]]) -> List[Optional[Dict]]:
+        """
+        Parse a batch of messages, e.g. when backfilling channel history
+        
+        Most messages carry no action keyword at all, so the batch is first
+        joined into one uppercased string and scanned for BUY/SELL/LONG/SHORT
+        with str.find. Each hit marks its message as a candidate and the scan
+        for that keyword resumes at the next message. Only candidates go
+        through full extraction.
+        
+        Args:
+            texts: Message texts to parse (None or empty entries are allowed)
+            
+        Returns:
+            List aligned with texts holding a signal dictionary or None
+        """
+        texts = list(texts)
+        uppers = [text.upper() if text else '' for text in texts]
+        results = [None] * len(texts)
+        
+        # Offset of each message inside the joined batch
+        starts = list(accumulate((len(text_upper) + 1 for text_upper in uppers), initial=0))
+        batch = '\x00'.join(uppers)
+        
+        candidates = set()
+        for keyword in self.keywords['action']:
+            pos = batch.find(keyword)
+            while pos != -1:
+                index = bisect_right(starts, pos) - 1
+                candidates.add(index)
+                pos = batch.find(keyword, starts[index + 1]) if index + 1 < len(texts) else -1
         
+        for index in candidates:
+            results[index] = self._parse_upper(texts[index], uppers[index])
+        
+        return results
+    
+    def _parse_upper(self, text: str, text_upper: str) -> Optional[Dict]:
+        """Extract a signal from a message and its uppercased text"""
         # Extract action (BUY/SELL)
-        action_match = re.search(self.patterns['action'], text_upper)
+        action_match = self._search_word(self._action_re, text_upper)
         if not action_match:
             return None  # Not a trading signal
         
@@ -43,24 +142,33 @@ class TradingSignalParser:
         elif action == 'SHORT':
             action = 'SELL'
         
-        # Extract instrument/symbol
-        instrument_match = re.search(self.patterns['instrument'], text_upper)
-        instrument = instrument_match.group(1) if instrument_match else None
+        # Extract instrument/symbol from the known symbols, so words like
+        # ENTRY or SELL are never mistaken for one
+        instrument = self.symbol_index.resolve(text_upper)
         
-        # Extract entry price
-        entry_match = re.search(self.patterns['entry'], text_upper)
-        if not entry_match:
-            # Try to find price pattern
-            entry_match = re.search(self.patterns['price'], text_upper)
-        entry_price = float(entry_match.group(1)) if entry_match else None
+        # Extract entry, stop loss, take profits and price in a single pass
+        entry_price = None
+        price = None
+        stop_loss = None
+        take_profits = []
+        for keyword, separator, value in self._levels_re.findall(text_upper):
+            field = self.level_keywords[keyword]
+            if field == 'take_profit':
+                take_profits.append(float(value))
+            elif not separator:
+                continue  # Only take profits may omit the separator
+            elif field == 'entry':
+                if entry_price is None:
+                    entry_price = float(value)
+            elif field == 'stop_loss':
+                if stop_loss is None:
+                    stop_loss = float(value)
+            elif price is None:
+                price = float(value)
         
-        # Extract stop loss
-        sl_match = re.search(self.patterns['stop_loss'], text_upper)
-        stop_loss = float(sl_match.group(1)) if sl_match else None
-        
-        # Extract take profit targets
-        tp_matches = re.findall(self.patterns['take_profit'], text_upper)
-        take_profits = [float(tp) for tp in tp_matches] if tp_matches else []
+        # Fall back to the price pattern when there is no explicit entry
+        if entry_price is None:
+            entry_price = price
         
         # Build the signal dictionary
         signal = {
@@ -75,6 +183,77 @@ class TradingSignalParser:
         
         return signal
     
+    def parse_vision_reply(self, reply: str) -> Optional[Dict]:
+        """
+        Parse the vision model's SIGNAL_TYPE/ACTION/INSTRUMENT/ENTRY/SL/TP reply
+        
+        Each line is read once as KEY: value; the first occurrence of each
+        key wins and N/A values are treated as missing. Replies that are not
+        a TRADE_SIGNAL, or carry no action, are rejected without looking at
+        the other fields, so prompt echoes and trade results never become
+        signals.
+        
+        Args:
+            reply: The model's reply for one image
+            
+        Returns:
+            Dictionary with trading signal data (signal_type "image", plus
+            the model's confidence from 0 to 1 or None) or None
+        """
+        if not reply:
+            return None
+        
+        fields = {}
+        for line in reply.splitlines():
+            key, separator, value = line.partition(':')
+            if not separator:
+                continue
+            # Models sometimes bold or bullet the keys (**ACTION**: BUY)
+            key = key.strip(' \t*-').upper()
+            if key in self.vision_fields and key not in fields:
+                value = value.strip(' \t*[]').upper()
+                if value and value != 'N/A':
+                    fields[key] = value
+        
+        if fields.get('SIGNAL_TYPE') != 'TRADE_SIGNAL':
+            return None  # Trade result, or not in the expected format
+        
+        action = self.vision_actions.get(fields.get('ACTION'))
+        if action is None:
+            return None
+        
+        # Prefer the canonical symbol; otherwise keep what the model read
+        # from the image if it looks like a symbol
+        instrument = None
+        if 'INSTRUMENT' in fields:
+            instrument = self.symbol_index.resolve(fields['INSTRUMENT'])
+            if instrument is None:
+                symbol = fields['INSTRUMENT'].replace('/', '')
+                instrument = symbol if symbol.isalnum() else None
+        
+        entry_prices = self._vision_numbers(fields.get('ENTRY'))
+        stop_losses = self._vision_numbers(fields.get('SL'))
+        confidence = self._vision_numbers(fields.get('CONFIDENCE'))
+        
+        signal = {
+            'action': action,
+            'instrument': instrument,
+            'entry_price': entry_prices[0] if entry_prices else None,
+            'stop_loss': stop_losses[0] if stop_losses else None,
+            'take_profits': self._vision_numbers(fields.get('TP')),
+            'raw_text': reply,
+            'signal_type': 'image',
+            'confidence': round(min(confidence[0], 100) / 100, 2) if confidence else None
+        }
+        
+        return signal
+    
+    def _vision_numbers(self, value: Optional[str]) -> List[float]:
+        """Extract the prices in a vision reply value"""
+        if not value:
+            return []
+        return [float(number.replace(',', '')) for number in self._number_re.findall(value)]
+    
     def parse_multiple_targets(self, text: str) -> List[Dict]:
         """
         Parse messages that might contain multiple TP levels